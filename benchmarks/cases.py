@@ -0,0 +1,558 @@
+import itertools
+import os
+import random
+import tempfile
+import typing
+
+import numpy as np
+
+from models.models import *
+from models.order_book import OrderBook
+from simulation import messages
+from simulation.replay import ReplayBinanceClient, ReplayBitmexClient, default_contract, seed_candle
+from strategies.batch_evaluator import technical_indicators
+from strategies.strategies import TechnicalStrategy, BreakoutStrategy
+
+# Every case is a function returning the operation to time, a callable without argument doing one unit of work.
+# It receives the number of times the operation will be called, for the inputs that can't be cycled (timestamps).
+# The inputs are generated once, before the timing, from a fixed seed so that two runs measure the same work.
+
+SEED = 42
+START_MS = 1_700_000_000_000
+TECHNICAL_PARAMS = {"ema_fast": 12, "ema_slow": 26, "ema_signal": 9, "rsi_length": 14}
+
+
+def _random_walk(rng: random.Random, length: int, start: float = 30000) -> typing.List[float]:
+    prices = []
+    price = start
+    for _ in range(length):
+        price *= 1 + rng.gauss(0, 0.001)
+        prices.append(round(price, 2))
+    return prices
+
+
+def _binance_client(symbols: typing.List[str]) -> ReplayBinanceClient:
+    contracts = {s: default_contract(s, "binance_futures") for s in symbols}
+    return ReplayBinanceClient(contracts, futures=True)
+
+
+def _bitmex_client(symbols: typing.List[str]) -> ReplayBitmexClient:
+    contracts = {s: default_contract(s, "bitmex") for s in symbols}
+    return ReplayBitmexClient(contracts)
+
+
+def _candles(rng: random.Random, length: int, timeframe: str = "1m") -> typing.List[Candle]:
+    tf_ms = 60_000 if timeframe == "1m" else 300_000
+    candles = []
+    for i, price in enumerate(_random_walk(rng, length)):
+        candle = seed_candle(price, START_MS + i * tf_ms, timeframe)
+        candle.high = round(price * 1.001, 2)
+        candle.low = round(price * 0.999, 2)
+        candle.volume = rng.uniform(1, 50)
+        candles.append(candle)
+    return candles
+
+
+def _open_trade(strategy, side: str, entry_price: float, quantity: float) -> Trade:
+    trade = Trade({"time": START_MS, "entry_price": entry_price, "contract": strategy.contract,
+                   "strategy": strategy.strategy_name, "side": side, "status": "open", "pnl": 0,
+                   "quantity": quantity, "entry_id": 1})
+    strategy._add_trade(trade)
+    strategy.ongoing_position = True
+    return trade
+
+
+def parse_trades_same_candle(calls: int) -> typing.Callable:
+
+    """
+    Trades inside the current candle, with an open position whose take profit and stop loss are checked.
+    """
+
+    rng = random.Random(SEED)
+    client = _binance_client(["BTCUSDT"])
+    strategy = TechnicalStrategy(client, client.contracts["BTCUSDT"], "Binance", "1m", 10, 50, 50, TECHNICAL_PARAMS)
+    strategy.candles = _candles(rng, 200)
+
+    last = strategy.candles[-1]
+    _open_trade(strategy, "long", last.close, 0.01)
+    client.clock.now_ms = last.timestamp
+
+    trades = itertools.cycle([(p, rng.uniform(0.001, 2), last.timestamp + i % 60_000)
+                              for i, p in enumerate(_random_walk(rng, 10_000, last.close))])
+
+    def op():
+        price, size, timestamp = next(trades)
+        strategy.parse_trades(price, size, timestamp)
+
+    return op
+
+
+def parse_trades_open_trades(calls: int) -> typing.Callable:
+
+    """
+    Trades inside the current candle with 500 open positions, none of them reaching its take profit or stop loss.
+    """
+
+    rng = random.Random(SEED)
+    client = _binance_client(["BTCUSDT"])
+    strategy = TechnicalStrategy(client, client.contracts["BTCUSDT"], "Binance", "1m", 10, 50, 50, TECHNICAL_PARAMS)
+    strategy.candles = _candles(rng, 200)
+
+    last = strategy.candles[-1]
+    for i in range(500):
+        _open_trade(strategy, "long" if i % 2 == 0 else "short", round(last.close * rng.uniform(0.9, 1.1), 2), 0.01)
+    client.clock.now_ms = last.timestamp
+
+    trades = itertools.cycle([(p, rng.uniform(0.001, 2), last.timestamp + i % 60_000)
+                              for i, p in enumerate(_random_walk(rng, 10_000, last.close))])
+
+    def op():
+        price, size, timestamp = next(trades)
+        strategy.parse_trades(price, size, timestamp)
+
+    return op
+
+
+def parse_trades_new_candle(calls: int) -> typing.Callable:
+
+    """
+    One trade per candle, so that every call creates a new candle.
+    """
+
+    rng = random.Random(SEED)
+    client = _binance_client(["BTCUSDT"])
+    strategy = TechnicalStrategy(client, client.contracts["BTCUSDT"], "Binance", "1m", 10, 1, 1, TECHNICAL_PARAMS)
+    strategy.candles = _candles(rng, 200)
+
+    prices = itertools.cycle(_random_walk(rng, 10_000))
+    timestamp = [strategy.candles[-1].timestamp]
+
+    def op():
+        timestamp[0] += 60_000
+        client.clock.now_ms = timestamp[0]
+        strategy.parse_trades(next(prices), 1, timestamp[0])
+        if len(strategy.candles) > 1000:  # Keeps the cost of the list operations constant between the runs
+            del strategy.candles[:500]
+
+    return op
+
+
+def technical_check_signal(calls: int) -> typing.Callable:
+
+    """
+    MACD and RSI computed over 500 candles, a new candle at each call.
+    """
+
+    return _technical_strategies(1)
+
+
+def technical_check_signal_shared(calls: int) -> typing.Callable:
+
+    """
+    10 strategies on the same symbol and timeframe, 5 of them with the same parameters and the others with the
+    same EMA fast span: the indicators they share are computed once per candle close.
+    """
+
+    return _technical_strategies(10)
+
+
+def _technical_strategies(strategies_nb: int) -> typing.Callable:
+    rng = random.Random(SEED)
+    client = _binance_client(["BTCUSDT"])
+    history = _candles(rng, 500 + 1000)
+
+    strategies = []
+    for i in range(strategies_nb):
+        params = dict(TECHNICAL_PARAMS) if i % 2 == 0 else dict(TECHNICAL_PARAMS, ema_slow=50, rsi_length=21)
+        strategy = TechnicalStrategy(client, client.contracts["BTCUSDT"], "Binance", "1m", 10, 1, 1, params)
+        strategy.candles = history[:500]
+        strategies.append(strategy)
+
+    new_candles = itertools.cycle(history[500:])
+
+    def op():
+        candle = next(new_candles)
+        for strategy in strategies:
+            strategy.candles.append(candle)
+            del strategy.candles[0]  # Constant length, as over a long run
+            strategy._check_signal()
+
+    return op
+
+
+def technical_symbols_batch(calls: int) -> typing.Callable:
+
+    """
+    Candle close of 200 strategies on 200 symbols, their MACD and RSI computed together by the BatchEvaluator.
+    """
+
+    strategies, new_candles = _technical_symbols(200)
+    params = np.array([(s._ema_fast, s._ema_slow, s._ema_signal, s._rsi_length) for s in strategies],
+                      dtype=np.float64)
+
+    def op():
+        _next_candles(strategies, new_candles)
+        macd_line, macd_signal, rsi = technical_indicators([s._closed_closes() for s in strategies], params[:, 0],
+                                                           params[:, 1], params[:, 2], params[:, 3])
+        for i, strategy in enumerate(strategies):
+            strategy._signal(macd_line[i], macd_signal[i], rsi[i])
+
+    return op
+
+
+def technical_symbols_each(calls: int) -> typing.Callable:
+
+    """
+    Same candle close as technical.symbols_200.batch, each strategy computing its own indicators.
+    """
+
+    strategies, new_candles = _technical_symbols(200)
+
+    def op():
+        _next_candles(strategies, new_candles)
+        for strategy in strategies:
+            strategy._check_signal()
+
+    return op
+
+
+def _technical_symbols(symbols_nb: int) -> typing.Tuple[typing.List[TechnicalStrategy],
+                                                       typing.List[typing.Iterator]]:
+    rng = random.Random(SEED)
+    symbols = [f"SYM{i}USDT" for i in range(symbols_nb)]
+    client = _binance_client(symbols)
+
+    strategies = []
+    new_candles = []
+    for symbol in symbols:
+        strategy = TechnicalStrategy(client, client.contracts[symbol], "Binance", "1m", 10, 1, 1, TECHNICAL_PARAMS)
+        history = _candles(rng, 500 + 200)
+        strategy.candles = history[:500]
+        strategies.append(strategy)
+        new_candles.append(itertools.cycle(history[500:]))
+
+    return strategies, new_candles
+
+
+def _next_candles(strategies: typing.List[TechnicalStrategy], new_candles: typing.List[typing.Iterator]):
+    for strategy, candles in zip(strategies, new_candles):
+        strategy.candles.append(next(candles))
+        del strategy.candles[0]
+
+
+def binance_book_ticker(calls: int) -> typing.Callable:
+
+    """
+    bookTicker messages on 10 symbols, one of them with an open trade whose PnL is updated.
+    """
+
+    rng = random.Random(SEED)
+    symbols = [f"COIN{i}USDT" for i in range(9)] + ["BTCUSDT"]
+    client = _binance_client(symbols)
+
+    strategy = TechnicalStrategy(client, client.contracts["BTCUSDT"], "Binance", "1m", 10, 1, 1, TECHNICAL_PARAMS)
+    client.strategies[1] = strategy
+    _open_trade(strategy, "long", 30000, 0.01)
+
+    frames = []
+    for i, price in enumerate(_random_walk(rng, 10_000)):
+        frames.append(messages.binance_book_ticker(symbols[i % len(symbols)], price - 0.5, price + 0.5, i))
+    frames = itertools.cycle(frames)
+
+    def op():
+        client._on_message(None, next(frames))
+
+    return op
+
+
+def binance_agg_trade(calls: int) -> typing.Callable:
+
+    """
+    aggTrade messages for a symbol traded by a Technical and a Breakout strategy, a new 1m candle every 600 trades.
+    """
+
+    rng = random.Random(SEED)
+    client = _binance_client(["BTCUSDT"])
+    contract = client.contracts["BTCUSDT"]
+
+    client.strategies[1] = TechnicalStrategy(client, contract, "Binance", "1m", 10, 1, 1, TECHNICAL_PARAMS)
+    client.strategies[2] = BreakoutStrategy(client, contract, "Binance", "5m", 10, 1, 1, {"min_volume": 1e9})
+    client.strategies[1].candles = _candles(rng, 200, "1m")
+    client.strategies[2].candles = _candles(rng, 200, "5m")
+
+    start = max(s.candles[-1].timestamp for s in client.strategies.values())
+    frames = []
+    for i, price in enumerate(_random_walk(rng, calls)):
+        frames.append((start + i * 100, messages.binance_agg_trade("BTCUSDT", price, rng.uniform(0.001, 2),
+                                                                    start + i * 100, i)))
+    frames = iter(frames)
+
+    def op():
+        timestamp, frame = next(frames)
+        client.clock.now_ms = timestamp
+        client._on_message(None, frame)
+
+    return op
+
+
+def binance_depth_update(calls: int) -> typing.Callable:
+
+    """
+    depthUpdate messages of 10 levels each on a book of 1000 levels per side, a third of them removing a level.
+    The update ids have to follow each other, so one message is generated per call.
+    """
+
+    rng = random.Random(SEED)
+    client = _binance_client(["BTCUSDT"])
+
+    book = OrderBook("BTCUSDT", True)
+    book.set_snapshot({"lastUpdateId": 1, "bids": [[f"{30000 - i * 0.1:.2f}", "1"] for i in range(1000)],
+                       "asks": [[f"{30000.1 + i * 0.1:.2f}", "1"] for i in range(1000)]})
+    client.order_books["BTCUSDT"] = book
+
+    frames = []
+    for i in range(2, calls + 2):
+        bids = [(30000 - rng.randrange(300) * 0.1, rng.choice([0, 0.5, 2])) for _ in range(5)]
+        asks = [(30000.1 + rng.randrange(300) * 0.1, rng.choice([0, 0.5, 2])) for _ in range(5)]
+        frames.append(messages.binance_depth_update("BTCUSDT", i, i, i - 1, bids, asks))
+    frames = iter(frames)
+
+    def op():
+        client._on_message(None, next(frames))
+
+    return op
+
+
+def bitmex_instrument(calls: int) -> typing.Callable:
+
+    """
+    instrument messages updating the bid and ask of 3 symbols, with an open trade on XBTUSD.
+    """
+
+    rng = random.Random(SEED)
+    symbols = ["XBTUSD", "ETHUSD", "XRPUSD"]
+    client = _bitmex_client(symbols)
+
+    strategy = BreakoutStrategy(client, client.contracts["XBTUSD"], "Bitmex", "1m", 10, 1, 1, {"min_volume": 1e9})
+    client.strategies[1] = strategy
+    _open_trade(strategy, "short", 30000, 100)
+
+    frames = []
+    for i, price in enumerate(_random_walk(rng, 10_000)):
+        price = round(price * 2) / 2
+        frames.append(messages.bitmex_instrument([(s, price - 0.5, price + 0.5) for s in symbols], START_MS + i))
+    frames = itertools.cycle(frames)
+
+    def op():
+        client._on_message(None, next(frames))
+
+    return op
+
+
+def bitmex_trade(calls: int) -> typing.Callable:
+
+    """
+    trade messages of 5 trades each for a symbol traded by a Breakout strategy.
+    """
+
+    rng = random.Random(SEED)
+    client = _bitmex_client(["XBTUSD"])
+
+    strategy = BreakoutStrategy(client, client.contracts["XBTUSD"], "Bitmex", "1m", 10, 1, 1, {"min_volume": 1e9})
+    client.strategies[1] = strategy
+    strategy.candles = _candles(rng, 200)
+
+    start = strategy.candles[-1].timestamp
+    prices = _random_walk(rng, calls * 5)
+    frames = []
+    for i in range(0, len(prices), 5):
+        frames.append((start + i * 100, messages.bitmex_trade([("XBTUSD", round(p * 2) / 2, rng.randint(1, 1000))
+                                                               for p in prices[i:i + 5]], start + i * 100)))
+    frames = iter(frames)
+
+    def op():
+        timestamp, frame = next(frames)
+        client.clock.now_ms = timestamp
+        client._on_message(None, frame)
+
+    return op
+
+
+def contract_binance_futures(calls: int) -> typing.Callable:
+    infos = itertools.cycle([messages.binance_futures_symbol(f"COIN{i}USDT", f"COIN{i}", "USDT") for i in range(100)])
+    return lambda: Contract.from_binance_futures(next(infos))
+
+
+def contract_binance_spot(calls: int) -> typing.Callable:
+    infos = itertools.cycle([messages.binance_spot_symbol(f"COIN{i}USDT", f"COIN{i}", "USDT") for i in range(100)])
+    return lambda: Contract.from_binance_spot(next(infos))
+
+
+def contract_bitmex(calls: int) -> typing.Callable:
+    infos = itertools.cycle([messages.bitmex_instrument_info(f"COIN{i}USD", f"COIN{i}") for i in range(100)])
+    return lambda: Contract.from_bitmex(next(infos))
+
+
+def candle_binance(calls: int) -> typing.Callable:
+    rng = random.Random(SEED)
+    klines = itertools.cycle([messages.binance_kline(START_MS + i * 60_000, 60_000, p, p * 1.001, p * 0.999, p,
+                                                     rng.uniform(1, 50))
+                              for i, p in enumerate(_random_walk(rng, 1000))])
+    return lambda: Candle.from_binance_kline(next(klines))
+
+
+def candle_bitmex(calls: int) -> typing.Callable:
+    rng = random.Random(SEED)
+    buckets = itertools.cycle([messages.bitmex_bucket("XBTUSD", START_MS + (i + 1) * 60_000, p, p + 1, p - 1, p,
+                                                      rng.randint(1000, 100000))
+                               for i, p in enumerate(_random_walk(rng, 1000))])
+    return lambda: Candle.from_bitmex_bucket(next(buckets), "1m")
+
+
+def candles_binance_klines(calls: int) -> typing.Callable:
+
+    """
+    A klines response of 1000 candles converted at once, as by get_historical_candles().
+    """
+
+    rng = random.Random(SEED)
+    klines = [messages.binance_kline(START_MS + i * 60_000, 60_000, p, p * 1.001, p * 0.999, p, rng.uniform(1, 50))
+              for i, p in enumerate(_random_walk(rng, 1000))]
+    return lambda: Candle.from_binance_klines(klines)
+
+
+def order_data_binance(calls: int) -> typing.Callable:
+
+    """
+    Quantity and price of a limit order rounded and formatted, as by _order_data() before every order.
+    """
+
+    client = _binance_client(["BTCUSDT"])
+    contract = client.contracts["BTCUSDT"]
+    rng = random.Random(SEED)
+    orders = itertools.cycle([(rng.uniform(0.001, 5), p) for p in _random_walk(rng, 1000)])
+
+    def op():
+        quantity, price = next(orders)
+        client._order_data(contract, "LIMIT", quantity, "BUY", price, "GTC")
+
+    return op
+
+
+def root_update_ui(calls: int) -> typing.Callable:
+
+    """
+    One refresh of the interface with 10 strategies, each with a new log and a trade whose PnL changed.
+    Needs a display, tkinter.TclError is raised otherwise.
+    """
+
+    from db.database import WorkspaceData
+    from interface.root_component import Root
+
+    rng = random.Random(SEED)
+    binance = _binance_client(["BTCUSDT", "ETHUSDT"])
+    bitmex = _bitmex_client(["XBTUSD"])
+
+    trades = []
+    for b_index in range(10):
+        client = binance if b_index % 2 == 0 else bitmex
+        contract = list(client.contracts.values())[0]
+        strategy = BreakoutStrategy(client, contract, client.platform, "1m", 10, 1, 1, {"min_volume": 1e9})
+        client.strategies[b_index] = strategy
+        trades.append(_open_trade(strategy, "long", 30000, 1))
+        trades[-1].time = START_MS + b_index
+
+    db_file = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    db_file.close()
+
+    root = Root(binance, bitmex, autosave_ms=None, db=WorkspaceData(db_file.name))
+    root.withdraw()
+    root.after = lambda *args: None  # The timing loop calls _update_ui(), not the Tk event loop
+
+    for trade in trades:
+        root._trade_frame.add_trade(trade)
+
+    strategies = [s for c in (binance, bitmex) for s in c.strategies.values()]
+    pnls = itertools.cycle(rng.uniform(-100, 100) for _ in range(1000))
+
+    def op():
+        for strategy, trade in zip(strategies, trades):
+            strategy.logs.append({"log": "Benchmark log", "displayed": False})
+            trade.pnl = next(pnls)
+            strategy.client.dirty_trades.add(trade)
+        root._update_ui()
+        root.update_idletasks()
+
+    def close():
+        root.db.close()
+        root.destroy()
+        os.remove(db_file.name)
+
+    op.close = close
+    return op
+
+
+# Name: (case, default number of timed operations)
+
+CASES: typing.Dict[str, typing.Tuple[typing.Callable[[], typing.Callable], int]] = {
+    "parse_trades.same_candle": (parse_trades_same_candle, 20000),
+    "parse_trades.same_candle.open_500": (parse_trades_open_trades, 5000),
+    "parse_trades.new_candle": (parse_trades_new_candle, 5000),
+    "technical.check_signal": (technical_check_signal, 200),
+    "technical.check_signal.shared_10": (technical_check_signal_shared, 100),
+    "technical.symbols_200.batch": (technical_symbols_batch, 20),
+    "technical.symbols_200.each": (technical_symbols_each, 20),
+    "binance.on_message.bookTicker": (binance_book_ticker, 20000),
+    "binance.on_message.aggTrade": (binance_agg_trade, 20000),
+    "binance.on_message.depthUpdate": (binance_depth_update, 20000),
+    "bitmex.on_message.instrument": (bitmex_instrument, 10000),
+    "bitmex.on_message.trade": (bitmex_trade, 5000),
+    "models.contract.binance_futures": (contract_binance_futures, 20000),
+    "models.contract.binance_spot": (contract_binance_spot, 20000),
+    "models.contract.bitmex": (contract_bitmex, 20000),
+    "models.candle.binance": (candle_binance, 20000),
+    "models.candle.bitmex": (candle_bitmex, 20000),
+    "models.candles.binance_klines": (candles_binance_klines, 200),
+    "binance.order_data": (order_data_binance, 20000),
+    "root.update_ui": (root_update_ui, 200),
+}
+
+
+def recorded_frames(directory: str, exchange: str, limit: int) -> typing.Callable:
+
+    """
+    _on_message() of a replay client fed with the frames of a MarketDataRecorder directory, cycled if there are
+    fewer frames than timed operations. No strategy is added, the case measures the parsing and the price updates.
+    :param directory:
+    :param exchange: binance_futures, binance_spot, bitmex
+    :param limit: Maximum number of frames loaded in memory
+    """
+
+    import json
+    from connectors.recorder import read_frames
+
+    frames = [frame for _, frame in itertools.islice(read_frames(directory), limit)]
+    if len(frames) == 0:
+        raise ValueError(f"No frame recorded in {directory}")
+
+    symbols = set()
+    for frame in frames:
+        data = json.loads(frame)
+        if "s" in data:
+            symbols.add(data["s"])
+        for d in data.get("data", []) if isinstance(data.get("data"), list) else []:
+            if "symbol" in d:
+                symbols.add(d["symbol"])
+
+    if exchange == "bitmex":
+        client = _bitmex_client(sorted(symbols))
+    else:
+        client = ReplayBinanceClient({s: default_contract(s, exchange) for s in sorted(symbols)},
+                                     futures=exchange == "binance_futures")
+
+    frames = itertools.cycle(frames)
+
+    def op():
+        client._on_message(None, next(frames))
+
+    return op
@@ -0,0 +1,197 @@
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tkinter as tk
+import tracemalloc
+import typing
+
+from benchmarks.cases import CASES, recorded_frames
+
+logger = logging.getLogger()
+
+DEFAULT_BASELINES = "../benchmark_baselines.json"
+
+
+def traced_calls(ops_nb: int) -> int:
+    return max(min(ops_nb // 10, 1000), 1)
+
+
+def measure(op: typing.Callable, ops_nb: int, warmup_nb: int, repeat: int = 3) -> typing.Dict[str, float]:
+
+    """
+    Time ops_nb calls of op, then trace the memory of a smaller number of calls (tracemalloc slows down the calls
+    a lot, so the two are not measured together).
+    :param op: One unit of work
+    :param ops_nb: Number of timed calls
+    :param warmup_nb: Untimed calls before the timing
+    :param repeat: The timing is done this many times and the fastest run is kept, the slower ones being disturbed
+    by the rest of the machine
+    :return: ops_per_second, p50_us, p99_us, alloc_bytes (average peak of memory allocated during one call)
+    """
+
+    for _ in range(warmup_nb):
+        op()
+
+    best_total = None
+    latencies = []
+
+    for _ in range(repeat):
+        run_latencies = []
+        gc.collect()
+        gc.disable()  # A collection triggered by a previous case shouldn't be charged to a random call
+
+        try:
+            start = time.perf_counter_ns()
+            for _ in range(ops_nb):
+                t = time.perf_counter_ns()
+                op()
+                run_latencies.append(time.perf_counter_ns() - t)
+            total = time.perf_counter_ns() - start
+        finally:
+            gc.enable()
+
+        if best_total is None or total < best_total:
+            best_total = total
+            latencies = run_latencies
+
+    total = best_total
+    latencies.sort()
+
+    traced_nb = traced_calls(ops_nb)
+    allocated = 0
+
+    tracemalloc.start()
+    try:
+        for _ in range(traced_nb):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            op()
+            allocated += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops_per_second": ops_nb / (total / 1e9),
+        "p50_us": latencies[len(latencies) // 2] / 1000,
+        "p99_us": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] / 1000,
+        "alloc_bytes": allocated / traced_nb
+    }
+
+
+def compare(results: typing.Dict[str, typing.Dict], baselines: typing.Dict[str, typing.Dict],
+            threshold: float) -> typing.List[str]:
+
+    """
+    :param results:
+    :param baselines:
+    :param threshold: Allowed relative degradation, 0.2 to fail when ops/s drop or p99 rises by more than 20%
+    :return: Description of each regression, empty if none
+    """
+
+    regressions = []
+
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+
+        if result["ops_per_second"] < baseline["ops_per_second"] * (1 - threshold):
+            regressions.append(f"{name}: {result['ops_per_second']:.0f} ops/s, baseline "
+                               f"{baseline['ops_per_second']:.0f} ops/s")
+        if result["p99_us"] > baseline["p99_us"] * (1 + threshold):
+            regressions.append(f"{name}: p99 {result['p99_us']:.1f} us, baseline {baseline['p99_us']:.1f} us")
+
+    return regressions
+
+
+def _print_table(results: typing.Dict[str, typing.Dict], baselines: typing.Dict[str, typing.Dict]):
+    print(f"{'case':<34}{'ops/s':>12}{'p50 us':>11}{'p99 us':>11}{'alloc B':>11}{'vs base':>9}")
+
+    for name, r in results.items():
+        if name in baselines:
+            change = f"{r['ops_per_second'] / baselines[name]['ops_per_second'] - 1:+.0%}"
+        else:
+            change = "-"
+        print(f"{name:<34}{r['ops_per_second']:>12.0f}{r['p50_us']:>11.1f}{r['p99_us']:>11.1f}"
+              f"{r['alloc_bytes']:>11.0f}{change:>9}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the bot",
+                                     epilog="Example: python -m benchmarks.run --threshold 0.2")
+    parser.add_argument("-k", "--filter", default="", help="Only run the cases whose name contains this text")
+    parser.add_argument("--scale", type=float, default=1, help="Multiplier of the number of timed operations")
+    parser.add_argument("--baselines", default=DEFAULT_BASELINES, help="JSON file of the baseline results")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case, the fastest is kept")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write the results as the new baselines, unless --threshold finds a regression")
+    parser.add_argument("--threshold", type=float, help="Exit with 1 if a case regresses by more than this ratio")
+    parser.add_argument("--recording", help="Also benchmark _on_message() with a MarketDataRecorder directory")
+    parser.add_argument("--exchange", default="binance_futures", choices=["binance_futures", "binance_spot", "bitmex"],
+                        help="Exchange of the --recording frames")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)  # The strategies log every new candle
+
+    cases = {name: case for name, case in CASES.items() if args.filter in name}
+    if args.recording is not None:
+        cases["recording.on_message"] = (lambda calls: recorded_frames(args.recording, args.exchange, 100_000), 20000)
+
+    results = dict()
+
+    for name, (case, ops_nb) in cases.items():
+        ops_nb = max(int(ops_nb * args.scale), 10)
+        warmup_nb = max(ops_nb // 10, 1)
+        calls = warmup_nb + ops_nb * args.repeat + traced_calls(ops_nb)
+
+        # The strategies print their activation when the cases create them
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            try:
+                op = case(calls)
+            except tk.TclError as e:  # No display for the interface cases
+                print(f"{name}: skipped ({e})", file=sys.stderr)
+                continue
+
+            try:
+                results[name] = measure(op, ops_nb, warmup_nb, args.repeat)
+            finally:
+                if hasattr(op, "close"):
+                    op.close()
+
+    baselines = dict()
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    _print_table(results, baselines)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.threshold is not None:  # Against the baselines as loaded, before --save-baseline replaces them
+        regressions = compare(results, baselines, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+
+    if args.save_baseline:
+        if len(regressions) > 0:  # A regression mustn't become the baseline it is measured against
+            print("Baselines not saved, the results regressed", file=sys.stderr)
+        else:
+            baselines.update(results)
+            with open(args.baselines, "w") as f:
+                json.dump(baselines, f, indent=2)
+            print(f"Baselines saved to {args.baselines}")
+
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
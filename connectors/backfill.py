@@ -0,0 +1,87 @@
+import logging
+import threading
+import typing
+
+from models.models import *
+
+if typing.TYPE_CHECKING:
+    from strategies.strategies import Strategy
+
+logger = logging.getLogger()
+
+
+class CandleBackfill:
+    def __init__(self, client, asynchronous: bool = True):
+
+        """
+        Fetches the candles missed by the strategies, after a websocket reconnection or when parse_trades() sees
+        a jump of several candles, with one REST request per (symbol, timeframe): the strategies that need the same
+        candles while a request is in flight wait for its result instead of sending their own.
+        The candles are handed to each strategy through its backfilled_candles attribute, and spliced by the
+        strategy itself in the websocket thread, so its candle list is never modified by two threads.
+        :param client: BinanceClient or BitmexClient
+        :param asynchronous: If False, the request is made in the calling thread, to keep the replays deterministic
+        """
+
+        self._client = client
+        self._asynchronous = asynchronous
+        self._lock = threading.Lock()
+        self._waiting: typing.Dict[typing.Tuple[str, str], typing.List["Strategy"]] = dict()
+
+    def request(self, strategy: "Strategy", start_time: int):
+
+        """
+        :param strategy:
+        :param start_time: Open time in ms of the first candle needed
+        :return:
+        """
+
+        key = (strategy.contract.symbol, strategy.timeframe)
+
+        with self._lock:
+            strategy.backfill_pending = True
+
+            waiting = self._waiting.get(key)
+            if waiting is not None:
+                if strategy not in waiting:
+                    waiting.append(strategy)
+                return
+
+            self._waiting[key] = [strategy]
+
+        if self._asynchronous:
+            t = threading.Thread(target=self._fetch, args=(key, strategy.contract, start_time))
+            t.start()
+        else:
+            self._fetch(key, strategy.contract, start_time)
+
+    def request_all(self, strategies: typing.List["Strategy"]):
+
+        """
+        After a reconnection: the candles from the last one of each strategy, which missed the trades received while
+        disconnected, to the current one.
+        :param strategies:
+        :return:
+        """
+
+        for strategy in strategies:
+            if len(strategy.candles) > 0:
+                self.request(strategy, strategy.candles[-1].timestamp)
+
+    def _fetch(self, key: typing.Tuple[str, str], contract: Contract, start_time: int):
+        symbol, timeframe = key
+
+        try:
+            candles = self._client.get_historical_candles(contract, timeframe, start_time)
+        except Exception as e:
+            logger.error("Error while backfilling the %s %s candles: %s", symbol, timeframe, e)
+            candles = []
+
+        with self._lock:
+            strategies = self._waiting.pop(key, [])
+
+        for strategy in strategies:
+            strategy.backfilled_candles = candles
+
+        logger.info("%s %s %s: %s candles backfilled for %s strategies", self._client.platform, symbol, timeframe,
+                    len(candles), len(strategies))
@@ -15,14 +15,30 @@ import json
 import threading
 
 from models.models import *
-
-from strategies.strategies import TechnicalStrategy, BreakoutStrategy
+from models.order_book import OrderBook
+from models.price_table import PriceTable
+from db.journal import TradeJournal
+from connectors.recorder import MarketDataRecorder
+from connectors.backfill import CandleBackfill
+from connectors.binance_ws_api import BinanceWsApi, WsApiUnavailable
+from connectors.order_batcher import OrderBatcher, OrderRequest
+from utils.clock import Clock
+from utils.metrics import Metrics
+from utils.profiler import CpuAccounting
+
+from strategies.batch_evaluator import BatchEvaluator
+from strategies.indicators import IndicatorRegistry
+from strategies.strategies import TechnicalStrategy, BreakoutStrategy, TF_EQUIV
 
 logger = logging.getLogger()
 
 
 class BinanceClient:
-    def __init__(self, public_key: str, secret_key: str, testnet: bool, futures: bool):
+    def __init__(self, public_key: str, secret_key: str, testnet: bool, futures: bool,
+                 journal: typing.Optional[TradeJournal] = None, recorder: typing.Optional[MarketDataRecorder] = None,
+                 metrics: typing.Optional[Metrics] = None, base_url: typing.Optional[str] = None,
+                 wss_url: typing.Optional[str] = None, ws_orders: bool = False,
+                 ws_api_url: typing.Optional[str] = None):
 
         """
         https://binance-docs.github.io/apidocs/futures/en
@@ -31,6 +47,13 @@ class BinanceClient:
         :param secret_key:
         :param testnet:
         :param futures: if False, the Client will be a Spot API Client
+        :param journal: Where the strategies record their trades and orders, if any
+        :param recorder: Where the raw websocket messages are recorded, if any
+        :param metrics: Where the latencies of the trade to order path and the message counts are recorded, if any
+        :param base_url: Replaces the REST URL of the exchange, e.g. to use a mock exchange
+        :param wss_url: Replaces the websocket URL of the exchange
+        :param ws_orders: Place, cancel and query the orders through the websocket trading API, with REST as fallback
+        :param ws_api_url: Replaces the URL of the websocket trading API
         """
 
         self.futures = futures
@@ -40,36 +63,79 @@ class BinanceClient:
             if testnet:
                 self._base_url = "https://testnet.binancefuture.com"
                 self._wss_url = "wss://stream.binancefuture.com/ws"
+                self._ws_api_url = "wss://testnet.binancefuture.com/ws-fapi/v1"
             else:
                 self._base_url = "https://fapi.binance.com"
                 self._wss_url = "wss://fstream.binance.com/ws"
+                self._ws_api_url = "wss://ws-fapi.binance.com/ws-fapi/v1"
         else:
             self.platform = "binance_spot"
             if testnet:
                 self._base_url = "https://testnet.binance.vision"
                 self._wss_url = "wss://testnet.binance.vision/ws"
+                self._ws_api_url = "wss://ws-api.testnet.binance.vision/ws-api/v3"
             else:
                 self._base_url = "https://api.binance.com"
                 self._wss_url = "wss://stream.binance.com:9443/ws"
+                self._ws_api_url = "wss://ws-api.binance.com:443/ws-api/v3"
+
+        if base_url is not None:  # Mock exchange of simulation/mock_exchange.py
+            self._base_url = base_url
+        if wss_url is not None:
+            self._wss_url = wss_url
+        if ws_api_url is not None:
+            self._ws_api_url = ws_api_url
 
         self._public_key = public_key
         self._secret_key = secret_key
 
         self._headers = {'X-MBX-APIKEY': self._public_key}
 
+        self.journal = journal
+        self.recorder = recorder
+        self.metrics = metrics
+        self.clock = Clock()  # Replaced by a simulated clock when replaying recorded data
+
         self.contracts = self.get_contracts()
         self.balances = self.get_balances()
 
-        self.prices = dict()
+        self.prices = PriceTable(len(self.contracts))  # Top of book, written by the websocket thread
+        self.order_books: typing.Dict[str, OrderBook] = dict()  # Symbols subscribed to the depth@100ms channel
         self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = dict()
 
         self.logs = []
+        self.dirty_trades: typing.Set[Trade] = set()  # Trades whose pnl or status changed since the last UI update
+        self.dirty_prices: typing.Set[str] = set()  # Symbols whose bid/ask changed since the last UI update
 
         self._ws_id = 1
         self.ws: websocket.WebSocketApp
         self.reconnect = True
         self.ws_connected = False
-        self.ws_subscriptions = {"bookTicker": [], "aggTrade": []}
+        self._ws_opened_nb = 0
+        self.ws_subscriptions = {"bookTicker": [], "aggTrade": [], "depth@100ms": []}
+
+        self.cpu = CpuAccounting(self.platform)
+        self.backfill = CandleBackfill(self)
+        self.order_batcher = OrderBatcher(self)
+        self.indicators = IndicatorRegistry()  # Shared by the strategies of the same symbol and timeframe
+        self.batch_evaluator = BatchEvaluator(self)
+        # Binance Spot has no batch endpoint, but the orders of a batch can be pipelined on the trading websocket
+        self.max_batch_orders = 5 if self.futures or ws_orders else 1
+
+        self.ws_api: typing.Optional[BinanceWsApi] = None
+        if ws_orders:
+            self.ws_api = BinanceWsApi(self._ws_api_url, self._public_key, self._secret_key, self.platform,
+                                       self.metrics)
+            self.ws_api.start()
+
+        if self.metrics is not None:
+            self.metrics.add_collector(self.cpu.collect)
+            self.metrics.add_gauge("ws_connected", self.platform, lambda: int(self.ws_connected))
+            self.metrics.add_gauge("queue_depth", self.platform, lambda: len(self.dirty_trades), "dirty_trades")
+            self.metrics.add_gauge("queue_depth", self.platform, lambda: len(self.dirty_prices), "dirty_prices")
+            self.metrics.add_gauge("queue_depth", self.platform, lambda: self.order_batcher.queue_size, "orders")
+            if self.recorder is not None:
+                self.metrics.add_gauge("queue_depth", self.platform, lambda: self.recorder.queue_size, "recorder")
 
         t = threading.Thread(target=self._start_ws)
         t.start()
@@ -138,6 +204,35 @@ class BinanceClient:
                          method, endpoint, response.json(), response.status_code)
             return None
 
+    def _trading_request(self, ws_method: str, method: str, endpoint: str, data: typing.Dict):
+
+        """
+        Request on the websocket trading API if it is enabled, on the REST API otherwise or when the websocket is
+        unavailable. An order.place whose response was lost isn't sent again: it may have been executed.
+        :param ws_method: order.place, order.cancel, order.status
+        :param method: Of the equivalent REST request
+        :param endpoint:
+        :param data: Parameters without timestamp and signature
+        :return:
+        """
+
+        if self.ws_api is not None:
+            try:
+                return self.ws_api.request(ws_method, data)
+            except WsApiUnavailable as e:
+                if e.sent and ws_method == "order.place":
+                    logger.error("Binance %s order on %s: %s, not sent again", data['side'], data['symbol'], e)
+                    return None
+                logger.warning("%s, falling back to REST", e)
+                if self.metrics is not None:
+                    self.metrics.increment("ws_api_fallbacks_total", self.platform)
+
+        data = dict(data)
+        data['timestamp'] = int(time.time() * 1000)
+        data['signature'] = self._generate_signature(data)
+
+        return self._make_request(method, endpoint, data)
+
     def get_contracts(self) -> typing.Dict[str, Contract]:
 
         """
@@ -153,17 +248,21 @@ class BinanceClient:
         contracts = dict()
 
         if exchange_info is not None:
+            parse = Contract.from_binance_futures if self.futures else Contract.from_binance_spot
             for contract_data in exchange_info['symbols']:
-                contracts[contract_data['symbol']] = Contract(contract_data, self.platform)
+                contracts[contract_data['symbol']] = parse(contract_data)
 
         return collections.OrderedDict(sorted(contracts.items()))  # Sort keys of the dictionary alphabetically
 
-    def get_historical_candles(self, contract: Contract, interval: str) -> typing.List[Candle]:
+    def get_historical_candles(self, contract: Contract, interval: str,
+                               start_time: typing.Optional[int] = None) -> typing.List[Candle]:
 
         """
         Get a list of the most recent candlesticks for a given symbol/contract and interval.
         :param contract:
         :param interval: 1m, 3m, 5m, 15m, 30m, 1h, 2h, 4h, 6h, 8h, 12h, 1d, 3d, 1w, 1M
+        :param start_time: Open time in ms of the first candle, to backfill missing candles. If None, or if more than
+        1000 candles would be needed, the 1000 most recent candles.
         :return:
         """
 
@@ -172,18 +271,19 @@ class BinanceClient:
         data['interval'] = interval
         data['limit'] = 1000  # The maximum number of candles is 1000 on Binance Spot
 
+        if start_time is not None and interval in TF_EQUIV:
+            if start_time > self.clock.time_ms() - 1000 * TF_EQUIV[interval] * 1000:
+                data['startTime'] = start_time
+
         if self.futures:
             raw_candles = self._make_request("GET", "/fapi/v1/klines", data)
         else:
             raw_candles = self._make_request("GET", "/api/v3/klines", data)
 
-        candles = []
+        if raw_candles is None:
+            return []
 
-        if raw_candles is not None:
-            for c in raw_candles:
-                candles.append(Candle(c, interval, self.platform))
-
-        return candles
+        return Candle.from_binance_klines(raw_candles)
 
     def get_bid_ask(self, contract: Contract) -> typing.Dict[str, float]:
 
@@ -203,11 +303,9 @@ class BinanceClient:
             ob_data = self._make_request("GET", "/api/v3/ticker/bookTicker", data)
 
         if ob_data is not None:
-            if contract.symbol not in self.prices:  # Add the symbol to the dictionary if needed
-                self.prices[contract.symbol] = {'bid': float(ob_data['bidPrice']), 'ask': float(ob_data['askPrice'])}
-            else:
-                self.prices[contract.symbol]['bid'] = float(ob_data['bidPrice'])
-                self.prices[contract.symbol]['ask'] = float(ob_data['askPrice'])
+            self.prices.update(contract.symbol, float(ob_data['bidPrice']), float(ob_data['askPrice']),
+                               float(ob_data['bidQty']), float(ob_data['askQty']), local_ts=self.clock.time_ms())
+            self.dirty_prices.add(contract.symbol)
 
             return self.prices[contract.symbol]
 
@@ -232,10 +330,10 @@ class BinanceClient:
         if account_data is not None:
             if self.futures:
                 for a in account_data['assets']:
-                    balances[a['asset']] = Balance(a, self.platform)
+                    balances[a['asset']] = Balance.from_binance_futures(a)
             else:
                 for a in account_data['balances']:
-                    balances[a['asset']] = Balance(a, self.platform)
+                    balances[a['asset']] = Balance.from_binance_spot(a)
 
         return balances
 
@@ -253,38 +351,148 @@ class BinanceClient:
         :return:
         """
 
+        start = time.perf_counter_ns()
+
+        data = self._order_data(contract, order_type, quantity, side, price, tif)
+
+        send_start = time.perf_counter_ns()
+
+        if self.futures:
+            order_status = self._trading_request("order.place", "POST", "/fapi/v1/order", data)
+        else:
+            order_status = self._trading_request("order.place", "POST", "/api/v3/order", data)
+
+        if self.metrics is not None:  # Preparation of the order, then the round trip until the exchange response
+            self.metrics.record_stage(self.platform, "order_send", send_start - start)
+            self.metrics.record_stage(self.platform, "order_ack", time.perf_counter_ns() - send_start)
+
+        if order_status is not None:
+            order_status = self._parse_order(contract, order_status)
+
+        return order_status
+
+    def _order_data(self, contract: Contract, order_type: str, quantity: float, side: str, price=None,
+                    tif=None) -> typing.Dict:
+
+        """
+        Parameters of a new order, without the timestamp and signature.
+        """
+
         data = dict()
         data['symbol'] = contract.symbol
         data['side'] = side.upper()
-        data['quantity'] = round(int(quantity / contract.lot_size) * contract.lot_size, 8)  # int() to round down
+        data['quantity'] = contract.quantity_quantizer.format(contract.quantity_quantizer.floor(quantity))
         data['type'] = order_type.upper()  # Makes sure the order type is in uppercase
 
         if price is not None:
-            data['price'] = round(round(price / contract.tick_size) * contract.tick_size, 8)
-            data['price'] = '%.*f' % (contract.price_decimals, data['price'])  # Avoids scientific notation
+            data['price'] = contract.price_quantizer.format(contract.price_quantizer.round(price))
 
         if tif is not None:
             data['timeInForce'] = tif
 
+        return data
+
+    def _parse_order(self, contract: Contract, order_status: typing.Dict) -> OrderStatus:
+        if not self.futures:
+            if order_status['status'] == "FILLED":
+                order_status['avgPrice'] = self._get_execution_price(contract, order_status['orderId'])
+            else:
+                order_status['avgPrice'] = 0
+
+        return OrderStatus.from_binance(order_status)
+
+    def place_orders(self, orders: typing.List[OrderRequest]) -> typing.List[typing.Optional[OrderStatus]]:
+
+        """
+        Place several orders with one request, at most max_batch_orders.
+        https://binance-docs.github.io/apidocs/futures/en/#place-multiple-orders-trade
+        :param orders:
+        :return: The status of each order, None for those rejected
+        """
+
+        if self.ws_api is not None and self.ws_api.connected and len(orders) > 1:
+            return self._pipeline_orders(orders)
+
+        if not self.futures or len(orders) == 1:
+            return [self.place_order(o.contract, o.order_type, o.quantity, o.side, o.price, o.tif) for o in orders]
+
+        start = time.perf_counter_ns()
+
+        batch = []
+        for o in orders:
+            order_data = self._order_data(o.contract, o.order_type, o.quantity, o.side, o.price, o.tif)
+            batch.append({key: str(value) for key, value in order_data.items()})  # Strings in batchOrders
+
+        data = dict()
+        data['batchOrders'] = json.dumps(batch, separators=(",", ":"))
         data['timestamp'] = int(time.time() * 1000)
         data['signature'] = self._generate_signature(data)
 
-        if self.futures:
-            order_status = self._make_request("POST", "/fapi/v1/order", data)
-        else:
-            order_status = self._make_request("POST", "/api/v3/order", data)
+        send_start = time.perf_counter_ns()
+        response = self._make_request("POST", "/fapi/v1/batchOrders", data)
 
-        if order_status is not None:
+        if self.metrics is not None:
+            self.metrics.record_stage(self.platform, "order_send", send_start - start)
+            self.metrics.record_stage(self.platform, "order_ack", time.perf_counter_ns() - send_start)
 
-            if not self.futures:
-                if order_status['status'] == "FILLED":
-                    order_status['avgPrice'] = self._get_execution_price(contract, order_status['orderId'])
-                else:
-                    order_status['avgPrice'] = 0
+        if response is None:
+            return [None] * len(orders)
 
-            order_status = OrderStatus(order_status, self.platform)
+        results = []
 
-        return order_status
+        for o, order_status in zip(orders, response):  # In the order of the batch
+            if "orderId" in order_status:
+                results.append(self._parse_order(o.contract, order_status))
+            else:
+                logger.error("Binance %s %s order on %s rejected: %s", o.side, o.order_type, o.contract.symbol,
+                             order_status)
+                results.append(None)
+
+        results.extend([None] * (len(orders) - len(results)))
+
+        return results
+
+    def _pipeline_orders(self, orders: typing.List[OrderRequest]) -> typing.List[typing.Optional[OrderStatus]]:
+
+        """
+        Send every order of the batch on the websocket trading API before waiting for the first response, so that
+        the batch takes one round trip. The orders that can't be sent are placed on their own through REST.
+        :param orders:
+        :return: The status of each order, None for those rejected or whose response was lost
+        """
+
+        start = time.perf_counter_ns()
+
+        pending = []
+        for o in orders:
+            data = self._order_data(o.contract, o.order_type, o.quantity, o.side, o.price, o.tif)
+            try:
+                pending.append(self.ws_api.send("order.place", data))
+            except WsApiUnavailable:
+                pending.append(None)
+
+        send_start = time.perf_counter_ns()
+
+        results = []
+
+        for o, p in zip(orders, pending):
+            if p is None:
+                results.append(self.place_order(o.contract, o.order_type, o.quantity, o.side, o.price, o.tif))
+                continue
+
+            try:
+                order_status = self.ws_api.wait(p)
+            except WsApiUnavailable as e:
+                logger.error("Binance %s order on %s: %s, not sent again", o.side, o.contract.symbol, e)
+                order_status = None
+
+            results.append(self._parse_order(o.contract, order_status) if order_status is not None else None)
+
+        if self.metrics is not None:
+            self.metrics.record_stage(self.platform, "order_send", send_start - start)
+            self.metrics.record_stage(self.platform, "order_ack", time.perf_counter_ns() - send_start)
+
+        return results
 
     def cancel_order(self, contract: Contract, order_id: int) -> OrderStatus:
 
@@ -292,19 +500,16 @@ class BinanceClient:
         data['orderId'] = order_id
         data['symbol'] = contract.symbol
 
-        data['timestamp'] = int(time.time() * 1000)
-        data['signature'] = self._generate_signature(data)
-
         if self.futures:
-            order_status = self._make_request("DELETE", "/fapi/v1/order", data)
+            order_status = self._trading_request("order.cancel", "DELETE", "/fapi/v1/order", data)
         else:
-            order_status = self._make_request("DELETE", "/api/v3/order", data)
+            order_status = self._trading_request("order.cancel", "DELETE", "/api/v3/order", data)
 
         if order_status is not None:
             if not self.futures:
                 # Get the average execution price based on the recent trades
                 order_status['avgPrice'] = self._get_execution_price(contract, order_id)
-            order_status = OrderStatus(order_status, self.platform)
+            order_status = OrderStatus.from_binance(order_status)
 
         return order_status
 
@@ -339,20 +544,18 @@ class BinanceClient:
                     fill_pct = float(t['qty']) / executed_qty
                     avg_price += (float(t['price']) * fill_pct)  # Weighted sum
 
-        return round(round(avg_price / contract.tick_size) * contract.tick_size, 8)
+        return contract.price_quantizer.round(avg_price)
 
     def get_order_status(self, contract: Contract, order_id: int) -> OrderStatus:
 
         data = dict()
-        data['timestamp'] = int(time.time() * 1000)
         data['symbol'] = contract.symbol
         data['orderId'] = order_id
-        data['signature'] = self._generate_signature(data)
 
         if self.futures:
-            order_status = self._make_request("GET", "/fapi/v1/order", data)
+            order_status = self._trading_request("order.status", "GET", "/fapi/v1/order", data)
         else:
-            order_status = self._make_request("GET", "/api/v3/order", data)
+            order_status = self._trading_request("order.status", "GET", "/api/v3/order", data)
 
         if order_status is not None:
             if not self.futures:
@@ -362,7 +565,7 @@ class BinanceClient:
                 else:
                     order_status['avgPrice'] = 0
 
-            order_status = OrderStatus(order_status, self.platform)
+            order_status = OrderStatus.from_binance(order_status)
 
         return order_status
 
@@ -389,6 +592,9 @@ class BinanceClient:
                 logger.error("Binance error in run_forever() method: %s", e)
             time.sleep(2)
 
+            if self.metrics is not None and self.reconnect:
+                self.metrics.increment("ws_reconnects_total", self.platform)
+
     def _on_open(self, ws):
         logger.info("Binance connection opened")
 
@@ -396,14 +602,22 @@ class BinanceClient:
 
         # The aggTrade channel is subscribed to in the _switch_strategy() method of strategy_component.py
 
-        for channel in ["bookTicker", "aggTrade"]:
-            for symbol in self.ws_subscriptions[channel]:
-                self.subscribe_channel([self.contracts[symbol]], channel)
+        # After a reconnection: the new connection has no subscription, every symbol is subscribed to again
+
+        for channel in ["bookTicker", "aggTrade", "depth@100ms"]:
+            symbols = self.ws_subscriptions[channel]
+            self.ws_subscriptions[channel] = []
+            if len(symbols) > 0:
+                self.subscribe_channel([self.contracts[symbol] for symbol in symbols], channel)
 
         if "BTCUSDT" not in self.ws_subscriptions["bookTicker"]:
             self.subscribe_channel([self.contracts["BTCUSDT"]], "bookTicker")
 
-    def _on_close(self, ws):
+        self._ws_opened_nb += 1
+        if self._ws_opened_nb > 1:  # Trades were missed while disconnected
+            self.backfill.request_all(list(self.strategies.values()))
+
+    def _on_close(self, ws, *args):
 
         """
         Callback method triggered when the connection drops
@@ -413,6 +627,12 @@ class BinanceClient:
         logger.warning("Binance Websocket connection closed")
         self.ws_connected = False
 
+        # Updates are missed until the connection reopens, better no book than a stale one
+
+        for book in list(self.order_books.values()):
+            with book.lock:
+                book.reset()
+
     def _on_error(self, ws, msg: str):
 
         """
@@ -431,46 +651,108 @@ class BinanceClient:
         :return:
         """
 
+        cpu_start = time.thread_time_ns()
+
+        if self.recorder is not None:
+            self.recorder.record(msg)
+
+        decode_start = time.perf_counter_ns()
         data = json.loads(msg)
+        decode_ns = time.perf_counter_ns() - decode_start
 
         if "u" in data and "A" in data:
             data['e'] = "bookTicker"  # For Binance Spot, to make the data structure uniform with Binance Futures
             # See the data structure difference here:
             # https://binance-docs.github.io/apidocs/spot/en/#individual-symbol-book-ticker-streams
 
+        if self.metrics is not None:
+            self.metrics.record_stage(self.platform, "decode", decode_ns)
+            self.metrics.increment("messages_total", self.platform, data.get('e', ""))
+
         if "e" in data:
             if data['e'] == "bookTicker":
 
                 symbol = data['s']
 
-                if symbol not in self.prices:
-                    self.prices[symbol] = {'bid': float(data['b']), 'ask': float(data['a'])}
-                else:
-                    self.prices[symbol]['bid'] = float(data['b'])
-                    self.prices[symbol]['ask'] = float(data['a'])
-
-                # PNL Calculation
-
-                try:
-                    for b_index, strat in self.strategies.items():
-                        if strat.contract.symbol == symbol:
-                            for trade in strat.trades:
-                                if trade.status == "open" and trade.entry_price is not None:
-                                    if trade.side == "long":
-                                        trade.pnl = (self.prices[symbol]['bid'] - trade.entry_price) * trade.quantity
-                                    elif trade.side == "short":
-                                        trade.pnl = (trade.entry_price - self.prices[symbol]['ask']) * trade.quantity
-                except RuntimeError as e:  # Handles the case  the dictionary is modified while loop through it
-                    logger.error("Error while looping through the Binance strategies: %s", e)
+                if self.prices.set(symbol, float(data['b']), float(data['a']), float(data['B']), float(data['A']),
+                                   data['u'], data.get('E', 0), self.clock.time_ms()):
+                    self.dirty_prices.add(symbol)  # Conflated: the Watchlist only redraws the latest prices
+
+                self._update_pnl(symbol)
 
             if data['e'] == "aggTrade":
+                self._dispatch_trade(data['s'], float(data['p']), float(data['q']), data['T'])
 
-                symbol = data['s']
+            if data['e'] == "depthUpdate":
+
+                book = self.order_books.get(data['s'])
+
+                if book is not None:
+                    with book.lock:
+                        in_sequence = book.update(data)
+                        waiting = not book.synced
+                    if not in_sequence:
+                        logger.warning("Binance %s order book: update missed, requesting a new snapshot", data['s'])
+                    if waiting:
+                        self._request_order_book_snapshot(book)
+
+        # Includes the time spent in the strategies
+
+        self.cpu.add("connector", "on_message " + data.get('e', ""), time.thread_time_ns() - cpu_start)
+
+    def _update_pnl(self, symbol: str):
+
+        """
+        PNL of the open trades of the symbol, after a change of its bid or ask price.
+        :param symbol:
+        :return:
+        """
+
+        try:
+            for b_index, strat in self.strategies.items():
+                if strat.contract.symbol == symbol:
+                    for trade in strat.open_trades:
+                        if trade.entry_price is not None:
+                            bid, ask = self.prices.bid_ask(symbol)
+
+                            if trade.side == "long":
+                                pnl = (bid - trade.entry_price) * trade.quantity
+                            else:
+                                pnl = (trade.entry_price - ask) * trade.quantity
+
+                            if pnl != trade.pnl:
+                                trade.pnl = pnl
+                                self.dirty_trades.add(trade)  # Picked up by the TradeWatch component
+        except RuntimeError as e:  # Handles the case  the dictionary is modified while loop through it
+            logger.error("Error while looping through the Binance strategies: %s", e)
+
+    def _dispatch_trade(self, symbol: str, price: float, quantity: float, timestamp: int):
+
+        """
+        Update the candles of the strategies of the symbol with a trade, and let them check their signal.
+        :param symbol:
+        :param price:
+        :param quantity:
+        :param timestamp: Exchange time of the trade in ms
+        :return:
+        """
+
+        if self.metrics is not None:  # Exchange trade time to reception, includes the clocks difference
+            self.metrics.record_stage(self.platform, "receive", (self.clock.time_ms() - timestamp) * 1_000_000)
 
-                for key, strat in self.strategies.items():
-                    if strat.contract.symbol == symbol:
-                        res = strat.parse_trades(float(data['p']), float(data['q']), data['T'])  # Updates candlesticks
-                        strat.check_trade(res)
+        for key, strat in self.strategies.items():
+            if strat.contract.symbol == symbol:
+                update_start = time.perf_counter_ns()
+                strat_cpu_start = time.thread_time_ns()
+                res = strat.parse_trades(price, quantity, timestamp)  # Updates candlesticks
+                strat_cpu_parsed = time.thread_time_ns()
+                if self.metrics is not None:
+                    self.metrics.record_stage(self.platform, "candle_update", time.perf_counter_ns() - update_start,
+                                              strat.strategy_name, symbol)
+                strat.check_trade(res)
+
+                self.cpu.add(strat.label, "parse_trades", strat_cpu_parsed - strat_cpu_start)
+                self.cpu.add(strat.label, "check_trade", time.thread_time_ns() - strat_cpu_parsed)
 
     def subscribe_channel(self, contracts: typing.List[Contract], channel: str):
 
@@ -499,6 +781,9 @@ class BinanceClient:
                     data['params'].append(contract.symbol.lower() + "@" + channel)
                     self.ws_subscriptions[channel].append(contract.symbol)
 
+                    if channel == "depth@100ms" and contract.symbol not in self.order_books:
+                        self.order_books[contract.symbol] = OrderBook(contract.symbol, self.futures)
+
             if len(data['params']) == 0:
                 return
 
@@ -512,6 +797,72 @@ class BinanceClient:
 
         self._ws_id += 1
 
+    def get_order_book_snapshot(self, contract: Contract, limit: int = 1000) -> typing.Optional[typing.Dict]:
+
+        """
+        Levels of the order book, to initialize the local order book updated by the depth@100ms channel.
+        :param contract:
+        :param limit: 5, 10, 20, 50, 100, 500 or 1000 levels, the request weight increases with the limit
+        :return: lastUpdateId, bids and asks as [price, quantity] strings
+        """
+
+        data = dict()
+        data['symbol'] = contract.symbol
+        data['limit'] = limit
+
+        if self.futures:
+            return self._make_request("GET", "/fapi/v1/depth", data)
+        else:
+            return self._make_request("GET", "/api/v3/depth", data)
+
+    def _request_order_book_snapshot(self, book: OrderBook):
+
+        """
+        Fetch the snapshot in a thread, the updates received meanwhile are buffered by the book.
+        Only one request at a time per book: the updates that arrive while it is pending don't trigger others.
+        :param book:
+        :return:
+        """
+
+        with book.lock:
+            if book.snapshot_requested:
+                return
+            book.snapshot_requested = True
+
+        def fetch():
+            snapshot = self.get_order_book_snapshot(self.contracts[book.symbol])
+
+            with book.lock:
+                book.snapshot_requested = False
+                if snapshot is None:
+                    return  # Requested again at the next update
+                if not book.set_snapshot(snapshot):
+                    logger.warning("Binance %s order book: snapshot older than the updates, requesting another",
+                                   book.symbol)
+
+        t = threading.Thread(target=fetch)
+        t.start()
+
+    def estimate_fill_price(self, contract: Contract, side: str, quantity: float) -> typing.Optional[float]:
+
+        """
+        Average price of a market order according to the local order book, without request to the exchange.
+        :param contract:
+        :param side: buy or sell
+        :param quantity:
+        :return: None if the symbol has no up to date order book or not enough quantity in it
+        """
+
+        book = self.order_books.get(contract.symbol)
+
+        if book is None:
+            return None
+
+        with book.lock:
+            if not book.synced:
+                return None
+            return book.fill_price(side, quantity)
+
     def get_trade_size(self, contract: Contract, price: float, balance_pct: float):
 
         """
@@ -540,7 +891,7 @@ class BinanceClient:
 
         trade_size = (balance * balance_pct / 100) / price
 
-        trade_size = round(round(trade_size / contract.lot_size) * contract.lot_size, 8)  # Removes extra decimals
+        trade_size = contract.quantity_quantizer.round(trade_size)  # Removes extra decimals
 
         logger.info("Binance current %s balance = %s, trade size = %s", contract.quote_asset, balance, trade_size)
 
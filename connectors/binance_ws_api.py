@@ -0,0 +1,231 @@
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import threading
+import time
+import typing
+from urllib.parse import urlencode
+
+import websocket
+
+from utils.metrics import Metrics
+
+logger = logging.getLogger()
+
+DEFAULT_TIMEOUT = 10
+
+
+class WsApiUnavailable(Exception):
+    def __init__(self, method: str, sent: bool):
+
+        """
+        :param method: e.g. order.place
+        :param sent: True if the request was sent but its response was lost, in which case the exchange may have
+        executed it
+        """
+
+        super().__init__(f"{method} {'response lost' if sent else 'not sent'}, the trading websocket is unavailable")
+        self.method = method
+        self.sent = sent
+
+
+class PendingRequest:
+    __slots__ = ("request_id", "method", "event", "response", "lost")
+
+    def __init__(self, request_id: str, method: str):
+        self.request_id = request_id
+        self.method = method
+        self.event = threading.Event()
+        self.response: typing.Optional[typing.Dict] = None
+        self.lost = False
+
+
+class BinanceWsApi:
+    def __init__(self, url: str, public_key: str, secret_key: str, platform: str,
+                 metrics: typing.Optional[Metrics] = None, timeout: float = DEFAULT_TIMEOUT):
+
+        """
+        Persistent connection to the Binance websocket trading API, to place, cancel and query orders without the
+        TCP and TLS handshakes of a new HTTP request.
+        Every request carries an id and its response is matched to it in the websocket thread, so several requests
+        can be outstanding at the same time (pipelining): send() returns at once and wait() blocks on the response.
+        https://binance-docs.github.io/apidocs/websocket_api/en
+        https://binance-docs.github.io/apidocs/futures/en/#websocket-api-general-info
+        :param url: wss://ws-fapi.binance.com/ws-fapi/v1 or wss://ws-api.binance.com:443/ws-api/v3
+        :param public_key:
+        :param secret_key:
+        :param platform: binance_futures, binance_spot, to label the metrics
+        :param metrics:
+        :param timeout: Seconds to wait for a response before considering it lost
+        """
+
+        self.url = url
+        self.platform = platform
+        self.metrics = metrics
+        self.timeout = timeout
+
+        self._public_key = public_key
+        self._secret_key = secret_key
+
+        self._ids = itertools.count(1)
+        self._pending: typing.Dict[str, PendingRequest] = dict()
+        self._lock = threading.Lock()
+
+        self.ws: typing.Optional[websocket.WebSocketApp] = None
+        self.connected = False
+        self.reconnect = True
+
+        if self.metrics is not None:
+            self.metrics.add_gauge("ws_api_connected", self.platform, lambda: int(self.connected))
+            self.metrics.add_gauge("queue_depth", self.platform, lambda: len(self._pending), "ws_api_pending")
+
+    def start(self):
+        t = threading.Thread(target=self._run, daemon=True)
+        t.start()
+
+    def stop(self):
+        self.reconnect = False
+        if self.ws is not None:
+            self.ws.close()
+
+    def _run(self):
+
+        """
+        Same reconnection loop as the market data websocket of the client.
+        :return:
+        """
+
+        self.ws = websocket.WebSocketApp(self.url, on_open=self._on_open, on_close=self._on_close,
+                                         on_error=self._on_error, on_message=self._on_message)
+
+        while self.reconnect:
+            try:
+                self.ws.run_forever()
+            except Exception as e:
+                logger.error("Binance trading websocket error in run_forever() method: %s", e)
+
+            self.connected = False
+            self._fail_pending()
+
+            if not self.reconnect:
+                break
+
+            time.sleep(2)
+
+            if self.metrics is not None:
+                self.metrics.increment("ws_reconnects_total", self.platform, "trading")
+
+    def _on_open(self, ws):
+        logger.info("Binance trading websocket connection opened")
+        self.connected = True
+
+    def _on_close(self, ws, *args):
+        logger.warning("Binance trading websocket connection closed")
+        self.connected = False
+        self._fail_pending()
+
+    def _on_error(self, ws, msg: str):
+        logger.error("Binance trading websocket error: %s", msg)
+
+    def _on_message(self, ws, msg: str):
+        data = json.loads(msg)
+
+        with self._lock:
+            pending = self._pending.pop(str(data.get("id")), None)
+
+        if pending is None:
+            return  # Response to a request that timed out
+
+        pending.response = data
+        pending.event.set()
+
+    def _fail_pending(self):
+
+        """
+        The responses of the requests in flight won't come on a new connection.
+        :return:
+        """
+
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+
+        for p in pending:
+            p.lost = True
+            p.event.set()
+
+    def _sign(self, params: typing.Dict) -> typing.Dict:
+
+        """
+        The signature payload of the websocket API is the query string of the parameters sorted by name.
+        :param params:
+        :return: A new dictionary with the apiKey, timestamp and signature
+        """
+
+        params = dict(params)
+        params["apiKey"] = self._public_key
+        params["timestamp"] = int(time.time() * 1000)
+
+        payload = urlencode(sorted(params.items()))
+        params["signature"] = hmac.new(self._secret_key.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+        return params
+
+    def send(self, method: str, params: typing.Dict) -> PendingRequest:
+
+        """
+        Sign and send a request without waiting for its response.
+        :param method: order.place, order.cancel, order.status
+        :param params: As for the equivalent REST endpoint, without timestamp and signature
+        :return: To pass to wait()
+        """
+
+        if not self.connected:
+            raise WsApiUnavailable(method, False)
+
+        pending = PendingRequest(str(next(self._ids)), method)
+        request = json.dumps({"id": pending.request_id, "method": method, "params": self._sign(params)})
+
+        with self._lock:
+            self._pending[pending.request_id] = pending
+
+        try:
+            self.ws.send(request)
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(pending.request_id, None)
+            logger.error("Error while sending %s on the Binance trading websocket: %s", method, e)
+            raise WsApiUnavailable(method, False)
+
+        return pending
+
+    def wait(self, pending: PendingRequest) -> typing.Optional[typing.Dict]:
+
+        """
+        :param pending: Returned by send()
+        :return: The result of the request, None if the exchange rejected it
+        """
+
+        if not pending.event.wait(self.timeout):
+            with self._lock:
+                self._pending.pop(pending.request_id, None)
+            logger.error("No response to %s on the Binance trading websocket after %s s", pending.method,
+                         self.timeout)
+            raise WsApiUnavailable(pending.method, True)
+
+        if pending.lost:
+            raise WsApiUnavailable(pending.method, True)
+
+        response = pending.response
+
+        if response.get("status") != 200:
+            logger.error("Error while making %s request on the Binance trading websocket: %s (error code %s)",
+                         pending.method, response.get("error"), response.get("status"))
+            return None
+
+        return response["result"]
+
+    def request(self, method: str, params: typing.Dict) -> typing.Optional[typing.Dict]:
+        return self.wait(self.send(method, params))
@@ -13,14 +13,32 @@ import threading
 import dateutil.parser
 
 from models.models import *
+from models.price_table import PriceTable
+from db.journal import TradeJournal
+from connectors.recorder import MarketDataRecorder
+from connectors.backfill import CandleBackfill
+from connectors.bitmex_account import BitmexAccount, PRIVATE_TOPICS
+from connectors.order_batcher import OrderBatcher, OrderRequest
+from utils.clock import Clock
+from utils.metrics import Metrics
+from utils.profiler import CpuAccounting
+from strategies.batch_evaluator import BatchEvaluator
+from strategies.indicators import IndicatorRegistry
 from strategies.strategies import TechnicalStrategy, BreakoutStrategy
 
 logger = logging.getLogger()
 
+BULK_REFUSED_STATUS = {403, 404, 405, 410}  # The bulk endpoint itself forbidden or removed, not the orders rejected
+
 
 class BitmexClient:
 
-    def __init__(self, public_key: str, secret_key: str, testnet: bool):
+    def __init__(self, public_key: str, secret_key: str, testnet: bool,
+                 journal: typing.Optional[TradeJournal] = None, recorder: typing.Optional[MarketDataRecorder] = None,
+                 metrics: typing.Optional[Metrics] = None, base_url: typing.Optional[str] = None,
+                 wss_url: typing.Optional[str] = None):
+        self.platform = "bitmex"
+
         if testnet:
             self._base_url = "https://testnet.bitmex.com"
             self._wss_url = "wss://testnet.bitmex.com/realtime"
@@ -28,19 +46,49 @@ class BitmexClient:
             self._base_url = "https://www.bitmex.com"
             self._wss_url = "wss://www.bitmex.com/realtime"
 
+        if base_url is not None:  # Mock exchange of simulation/mock_exchange.py
+            self._base_url = base_url
+        if wss_url is not None:
+            self._wss_url = wss_url
+
         self._public_key = public_key
         self._secret_key = secret_key
 
+        self.journal = journal
+        self.recorder = recorder
+        self.metrics = metrics
+        self.clock = Clock()  # Replaced by a simulated clock when replaying recorded data
+
+        self.account = BitmexAccount()  # Orders and margins of the private topics, used instead of REST once received
+
         self.contracts = self.get_contracts()
         self.balances = self.get_balances()
 
         self.logs = []
+        self.dirty_trades: typing.Set[Trade] = set()  # Trades whose pnl or status changed since the last UI update
+        self.dirty_prices: typing.Set[str] = set()  # Symbols whose bid/ask changed since the last UI update
 
-        self.prices = dict()
+        self.prices = PriceTable(len(self.contracts))  # Top of book, written by the websocket thread
         self.strategies: typing.Dict[int, typing.Union[TechnicalStrategy, BreakoutStrategy]] = dict()
 
         self.ws: websocket.WebSocketApp
         self.reconnect = True
+        self._ws_opened_nb = 0
+
+        self.cpu = CpuAccounting(self.platform)
+        self.backfill = CandleBackfill(self)
+        self.order_batcher = OrderBatcher(self)
+        self.indicators = IndicatorRegistry()  # Shared by the strategies of the same symbol and timeframe
+        self.batch_evaluator = BatchEvaluator(self)
+        self.max_batch_orders = 10  # Set to 1 if the bulk endpoint is refused, see place_orders()
+
+        if self.metrics is not None:
+            self.metrics.add_collector(self.cpu.collect)
+            self.metrics.add_gauge("queue_depth", self.platform, lambda: len(self.dirty_trades), "dirty_trades")
+            self.metrics.add_gauge("queue_depth", self.platform, lambda: len(self.dirty_prices), "dirty_prices")
+            self.metrics.add_gauge("queue_depth", self.platform, lambda: self.order_batcher.queue_size, "orders")
+            if self.recorder is not None:
+                self.metrics.add_gauge("queue_depth", self.platform, lambda: self.recorder.queue_size, "recorder")
 
         t = threading.Thread(target=self._start_ws)
         t.start()
@@ -51,6 +99,28 @@ class BitmexClient:
         self.logs.append({"log": msg, "displayed": False})
 
     def _make_request(self, method: str, endpoint: str, data: typing.Dict):
+        response = self._send_request(method, endpoint, data)
+        if response is None:
+            return None
+
+        if response.status_code == 200:
+            return response.json()
+        else:
+            logger.error(
+                "Error while making %s request to %s: %s (error code %s)",
+                method,
+                endpoint,
+                response.json(),
+                response.status_code
+            )
+            return None
+
+    def _send_request(self, method: str, endpoint: str, data: typing.Dict) -> typing.Optional[requests.Response]:
+
+        """
+        Signed request, for the callers that need the status code of an error.
+        :return: None if the request couldn't be sent or got no response
+        """
 
         expires = str(int(round(time.time())) + 5)
 
@@ -60,37 +130,18 @@ class BitmexClient:
         headers["api-signature"] = self._generate_signature(method, endpoint, expires, data)
 
         if method == "GET":
-            try:
-                response = requests.get(self._base_url + endpoint, params=data, headers=headers)
-            except Exception as e:
-                logger.error("Connection error while executing %s request to %s: %s", method, endpoint, e)
-                return None
+            request = requests.get
         elif method == "POST":
-            try:
-                response = requests.post(self._base_url + endpoint, params=data, headers=headers)
-            except Exception as e:
-                logger.error("Connection error while executing %s request to %s: %s", method, endpoint, e)
-                return None
+            request = requests.post
         elif method == "DELETE":
-            try:
-                response = requests.delete(self._base_url + endpoint, params=data, headers=headers)
-            except Exception as e:
-                logger.error("Connection error while executing %s request to %s: %s", method, endpoint, e)
-                return None
-
+            request = requests.delete
         else:
             raise ValueError
 
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(
-                "Error while making %s request to %s: %s (error code %s)",
-                method,
-                endpoint,
-                response.json(),
-                response.status_code
-            )
+        try:
+            return request(self._base_url + endpoint, params=data, headers=headers)
+        except Exception as e:
+            logger.error("Connection error while executing %s request to %s: %s", method, endpoint, e)
             return None
 
     def get_contracts(self) -> typing.Dict[str, Contract]:
@@ -99,11 +150,15 @@ class BitmexClient:
         contracts = dict()
         if instruments is not None:
             for contract in instruments:
-                contracts[contract["symbol"]] = Contract(contract, "bitmex")
+                contracts[contract["symbol"]] = Contract.from_bitmex(contract)
 
         return contracts
 
     def get_balances(self) -> typing.Dict[str, Balance]:
+        balances = self.account.balances()
+        if balances is not None:
+            return balances
+
         data = dict()
         data["currency"] = "all"
         margin_data = self._make_request("GET", "/api/v1/user/margin", data)
@@ -112,7 +167,7 @@ class BitmexClient:
 
         if margin_data is not None:
             for a in margin_data:
-                balances[a["currency"]] = Balance(a, "bitmex")
+                balances[a["currency"]] = Balance.from_bitmex(a)
         return balances
 
     def _generate_signature(self, method: str, endpoint: str, expires: str, data: typing.Dict) -> str:
@@ -122,7 +177,17 @@ class BitmexClient:
             message = method + endpoint + expires
         return hmac.new(self._secret_key.encode(), message.encode(), hashlib.sha256).hexdigest()
 
-    def get_historical_candles(self, contract: Contract, timeframe: str) -> typing.List[Candle]:
+    def get_historical_candles(self, contract: Contract, timeframe: str,
+                               start_time: typing.Optional[int] = None) -> typing.List[Candle]:
+
+        """
+        :param contract:
+        :param timeframe: 1m, 5m, 1h, 1d
+        :param start_time: Open time in ms of the first candle, to backfill missing candles. If None, or if more than
+        500 candles would be needed, the 500 most recent candles.
+        :return:
+        """
+
         data = dict()
         data["symbol"] = contract.symbol
         data["partial"] = True
@@ -130,35 +195,103 @@ class BitmexClient:
         data["count"] = 500
         data["reverse"] = True
 
+        if start_time is not None:
+            tf_ms = BITMEX_TF_MINUTES[timeframe] * 60_000
+            if start_time > self.clock.time_ms() - 500 * tf_ms:
+                # The bucket timestamps are the close times
+                close_time = datetime.datetime.fromtimestamp((start_time + tf_ms) / 1000, tz=datetime.timezone.utc)
+                data["startTime"] = close_time.isoformat()
+                data["reverse"] = False
+
         raw_candles = self._make_request("GET", "/api/v1/trade/bucketed", data)
 
-        candles = []
+        if raw_candles is None:
+            return []
+
+        if data["reverse"]:  # Most recent first
+            raw_candles.reverse()
 
-        if raw_candles is not None:
-            for c in reversed(raw_candles):
-                candles.append(Candle(c, timeframe, "bitmex"))
-        return candles
+        return Candle.from_bitmex_buckets(raw_candles, timeframe)
 
     def place_order(self, contract: Contract, order_type: str, quantity: int, side: str, price=None,
                     tif=None) -> OrderStatus:
+        start = time.perf_counter_ns()
+
+        data = self._order_data(contract, order_type, quantity, side, price, tif)
+
+        send_start = time.perf_counter_ns()
+        order_status = self._make_request("POST", "/api/v1/order", data)
+
+        if self.metrics is not None:  # The signature is computed in _make_request(), so it is part of order_ack
+            self.metrics.record_stage(self.platform, "order_send", send_start - start)
+            self.metrics.record_stage(self.platform, "order_ack", time.perf_counter_ns() - send_start)
+
+        if order_status is not None:
+            order_status = OrderStatus.from_bitmex(order_status)
+
+        return order_status
+
+    def _order_data(self, contract: Contract, order_type: str, quantity: int, side: str, price=None,
+                    tif=None) -> typing.Dict:
         data = dict()
         data["symbol"] = contract.symbol
         data["side"] = side.capitalize()
-        data["orderQty"] = round(quantity / contract.lot_size) * contract.lot_size
+        data["orderQty"] = contract.quantity_quantizer.round(quantity)
         data["ordType"] = order_type.capitalize()
 
         if price is not None:
-            data["price"] = round(round(price / contract.tick_size) * contract.tick_size, 8)
+            data["price"] = contract.price_quantizer.round(price)
 
         if tif is not None:
             data["timeInForce"] = tif
 
-        order_status = self._make_request("POST", "/api/v1/order", data)
+        return data
 
-        if order_status is not None:
-            order_status = OrderStatus(order_status, "bitmex")
+    def place_orders(self, orders: typing.List[OrderRequest]) -> typing.List[typing.Optional[OrderStatus]]:
 
-        return order_status
+        """
+        Place several orders with one request.
+        The bulk endpoint is deprecated by Bitmex: if it is refused (BULK_REFUSED_STATUS), the batch is reported as
+        failed and the next orders are placed one by one. Other errors (timeout, server error, rate limit, invalid
+        order) only fail the batch. A failed batch isn't sent again order by order, since it may have been accepted.
+        :param orders:
+        :return: The status of each order, None for those rejected
+        """
+
+        if self.max_batch_orders <= 1 or len(orders) == 1:
+            return [self.place_order(o.contract, o.order_type, o.quantity, o.side, o.price, o.tif) for o in orders]
+
+        start = time.perf_counter_ns()
+
+        data = dict()
+        data["orders"] = json.dumps([self._order_data(o.contract, o.order_type, o.quantity, o.side, o.price, o.tif)
+                                     for o in orders], separators=(",", ":"))
+
+        send_start = time.perf_counter_ns()
+        response = self._send_request("POST", "/api/v1/order/bulk", data)
+
+        if self.metrics is not None:
+            self.metrics.record_stage(self.platform, "order_send", send_start - start)
+            self.metrics.record_stage(self.platform, "order_ack", time.perf_counter_ns() - send_start)
+
+        if response is None:
+            return [None] * len(orders)
+
+        if response.status_code != 200:
+            logger.error("Error while placing %s orders with the bulk endpoint: %s (error code %s)", len(orders),
+                         response.text, response.status_code)
+
+            if response.status_code in BULK_REFUSED_STATUS:
+                logger.warning("Bitmex bulk order endpoint refused, the next orders are placed one by one")
+                self.max_batch_orders = 1
+
+            return [None] * len(orders)
+
+        results = [OrderStatus.from_bitmex(order_status) if "orderID" in order_status else None
+                   for order_status in response.json()]
+        results.extend([None] * (len(orders) - len(results)))
+
+        return results
 
     def cancel_order(self, order_id: str) -> OrderStatus:
         data = dict()
@@ -167,11 +300,15 @@ class BitmexClient:
         order_status = self._make_request("DELETE", "/api/v1/order", data)
 
         if order_status is not None:
-            order_status = OrderStatus(order_status[0], "bitmex")
+            order_status = OrderStatus.from_bitmex(order_status[0])
 
         return order_status
 
     def get_order_status(self, contract: Contract, order_id: str) -> OrderStatus:
+        order_status = self.account.order_status(order_id)
+        if order_status is not None:
+            return order_status
+
         data = dict()
         data["symbol"] = contract.symbol
         data["reverse"] = True
@@ -180,7 +317,7 @@ class BitmexClient:
         if order_status is not None:
             for order in order_status:
                 if order["orderID"] == order_id:
-                    return OrderStatus(order, "bitmex")
+                    return OrderStatus.from_bitmex(order)
 
     def _start_ws(self):
         self.ws = websocket.WebSocketApp(
@@ -200,69 +337,156 @@ class BitmexClient:
                 logger.error("Bitmex error in run_forever() method: %s", e)
                 time.sleep(2)
 
+            if self.metrics is not None and self.reconnect:
+                self.metrics.increment("ws_reconnects_total", self.platform)
+
     def _on_open(self, ws):
         logger.info("Bitmex websockets connection opened")
         self.subscribe_channel("instrument")
         self.subscribe_channel("trade")
 
-    def _on_close(self, ws):
+        if self._public_key:  # The private topics need an authenticated connection
+            self._authenticate()
+            for topic in PRIVATE_TOPICS:
+                self.subscribe_channel(topic)
+
+        self._ws_opened_nb += 1
+        if self._ws_opened_nb > 1:  # Trades were missed while disconnected
+            self.backfill.request_all(list(self.strategies.values()))
+
+    def _on_close(self, ws, *args):
         logger.warning("Bitmex websockets connection closed")
+        self.account.reset()  # Updates are missed until the partial messages of the next connection
 
-    def _on_error(self, msg: str):
+    def _authenticate(self):
+
+        """
+        https://www.bitmex.com/app/wsAPI#API-Keys
+        The subscriptions sent after it are processed once the connection is authenticated.
+        :return:
+        """
+
+        expires = int(time.time()) + 5
+        signature = self._generate_signature("GET", "/realtime", str(expires), dict())
+
+        try:
+            self.ws.send(json.dumps({"op": "authKeyExpires", "args": [self._public_key, expires, signature]}))
+        except Exception as e:
+            logger.error("Websockets error while authenticating: %s", e)
+
+    def _on_error(self, ws, msg: str):
         logger.error("Bitmex connection error: %s", msg)
 
     def _on_message(self, *msg):
+        cpu_start = time.thread_time_ns()
+
+        if self.recorder is not None:
+            self.recorder.record(msg[1])
+
+        decode_start = time.perf_counter_ns()
         data = json.loads(msg[1])
+        decode_ns = time.perf_counter_ns() - decode_start
+
+        if self.metrics is not None:
+            self.metrics.record_stage(self.platform, "decode", decode_ns)
+            self.metrics.increment("messages_total", self.platform, data.get("table", ""))
+
         if "table" in data:
             if data["table"] == "instrument":
+                received = self.clock.time_ms()
                 for d in data["data"]:
                     symbol = d["symbol"]
-                    if symbol not in self.prices:
-                        self.prices[symbol] = {"bid": None, "ask": None}
-                    if "bidPrice" in d:
-                        self.prices[symbol]["bid"] = d["bidPrice"]
-                    if "askPrice" in d:
-                        self.prices[symbol]["ask"] = d["askPrice"]
-
-                    # PNL calculation
-                    try:
-                        for b_index, strategy in self.strategies.items():
-                            if strategy.contract.symbol == symbol:
-                                for trade in strategy.trades:
-                                    if trade.status == "open" and trade.entry_price is not None:
-
-                                        if trade.side == "long":
-                                            price = self.prices[symbol]["bid"]
-                                        else:
-                                            price = self.prices[symbol]["ask"]
-
-                                        multiplier = trade.contract.multiplier
-
-                                        if trade.contract.inverse:
-                                            if trade.side == "long":
-                                                trade.pnl = (
-                                                                    1 / trade.entry_price - 1 / price) * multiplier * trade.quantity
-                                            elif trade.side == "short":
-                                                trade.pnl = (
-                                                                    1 / price - 1 / trade.entry_price) * multiplier * trade.quantity
-                                            else:
-                                                if trade.side == "long":
-                                                    trade.pnl = (
-                                                                        price - trade.entry_price) * multiplier * trade.quantity
-                                                elif trade.side == "short":
-                                                    trade.pnl = (
-                                                                        trade.entry_price - price) * multiplier * trade.quantity
-                    except RuntimeError as e:
-                        logger.error(f"Error while looping through the Bitmex strategies: {e}")
+
+                    # Partial updates: the prices missing from the message are unchanged
+
+                    if self.prices.update(symbol, d.get("bidPrice"), d.get("askPrice"), d.get("bidSize"),
+                                          d.get("askSize"), local_ts=received):
+                        self.dirty_prices.add(symbol)
+
+                    self._update_pnl(symbol)
 
             if data["table"] == "trade":
                 for d in data["data"]:
-                    symbol = d["symbol"]
                     ts = int(dateutil.parser.isoparse(d["timestamp"]).timestamp() * 1000)
-                    for key, strategy in self.strategies.items():
-                        if strategy.contract.symbol == symbol:
-                            res = strategy.parse_trades(float(d["price"]), float(d["size"]), ts)
-                            strategy.check_trade(res)
+                    self._dispatch_trade(d["symbol"], float(d["price"]), float(d["size"]), ts)
+
+            elif data["table"] in PRIVATE_TOPICS:
+                self.account.apply(data)
+
+        elif "error" in data:
+            logger.error("Bitmex websocket error: %s", data["error"])
+
+        # Includes the time spent in the strategies
+
+        self.cpu.add("connector", "on_message " + data.get("table", ""), time.thread_time_ns() - cpu_start)
+
+    def _update_pnl(self, symbol: str):
+
+        """
+        PNL of the open trades of the symbol, after a change of its bid or ask price.
+        :param symbol:
+        :return:
+        """
+
+        try:
+            for b_index, strategy in self.strategies.items():
+                if strategy.contract.symbol == symbol:
+                    for trade in strategy.open_trades:
+                        if trade.entry_price is not None:
+
+                            bid, ask = self.prices.bid_ask(symbol)
+
+                            if trade.side == "long":
+                                price = bid
+                            else:
+                                price = ask
+
+                            multiplier = trade.contract.multiplier
+
+                            if trade.contract.inverse:
+                                if trade.side == "long":
+                                    pnl = (1 / trade.entry_price - 1 / price) * multiplier * trade.quantity
+                                else:
+                                    pnl = (1 / price - 1 / trade.entry_price) * multiplier * trade.quantity
+                            else:
+                                if trade.side == "long":
+                                    pnl = (price - trade.entry_price) * multiplier * trade.quantity
+                                else:
+                                    pnl = (trade.entry_price - price) * multiplier * trade.quantity
+
+                            if pnl != trade.pnl:
+                                trade.pnl = pnl
+                                self.dirty_trades.add(trade)  # Picked up by the TradeWatch component
+        except RuntimeError as e:
+            logger.error(f"Error while looping through the Bitmex strategies: {e}")
+
+    def _dispatch_trade(self, symbol: str, price: float, size: float, timestamp: int):
+
+        """
+        Update the candles of the strategies of the symbol with a trade, and let them check their signal.
+        :param symbol:
+        :param price:
+        :param size:
+        :param timestamp: Exchange time of the trade in ms
+        :return:
+        """
+
+        if self.metrics is not None:  # Exchange trade time to reception, includes the clocks difference
+            self.metrics.record_stage(self.platform, "receive", (self.clock.time_ms() - timestamp) * 1_000_000)
+
+        for key, strategy in self.strategies.items():
+            if strategy.contract.symbol == symbol:
+                update_start = time.perf_counter_ns()
+                strategy_cpu_start = time.thread_time_ns()
+                res = strategy.parse_trades(price, size, timestamp)
+                strategy_cpu_parsed = time.thread_time_ns()
+                if self.metrics is not None:
+                    self.metrics.record_stage(self.platform, "candle_update", time.perf_counter_ns() - update_start,
+                                              strategy.strategy_name, symbol)
+                strategy.check_trade(res)
+
+                self.cpu.add(strategy.label, "parse_trades", strategy_cpu_parsed - strategy_cpu_start)
+                self.cpu.add(strategy.label, "check_trade", time.thread_time_ns() - strategy_cpu_parsed)
 
     def subscribe_channel(self, topic: str):
         data = dict()
@@ -274,6 +498,15 @@ class BitmexClient:
         except Exception as e:
             logger.error("Websockets error while subscribing to %s %s updates: %s", topic, e)
 
+    def estimate_fill_price(self, contract: Contract, side: str, quantity: float) -> typing.Optional[float]:
+
+        """
+        No local order book is kept for Bitmex, see BinanceClient.estimate_fill_price()
+        :return: None
+        """
+
+        return None
+
     def get_trade_size(self, contract: Contract, price: float, balance_pct: float):
 
         balance = self.get_balances()
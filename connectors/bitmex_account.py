@@ -0,0 +1,195 @@
+import collections
+import threading
+import typing
+
+from models.models import *
+
+PRIVATE_TOPICS = ["order", "execution", "position", "margin"]
+
+TABLE_KEYS = {  # Used until the partial message gives the keys of the table
+    "order": ["orderID"],
+    "position": ["account", "symbol", "currency"],
+    "margin": ["account", "currency"],
+}
+
+EXECUTION_FIELDS = ["ordStatus", "cumQty", "avgPx", "leavesQty"]
+
+TERMINAL_STATUSES = {"Filled", "Canceled", "Rejected"}
+MAX_TERMINAL_ORDERS = 1000  # Finished orders still answered by order_status(), the oldest are forgotten
+
+
+class BitmexAccount:
+    def __init__(self):
+
+        """
+        Orders, positions and margins of the account, kept up to date by the private websocket topics of Bitmex,
+        so that the order statuses and the balances are read locally instead of requested with REST.
+        A table is only used once its partial message (the snapshot sent after the subscription) was received, and
+        stops being used when the websocket connection closes, until the next partial.
+        Bitmex doesn't delete the orders that are filled, cancelled or rejected, they are moved from self.orders to
+        the last MAX_TERMINAL_ORDERS finished orders, so that the strategies still read their final status but the
+        memory doesn't grow with every order placed. An older order is requested with REST by get_order_status().
+        Written by the websocket thread, read by the strategies and the interface.
+        https://www.bitmex.com/app/wsAPI#Subscriptions
+        """
+
+        self._lock = threading.Lock()
+
+        self.orders: typing.Dict[str, typing.Dict] = dict()  # Open orders, by orderID
+        self._terminal: typing.OrderedDict[str, typing.Dict] = collections.OrderedDict()  # Oldest finished first
+        self.positions: typing.Dict[typing.Tuple, typing.Dict] = dict()
+        self.margins: typing.Dict[typing.Tuple, typing.Dict] = dict()
+
+        self._tables = {"order": self.orders, "position": self.positions, "margin": self.margins}
+        self._keys = dict(TABLE_KEYS)
+        self._ready: typing.Set[str] = set()
+
+        self.executions_nb = 0
+
+    def reset(self):
+        with self._lock:
+            self._ready.clear()
+
+    def apply(self, message: typing.Dict):
+
+        """
+        :param message: Websocket message of one of the PRIVATE_TOPICS, with its table, action and data
+        :return:
+        """
+
+        table = message["table"]
+        action = message["action"]
+
+        with self._lock:
+            if table == "execution":  # The order fills, possibly before the update of the order table
+                if action != "partial":
+                    for execution in message["data"]:
+                        self._apply_execution(execution)
+                self._ready.add(table)
+                return
+
+            rows = self._tables.get(table)
+            if rows is None:
+                return
+
+            if action == "partial":
+                self._keys[table] = message.get("keys") or TABLE_KEYS[table]
+                rows.clear()
+                self._ready.add(table)
+
+            keys = self._keys[table]
+
+            for row in message["data"]:
+                if table == "order":
+                    self._apply_order(action, row)
+                    continue
+
+                key = tuple(row.get(k) for k in keys)
+
+                if action == "delete":
+                    rows.pop(key, None)
+                elif key in rows and action != "partial":
+                    rows[key].update(row)  # Updates only contain the fields that changed
+                else:
+                    rows[key] = dict(row)
+
+    def _apply_order(self, action: str, row: typing.Dict):
+        order_id = row["orderID"]
+
+        if action == "delete":
+            self.orders.pop(order_id, None)
+            self._terminal.pop(order_id, None)
+            return
+
+        order = self._find_order(order_id) if action != "partial" else None
+        if order is None:
+            order = dict(row)
+            self.orders[order_id] = order
+        else:
+            order.update(row)  # Updates only contain the fields that changed
+
+        self._settle(order)
+
+    def _find_order(self, order_id: str) -> typing.Optional[typing.Dict]:
+        order = self.orders.get(order_id)
+        if order is None:
+            order = self._terminal.get(order_id)  # Executions and order updates of a fill arrive in any order
+        return order
+
+    def _settle(self, order: typing.Dict):
+
+        """
+        Move the order to the finished ones once its status is final.
+        :param order:
+        :return:
+        """
+
+        if order.get("ordStatus") not in TERMINAL_STATUSES:
+            return
+
+        order_id = order["orderID"]
+        self.orders.pop(order_id, None)
+
+        self._terminal[order_id] = order
+        self._terminal.move_to_end(order_id)
+        while len(self._terminal) > MAX_TERMINAL_ORDERS:
+            self._terminal.popitem(last=False)
+
+    def _apply_execution(self, execution: typing.Dict):
+        order_id = execution.get("orderID")
+        if order_id is None:
+            return
+
+        order = self._find_order(order_id)
+        if order is None:
+            order = {"orderID": order_id}
+            self.orders[order_id] = order
+
+        for field in EXECUTION_FIELDS:
+            if execution.get(field) is not None:
+                order[field] = execution[field]
+
+        self._settle(order)
+
+        if execution.get("execType") == "Trade":
+            self.executions_nb += 1
+
+    def order_status(self, order_id: str) -> typing.Optional[OrderStatus]:
+
+        """
+        :param order_id:
+        :return: None if the order isn't known locally, e.g. placed before the subscription and no longer open, or
+        among the oldest finished orders
+        """
+
+        if "order" not in self._ready:
+            return None
+
+        with self._lock:
+            order = self._find_order(order_id)
+            if order is None or "ordStatus" not in order:
+                return None
+            return OrderStatus(order_id, order["ordStatus"].lower(), order.get("avgPx"), order.get("cumQty", 0))
+
+    def balances(self) -> typing.Optional[typing.Dict[str, Balance]]:
+
+        """
+        :return: None until the margin table is received
+        """
+
+        if "margin" not in self._ready:
+            return None
+
+        with self._lock:
+            return {m["currency"]: Balance.from_bitmex(m) for m in self.margins.values()}
+
+    def position(self, symbol: str) -> typing.Optional[typing.Dict]:
+        if "position" not in self._ready:
+            return None
+
+        with self._lock:
+            for position in self.positions.values():
+                if position.get("symbol") == symbol:
+                    return dict(position)
+
+        return None
@@ -0,0 +1,162 @@
+import contextlib
+import logging
+import queue
+import threading
+import time
+import typing
+
+from models.models import *
+
+logger = logging.getLogger()
+
+DEFAULT_WINDOW_MS = 20
+
+
+class OrderRequest:
+    __slots__ = ("contract", "order_type", "quantity", "side", "price", "tif", "callback", "submitted")
+
+    def __init__(self, contract: Contract, order_type: str, quantity: float, side: str,
+                 callback: typing.Callable[[typing.Optional[OrderStatus]], None], price: typing.Optional[float] = None,
+                 tif: typing.Optional[str] = None):
+        self.contract = contract
+        self.order_type = order_type
+        self.quantity = quantity
+        self.side = side
+        self.price = price
+        self.tif = tif
+        self.callback = callback
+        self.submitted = time.perf_counter_ns()
+
+
+class OrderBatcher:
+    def __init__(self, client, window_ms: float = DEFAULT_WINDOW_MS, asynchronous: bool = True):
+
+        """
+        Collects the orders of the strategies and sends those that arrive within window_ms of the first one with a
+        single request, through the place_orders() method of the client (Binance Futures batchOrders, Bitmex bulk
+        orders), up to client.max_batch_orders per request. When many strategies react to the same candle close,
+        their orders wait for one round trip instead of queueing behind each other's.
+        An order only waits for others during a burst(), opened by the code that is about to submit several orders
+        (the BatchEvaluator at a candle close): otherwise it is sent as soon as the batcher thread gets it, with the
+        orders that queued meanwhile.
+        The result of each order is passed to the callback given with it, in the batcher thread.
+        :param client: BinanceClient or BitmexClient
+        :param window_ms: How long the first order of a batch waits for others
+        :param asynchronous: If False, every order is placed in the calling thread and its callback called before
+        submit() returns, to keep the replays deterministic
+        """
+
+        self._client = client
+        self._window = window_ms / 1000
+        self._asynchronous = asynchronous
+
+        self._queue: "queue.Queue[typing.Optional[OrderRequest]]" = queue.Queue()  # None: end of a burst
+        self._bursts = 0
+        self._thread: typing.Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.batches_nb = 0
+        self.orders_nb = 0
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, contract: Contract, order_type: str, quantity: float, side: str,
+               callback: typing.Callable[[typing.Optional[OrderStatus]], None], price: typing.Optional[float] = None,
+               tif: typing.Optional[str] = None):
+
+        """
+        :param contract:
+        :param order_type: As for place_order()
+        :param quantity:
+        :param side:
+        :param callback: Called with the OrderStatus, or None if the order failed
+        :param price:
+        :param tif:
+        :return:
+        """
+
+        request = OrderRequest(contract, order_type, quantity, side, callback, price, tif)
+
+        if not self._asynchronous:
+            self._send([request])
+            return
+
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+        self._queue.put(request)
+
+    @contextlib.contextmanager
+    def burst(self):
+
+        """
+        The orders submitted within the block wait for each other, up to the window.
+        :return:
+        """
+
+        with self._lock:
+            self._bursts += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._bursts -= 1
+                ended = self._bursts == 0
+            if ended and self._thread is not None:
+                self._queue.put(None)  # Wakes the batcher waiting for the orders of the burst
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                continue
+
+            batch = [request]
+            max_nb = max(self._client.max_batch_orders, 1)
+            deadline = time.monotonic() + self._window
+
+            while len(batch) < max_nb:
+                if self._bursts == 0 and self._queue.empty():  # No other order coming
+                    break
+
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if request is not None:
+                    batch.append(request)
+
+            self._send(batch)
+
+    def _send(self, batch: typing.List[OrderRequest]):
+        metrics = self._client.metrics
+
+        if metrics is not None:
+            sent = time.perf_counter_ns()
+            for request in batch:  # Time spent waiting for the other orders of the batch
+                metrics.record_stage(self._client.platform, "order_queue", sent - request.submitted)
+
+        try:
+            results = self._client.place_orders(batch)
+        except Exception as e:
+            logger.error("Error while placing a batch of %s orders: %s", len(batch), e)
+            results = [None] * len(batch)
+
+        self.batches_nb += 1
+        self.orders_nb += len(batch)
+
+        for request, order_status in zip(batch, results):
+            try:
+                request.callback(order_status)
+            except Exception as e:
+                logger.error("Error in the callback of the %s order on %s: %s", request.side, request.contract.symbol,
+                             e)
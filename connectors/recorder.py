@@ -0,0 +1,203 @@
+import bisect
+import collections
+import gzip
+import logging
+import os
+import struct
+import threading
+import time
+import typing
+
+logger = logging.getLogger()
+
+RECORD_HEADER = struct.Struct("<qI")  # Receive timestamp in nanoseconds, length of the frame in bytes
+INDEX_FILE = "index.csv"
+
+
+class MarketDataRecorder:
+    def __init__(self, directory: str, max_segment_bytes: int = 256 * 1024 * 1024, max_segment_seconds: int = 3600,
+                 index_interval: float = 1.0, flush_interval: float = 0.2, compress_level: int = 1):
+
+        """
+        Append the raw websocket frames received by a connector to compressed segment files.
+        record() is called from the websocket thread and only appends to a deque, a dedicated thread encodes the
+        frames and writes them with one large write per flush interval.
+
+        Each segment is a gzip file of records: RECORD_HEADER followed by the UTF-8 frame.
+        The index file has one "receive timestamp,segment,offset" line per index_interval (and per new segment),
+        the offset being the uncompressed position of the first record received at or after that timestamp.
+        :param directory: Created if needed, one directory per connector
+        :param max_segment_bytes: A new segment is started after this many uncompressed bytes
+        :param max_segment_seconds: A new segment is started after this many seconds
+        :param index_interval: Seconds between two index entries
+        :param flush_interval: Seconds between two writes to disk
+        :param compress_level: 1 (fastest) to 9 (smallest)
+        """
+
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._max_segment_bytes = max_segment_bytes
+        self._max_segment_ns = max_segment_seconds * 1_000_000_000
+        self._index_interval_ns = int(index_interval * 1_000_000_000)
+        self._flush_interval = flush_interval
+        self._compress_level = compress_level
+
+        self._frames: typing.Deque[typing.Tuple[int, str]] = collections.deque()
+
+        self._segment: typing.Optional[gzip.GzipFile] = None
+        self._segment_name = ""
+        self._segment_start_ns = 0
+        self._segment_offset = 0
+        self._last_index_ns = 0
+        self._segment_nb = len([f for f in os.listdir(self.directory) if f.endswith(".seg.gz")])
+
+        self._index = open(os.path.join(self.directory, INDEX_FILE), "a")
+
+        self._running = True
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def record(self, msg: str):
+        self._frames.append((time.time_ns(), msg))
+
+    @property
+    def queue_size(self) -> int:
+        return len(self._frames)
+
+    def close(self):
+
+        """
+        Write the frames still in memory and close the files.
+        :return:
+        """
+
+        self._running = False
+        self._writer.join()
+
+    def _write_loop(self):
+        while self._running:
+            time.sleep(self._flush_interval)
+            self._write_frames()
+
+        self._write_frames()
+
+        if self._segment is not None:
+            self._segment.close()
+        self._index.close()
+
+    def _open_segment(self, start_ns: int):
+        if self._segment is not None:
+            self._segment.close()
+
+        self._segment_nb += 1
+        self._segment_name = f"{self._segment_nb:06d}-{start_ns}.seg.gz"
+        self._segment = gzip.open(os.path.join(self.directory, self._segment_name), "wb",
+                                  compresslevel=self._compress_level)
+        self._segment_start_ns = start_ns
+        self._segment_offset = 0
+        self._last_index_ns = 0
+
+    def _write_frames(self):
+        if len(self._frames) == 0:
+            return
+
+        buffer = bytearray()
+        index_lines = []
+
+        try:
+            while True:
+                try:
+                    recv_ns, msg = self._frames.popleft()
+                except IndexError:
+                    break
+
+                if self._segment is None or self._segment_offset + len(buffer) >= self._max_segment_bytes \
+                        or recv_ns - self._segment_start_ns >= self._max_segment_ns:
+                    if self._segment is not None:
+                        self._segment.write(buffer)
+                        buffer = bytearray()
+                    self._open_segment(recv_ns)
+
+                if recv_ns - self._last_index_ns >= self._index_interval_ns:
+                    index_lines.append(f"{recv_ns},{self._segment_name},{self._segment_offset + len(buffer)}\n")
+                    self._last_index_ns = recv_ns
+
+                payload = msg.encode() if isinstance(msg, str) else msg
+                buffer += RECORD_HEADER.pack(recv_ns, len(payload))
+                buffer += payload
+
+                if len(buffer) >= 4 * 1024 * 1024:  # Keeps the memory bounded during bursts
+                    self._segment.write(buffer)
+                    self._segment_offset += len(buffer)
+                    buffer = bytearray()
+
+            self._segment.write(buffer)
+            self._segment_offset += len(buffer)
+
+            self._index.writelines(index_lines)
+            self._index.flush()
+
+        except OSError as e:
+            logger.error("Error while writing market data to %s: %s", self.directory, e)
+
+
+def _read_index(directory: str) -> typing.List[typing.Tuple[int, str, int]]:
+    entries = []
+
+    with open(os.path.join(directory, INDEX_FILE)) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) == 3:
+                entries.append((int(parts[0]), parts[1], int(parts[2])))
+
+    return entries
+
+
+def read_frames(directory: str, start_ns: typing.Optional[int] = None,
+                end_ns: typing.Optional[int] = None) -> typing.Iterator[typing.Tuple[int, str]]:
+
+    """
+    Read back the frames of a MarketDataRecorder directory, in the order they were received.
+    :param directory:
+    :param start_ns: Skip the frames received before this timestamp, using the index to find where to start
+    :param end_ns: Stop at the first frame received at or after this timestamp
+    :return: Iterator of (receive timestamp in nanoseconds, frame)
+    """
+
+    entries = _read_index(directory)
+    if len(entries) == 0:
+        return
+
+    start = 0
+    if start_ns is not None:
+        start = max(bisect.bisect_right([e[0] for e in entries], start_ns) - 1, 0)
+
+    segments = []
+    for recv_ns, segment_name, offset in entries[start:]:
+        if len(segments) == 0 or segments[-1][0] != segment_name:
+            segments.append((segment_name, offset))
+
+    for segment_name, offset in segments:
+        with gzip.open(os.path.join(directory, segment_name), "rb") as f:
+            f.seek(offset)
+
+            while True:
+                try:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+
+                    recv_ns, length = RECORD_HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length:
+                        break
+                except EOFError:  # Segment that was being written when the program stopped
+                    break
+
+                if start_ns is not None and recv_ns < start_ns:
+                    continue
+                if end_ns is not None and recv_ns >= end_ns:
+                    return
+
+                yield recv_ns, payload.decode()
@@ -1,36 +1,209 @@
+import collections
+import logging
+import math
 import sqlite3
+import threading
 import typing
 
+logger = logging.getLogger()
+
 
 class WorkspaceData:
-    def __init__(self):
-        self.conn = sqlite3.connect("../database.db")
+    def __init__(self, path: str = "../database.db"):
+
+        """
+        Persistence of the workspace (watchlist and strategies), shared by all the interface components.
+        save() only hands the new table content to a background thread, which writes the difference with what was
+        last saved, so saving never freezes the interface.
+        :param path: SQLite database file
+        """
+
+        self._path = path
+
+        self.conn = sqlite3.connect(self._path)
         self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
 
+        self.cursor.execute("PRAGMA journal_mode=WAL")  # get() on the interface thread doesn't wait for the writer
+
         self.cursor.execute("CREATE TABLE IF NOT EXISTS watchlist (symbol TEXT, exchange TEXT)")
         self.cursor.execute(
             "CREATE TABLE IF NOT EXISTS strategies (strategy_type TEXt, contract TEXT, timeframe TEXT, balance_pct "
             "REAL, take_profit REAL, stop_loss REAL, extra_params TEXT)")
+
+        # Row identity of the tables that have one, None means that the whole row is the identity
+
+        self._keys: typing.Dict[str, typing.Optional[typing.List[str]]] = {
+            "watchlist": ["symbol", "exchange"],
+            "strategies": None
+        }
+
+        # Previous versions saved the same watchlist symbol several times, the unique index needs a single row
+
+        self.cursor.execute("DELETE FROM watchlist WHERE rowid NOT IN "
+                            "(SELECT MIN(rowid) FROM watchlist GROUP BY symbol, exchange)")
+        self.cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_watchlist_key ON watchlist (symbol, exchange)")
         self.conn.commit()
 
-    def save(self, table: str, data: typing.List[typing.Tuple]):
+        self._columns: typing.Dict[str, typing.List[str]] = dict()
+        self._types: typing.Dict[str, typing.List[str]] = dict()  # Declared type of each column
+        self._saved: typing.Dict[str, typing.List[typing.Tuple]] = dict()  # Table content as last written
 
-        self.cursor.execute(f"DELETE FROM {table}")
+        for table in self._keys:
+            table_info = self.cursor.execute(f"PRAGMA table_info({table})").fetchall()
+            self._columns[table] = [row["name"] for row in table_info]
+            self._types[table] = [row["type"].upper() for row in table_info]
+            self._saved[table] = [tuple(row) for row in self.get(table)]
 
-        "INSERT INTO watchlist (symbol, exchange) value (?, ?)"
+        self._pending: typing.Dict[str, typing.List[typing.Tuple]] = dict()  # Latest unsaved content of each table
+        self._lock = threading.Lock()
+        self._wake_up = threading.Condition(self._lock)
+        self._writing = False
+        self._closed = False
 
-        table_data = self.cursor.execute(f"SELECT * FROM {table}")
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
 
-        columns = [description[0] for description in table_data.description]
+    def save(self, table: str, data: typing.List[typing.Tuple]):
 
-        sql_statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+        """
+        Replace the content of a table. Returns immediately, the rows are written by the background thread.
+        If the table is saved again before the previous content was written, only the latest content is written.
+        :param table:
+        :param data: Rows with a value for every column of the table, in the order of the table columns
+        :return:
+        """
 
-        self.cursor.executemany(sql_statement, data)
-        self.conn.commit()
+        with self._lock:
+            self._pending[table] = list(data)
+            self._wake_up.notify_all()
 
     def get(self, table: str) -> typing.List[sqlite3.Row]:
         self.cursor.execute(f"SELECT * FROM {table}")
         data = self.cursor.fetchall()
 
         return data
+
+    def flush(self):
+
+        """
+        Block until everything passed to save() is written.
+        :return:
+        """
+
+        with self._lock:
+            while len(self._pending) > 0 or self._writing:
+                self._wake_up.wait()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wake_up.notify_all()
+        self._writer.join()
+        self.conn.close()
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self._path, timeout=10)
+
+        while True:
+            with self._lock:
+                while len(self._pending) == 0 and not self._closed:
+                    self._wake_up.wait()
+
+                if len(self._pending) == 0:  # Closed and nothing left to write
+                    conn.close()
+                    return
+
+                pending = self._pending
+                self._pending = dict()
+                self._writing = True
+
+            for table, rows in pending.items():
+                try:
+                    self._write_table(conn, table, rows)
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    logger.error("Error while saving the %s table of the workspace: %s", table, e)
+
+            with self._lock:
+                self._writing = False
+                self._wake_up.notify_all()
+
+    def _stored_row(self, table: str, row: typing.Tuple) -> typing.Tuple:
+
+        """
+        The row as SQLite stores it and get() returns it: the interface saves the numbers of its entries as strings,
+        the REAL columns convert them to floats. Without it, the first save after a restart would find every row
+        changed.
+        https://www.sqlite.org/datatype3.html#type_affinity
+        :param table:
+        :param row:
+        :return:
+        """
+
+        stored = []
+
+        for value, column_type in zip(row, self._types[table]):
+            if isinstance(value, str) and "_" not in value and any(t in column_type for t in ("REAL", "FLOA", "DOUB")):
+                try:
+                    number = float(value)
+                except ValueError:  # Kept as text by SQLite too
+                    number = None
+                if number is not None and math.isfinite(number):
+                    value = number
+            stored.append(value)
+
+        return tuple(stored)
+
+    def _write_table(self, conn: sqlite3.Connection, table: str, rows: typing.List[typing.Tuple]):
+        rows = [self._stored_row(table, row) for row in rows]
+
+        columns = self._columns[table]
+        keys = self._keys[table]
+        previous = self._saved[table]
+
+        if keys is not None:
+            key_indexes = [columns.index(k) for k in keys]
+            other_columns = [c for c in columns if c not in keys]
+
+            previous_by_key = {tuple(row[i] for i in key_indexes): row for row in previous}
+            rows_by_key = {tuple(row[i] for i in key_indexes): row for row in rows}
+
+            deleted = [key for key in previous_by_key if key not in rows_by_key]
+            upserted = [row for key, row in rows_by_key.items() if previous_by_key.get(key) != row]
+
+            if len(deleted) > 0:
+                conn.executemany(f"DELETE FROM {table} WHERE {' AND '.join(k + ' = ?' for k in keys)}", deleted)
+
+            if len(upserted) > 0:
+                if len(other_columns) > 0:
+                    conflict_action = "DO UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in other_columns)
+                else:
+                    conflict_action = "DO NOTHING"
+
+                conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) "
+                                 f"VALUES ({', '.join(['?'] * len(columns))}) "
+                                 f"ON CONFLICT ({', '.join(keys)}) {conflict_action}", upserted)
+
+            rows = list(rows_by_key.values())
+
+        else:
+
+            # Without a key, a row is identified by its content: only the rows that disappeared are deleted (one
+            # occurrence each, for duplicated rows) and only the new ones are inserted
+
+            deleted = collections.Counter(previous) - collections.Counter(rows)
+            inserted = collections.Counter(rows) - collections.Counter(previous)
+
+            condition = " AND ".join(f"{c} IS ?" for c in columns)
+            for row, count in deleted.items():
+                for _ in range(count):
+                    conn.execute(f"DELETE FROM {table} WHERE rowid = (SELECT rowid FROM {table} WHERE {condition} "
+                                 f"LIMIT 1)", row)
+
+            if len(inserted) > 0:
+                conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) "
+                                 f"VALUES ({', '.join(['?'] * len(columns))})", list(inserted.elements()))
+
+        conn.commit()
+        self._saved[table] = rows
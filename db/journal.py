@@ -0,0 +1,218 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import typing
+
+from models.models import Contract, OrderStatus, Trade
+
+logger = logging.getLogger()
+
+TRADE_COLUMNS = ["recorded_at", "event", "time", "exchange", "symbol", "strategy", "side", "quantity",
+                 "entry_price", "status", "pnl", "entry_id"]
+
+ORDER_COLUMNS = ["recorded_at", "exchange", "symbol", "strategy", "purpose", "side", "order_type", "quantity",
+                 "order_id", "status", "avg_price", "executed_qty"]
+
+
+class TradeJournal:
+    def __init__(self, path: str = "../journal.db", batch_size: int = 500, flush_interval: float = 0.5):
+
+        """
+        Append-only journal of the trades and orders of the strategies, stored in SQLite.
+        The record_*() methods only put a row in a queue, a background thread writes the rows by batches so that
+        the websocket and interface threads never wait for the disk.
+        :param path: SQLite database file
+        :param batch_size: Maximum number of rows written in one transaction
+        :param flush_interval: Maximum number of seconds a row waits in the queue before being written
+        """
+
+        self._path = path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writer thread and vice versa
+
+        conn.execute("CREATE TABLE IF NOT EXISTS trades (id INTEGER PRIMARY KEY, recorded_at INTEGER, event TEXT, "
+                     "time INTEGER, exchange TEXT, symbol TEXT, strategy TEXT, side TEXT, quantity REAL, "
+                     "entry_price REAL, status TEXT, pnl REAL, entry_id TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS orders (id INTEGER PRIMARY KEY, recorded_at INTEGER, exchange TEXT, "
+                     "symbol TEXT, strategy TEXT, purpose TEXT, side TEXT, order_type TEXT, quantity REAL, "
+                     "order_id TEXT, status TEXT, avg_price REAL, executed_qty REAL)")
+
+        for table, column in [("trades", "time"), ("trades", "symbol"), ("trades", "strategy"),
+                              ("trades", "entry_id"), ("orders", "recorded_at"), ("orders", "symbol"),
+                              ("orders", "strategy"), ("orders", "order_id")]:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+
+        conn.commit()
+        conn.close()
+
+        self._insert_statements = {
+            "trades": f"INSERT INTO trades ({', '.join(TRADE_COLUMNS)}) "
+                      f"VALUES ({', '.join(['?'] * len(TRADE_COLUMNS))})",
+            "orders": f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}) "
+                      f"VALUES ({', '.join(['?'] * len(ORDER_COLUMNS))})"
+        }
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record_trade(self, trade: Trade, event: str):
+
+        """
+        Store the current state of a trade. A trade is recorded several times over its life, the latest row of an
+        entry_id is its current state.
+        :param trade:
+        :param event: open, filled, closed
+        :return:
+        """
+
+        self._queue.put(("trades", (int(time.time() * 1000), event, trade.time, trade.contract.exchange,
+                                    trade.contract.symbol, trade.strategy, trade.side, trade.quantity,
+                                    trade.entry_price, trade.status, trade.pnl, str(trade.entry_id))))
+
+    def record_order(self, contract: Contract, strategy: str, purpose: str, side: str, order_type: str,
+                     quantity: float, order_status: OrderStatus):
+
+        """
+        :param contract:
+        :param strategy: Name of the strategy that placed the order
+        :param purpose: entry, exit
+        :param side:
+        :param order_type:
+        :param quantity: Requested quantity
+        :param order_status: Response of the exchange
+        :return:
+        """
+
+        self._queue.put(("orders", (int(time.time() * 1000), contract.exchange, contract.symbol, strategy, purpose,
+                                    side.lower(), order_type.upper(), quantity, str(order_status.order_id),
+                                    order_status.status, order_status.avg_price, order_status.executed_qty)))
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    def _write_loop(self):
+        conn = self._connect()
+
+        while True:
+            try:
+                item = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [item]
+            deadline = time.time() + self._flush_interval
+
+            # Collect what arrives shortly after so that one transaction writes many rows
+
+            while item is not None and len(batch) < self._batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            rows = {"trades": [], "orders": []}
+            for item in batch:
+                if item is not None:
+                    rows[item[0]].append(item[1])
+
+            try:
+                for table, table_rows in rows.items():
+                    if len(table_rows) > 0:
+                        conn.executemany(self._insert_statements[table], table_rows)
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error("Error while writing %s rows to the trade journal: %s", len(batch), e)
+
+            if batch[-1] is None:  # Sentinel put by close()
+                conn.close()
+                return
+
+    def close(self):
+
+        """
+        Write the rows still in the queue and stop the writer thread.
+        :return:
+        """
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    def _query(self, sql: str, params: typing.Tuple = ()) -> typing.List[sqlite3.Row]:
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def _latest_trades_sql(self, closed_only: bool) -> str:
+
+        # Latest row of each trade, the previous ones are the history of the same trade
+
+        sql = "SELECT * FROM trades WHERE id IN (SELECT MAX(id) FROM trades GROUP BY exchange, entry_id)"
+        if closed_only:
+            sql += " AND status = 'closed'"
+        return sql
+
+    def pnl_by_strategy(self, closed_only: bool = True) -> typing.List[sqlite3.Row]:
+        return self._query(f"SELECT strategy, exchange, COUNT(*) AS trades, SUM(pnl) AS pnl "
+                           f"FROM ({self._latest_trades_sql(closed_only)}) GROUP BY strategy, exchange "
+                           f"ORDER BY strategy, exchange")
+
+    def pnl_by_symbol(self, closed_only: bool = True) -> typing.List[sqlite3.Row]:
+        return self._query(f"SELECT symbol, exchange, COUNT(*) AS trades, SUM(pnl) AS pnl "
+                           f"FROM ({self._latest_trades_sql(closed_only)}) GROUP BY symbol, exchange "
+                           f"ORDER BY symbol, exchange")
+
+    def pnl_by_day(self, closed_only: bool = True) -> typing.List[sqlite3.Row]:
+
+        """
+        :param closed_only: If False, the open trades are included with their latest recorded pnl
+        :return: Rows of (day, exchange, trades, pnl), the day being the UTC date the trades were opened
+        """
+
+        return self._query(f"SELECT date(time / 1000, 'unixepoch') AS day, exchange, COUNT(*) AS trades, "
+                           f"SUM(pnl) AS pnl FROM ({self._latest_trades_sql(closed_only)}) GROUP BY day, exchange "
+                           f"ORDER BY day, exchange")
+
+    def get_trades(self, symbol: typing.Optional[str] = None, strategy: typing.Optional[str] = None,
+                   start_time: typing.Optional[int] = None, end_time: typing.Optional[int] = None
+                   ) -> typing.List[sqlite3.Row]:
+
+        """
+        Latest state of the trades matching the filters, ordered by opening time.
+        :param symbol:
+        :param strategy:
+        :param start_time: In milliseconds, inclusive
+        :param end_time: In milliseconds, exclusive
+        :return:
+        """
+
+        sql = self._latest_trades_sql(False)
+        params = []
+
+        for column, operator, value in [("symbol", "=", symbol), ("strategy", "=", strategy),
+                                        ("time", ">=", start_time), ("time", "<", end_time)]:
+            if value is not None:
+                sql += f" AND {column} {operator} ?"
+                params.append(value)
+
+        return self._query(sql + " ORDER BY time", tuple(params))
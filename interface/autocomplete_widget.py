@@ -1,9 +1,12 @@
 import tkinter as tk
 import typing
 
+from models.models import Contract
+from utils.symbol_index import SymbolIndex
+
 
 class Autocomplete(tk.Entry):
-    def __init__(self, symbols: typing.List[str], *args, **kwargs):
+    def __init__(self, contracts: typing.Dict[str, Contract], *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self._lb: tk.Listbox
@@ -11,7 +14,8 @@ class Autocomplete(tk.Entry):
         self.bind("<Up>", self._up_down)
         self.bind("<Down>", self._up_down)
         self.bind("<Right>", self._select)
-        self._symbols = symbols
+        self._index = SymbolIndex(contracts)
+        self._displayed: typing.List[str] = []  # Symbols currently in the Listbox
         self._var = tk.StringVar()
         self.configure(textvariable=self._var)
         self._var.trace("w", self._changed)
@@ -29,16 +33,18 @@ class Autocomplete(tk.Entry):
                 self._lb = tk.Listbox(height=8)
                 self._lb.place(x=self.winfo_x() + self.winfo_width(), y=self.winfo_y() + self.winfo_height() + 10)
                 self._lb_open = True
+                self._displayed = []
 
-            symbols_matched = [symbol for symbol in self._symbols if symbol.startswith(self._var.get())]
+            symbols_matched = self._index.search(self._var.get())
 
             if len(symbols_matched) > 0:
-                try:
-                    self._lb.delete(0, tk.END)
-                except tk.TclError as e:
-                    pass
-                for symbol in symbols_matched:
-                    self._lb.insert(tk.END, symbol)
+                if symbols_matched != self._displayed:
+                    try:
+                        self._lb.delete(0, tk.END)
+                    except tk.TclError as e:
+                        pass
+                    self._lb.insert(tk.END, *symbols_matched)  # One Tcl call for the whole list
+                    self._displayed = symbols_matched
             else:
                 if self._lb_open:
                     self._lb.destroy()
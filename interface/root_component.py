@@ -1,4 +1,6 @@
 import logging
+import threading
+import typing
 import tkinter as tk
 from tkinter.messagebox import askquestion
 import time
@@ -9,18 +11,39 @@ from interface.watchlist_component import *
 from connectors.bitmex import BitmexClient
 from connectors.binance import BinanceClient
 from interface.strategy_component import *
+from db.database import WorkspaceData
+from utils.utils import pop_all
+from utils.profiler import SamplingProfiler
 
 
 logger = logging.getLogger()
 
+SNAPSHOT_RETRY_S = 5  # Delay before the bid/ask of a Binance symbol is requested again after a failed request
+
 
 class Root(tk.Tk):
-    def __init__(self, binance: BinanceClient, bitmex: BitmexClient):
+    def __init__(self, binance: BinanceClient, bitmex: BitmexClient, price_refresh_ms: int = 250,
+                 autosave_ms: typing.Optional[int] = 60000, db: typing.Optional[WorkspaceData] = None):
+
+        """
+        :param binance:
+        :param bitmex:
+        :param price_refresh_ms: Interval between two redraws of the Watchlist prices
+        :param autosave_ms: Interval between two automatic saves of the workspace, None to only save from the menu
+        :param db: Workspace storage, the default database file if None
+        """
+
         super().__init__()
 
         self.binance = binance
         self.bitmex = bitmex
 
+        self._price_refresh_ms = price_refresh_ms
+        self._snapshots_requested: typing.Set[str] = set()  # Binance symbols whose bid/ask is being fetched by REST
+        self._autosave_ms = autosave_ms
+
+        self.db = db if db is not None else WorkspaceData()  # Shared by the Watchlist and the Strategy components
+
         self.title("Trading bot")
         self.protocol("WM_DELETE_WINDOW", self._ask_before_close)
 
@@ -31,13 +54,20 @@ class Root(tk.Tk):
         self.main_menu.add_cascade(label="Workspace", menu=self.workspace_menu)
         self.workspace_menu.add_command(label="Save workspace", command=self._save_workspace)
 
+        self._profiler = SamplingProfiler()
+        self.profiling_menu = tk.Menu(self.main_menu, tearoff=False)
+        self.main_menu.add_cascade(label="Profiling", menu=self.profiling_menu)
+        self.profiling_menu.add_command(label="Start sampling profiler", command=self._toggle_profiler)
+        self.profiling_menu.add_command(label="Log CPU usage", command=self._log_cpu_usage)
+
         self._left_frame = tk.Frame(self, bg=BG_COLOR)
         self._left_frame.pack(side=tk.LEFT)
 
         self._right_frame = tk.Frame(self, bg=BG_COLOR)
         self._right_frame.pack(side=tk.LEFT)
 
-        self._watchlist_frame = WatchList(self.binance.contracts, self.bitmex.contracts, self._left_frame, bg=BG_COLOR)
+        self._watchlist_frame = WatchList(self.binance.contracts, self.bitmex.contracts, self.db, self._left_frame,
+                                          bg=BG_COLOR)
         self._watchlist_frame.pack(side=tk.TOP)
 
         self.logging_frame = Logging(self._left_frame, bg=BG_COLOR)
@@ -50,6 +80,10 @@ class Root(tk.Tk):
         self._trade_frame.pack(side=tk.TOP)
 
         self._update_ui()
+        self._update_watchlist()
+
+        if self._autosave_ms is not None:
+            self.after(self._autosave_ms, self._autosave)
 
     def _update_ui(self):
 
@@ -72,65 +106,83 @@ class Root(tk.Tk):
                         if not log["displayed"]:
                             self.logging_frame.add_log(log["log"])
                             log["displayed"] = True
-                    for trade in strategy.trades:
-                        if trade.time not in self._trade_frame.body_widgets["symbol"]:
-                            self._trade_frame.add_trade(trade)
-
-                        if trade.contract.exchange == "binance":
-                            precision = trade.contract.price_decimals
-                        else:
-                            precision = 8
-                        pnl_str = "{0:.{prec}f}".format(trade.pnl, prec=precision)
-                        self._trade_frame.body_widgets["pnl_var"][trade.time].set(pnl_str)
-                        self._trade_frame.body_widgets["status_var"][trade.time].set(trade.status.capitalize())
 
             except RuntimeError as e:
                 logger.error(f"Error while looping through strategies dictionary: {e}")
 
-        # Watchlist prices
-        try:
-            for key, value in self._watchlist_frame.body_widgets["symbol"].items():
+            # Only the trades that were opened or whose pnl/status changed since the last update
+
+            self._trade_frame.update_trades(pop_all(client.dirty_trades))
+
+        # trade watch
+        self.after(1500, self._update_ui)
 
-                symbol = self._watchlist_frame.body_widgets["symbol"][key].cget("text")
-                exchange = self._watchlist_frame.body_widgets["exchange"][key].cget("text")
+    def _update_watchlist(self):
 
-                if exchange == "Binance":
-                    if symbol not in self.binance.contracts:
-                        continue
+        """
+        Redraw the prices of the Watchlist symbols that changed since the last call.
+        The connectors add a symbol to their dirty_prices set at every bid/ask change, so a symbol that was updated
+        many times between two calls is only redrawn once, with its latest prices.
+        :return:
+        """
 
-                    if symbol not in self.binance.ws_subscriptions["bookTicker"] and self.binance.ws_connected:
+        clients = {"Binance": self.binance, "Bitmex": self.bitmex}
+
+        for exchange, client in clients.items():
+            for symbol in pop_all(client.dirty_prices):
+                if self._watchlist_frame.has_symbol(exchange, symbol):
+                    self._render_prices(exchange, client, symbol)
+
+        # Symbols that were just added to the Watchlist and have never been displayed
+
+        for exchange, symbol in list(self._watchlist_frame.pending_symbols):
+            client = clients[exchange]
+
+            if symbol not in client.contracts:
+                self._watchlist_frame.pending_symbols.discard((exchange, symbol))
+                continue
+
+            subscribed = True
+
+            if exchange == "Binance":
+                if symbol not in self.binance.ws_subscriptions["bookTicker"]:
+                    if self.binance.ws_connected:
                         self.binance.subscribe_channel([self.binance.contracts[symbol]], "bookTicker")
+                    else:
+                        subscribed = False
 
-                    if symbol not in self.binance.prices:
-                        self.binance.get_bid_ask(self.binance.contracts[symbol])
-                        continue
+                if symbol not in self.binance.prices and symbol not in self._snapshots_requested:
+                    # The REST snapshot runs in a thread so the interface doesn't freeze while waiting for Binance
+                    self._snapshots_requested.add(symbol)
+                    t = threading.Thread(target=self._request_snapshot, args=(symbol,))
+                    t.daemon = True
+                    t.start()
 
-                    precision = self.binance.contracts[symbol].price_decimals
-                    prices = self.binance.prices[symbol]
+            if symbol in client.prices:
+                self._render_prices(exchange, client, symbol)
+                if subscribed:
+                    self._watchlist_frame.pending_symbols.discard((exchange, symbol))
 
-                elif exchange == "Bitmex":
-                    if symbol not in self.bitmex.contracts:
-                        continue
+        self.after(self._price_refresh_ms, self._update_watchlist)
 
-                    if symbol not in self.bitmex.prices:
-                        continue
+    def _request_snapshot(self, symbol: str):
 
-                    precision = self.bitmex.contracts[symbol].price_decimals
-                    prices = self.bitmex.prices[symbol]
-                else:
-                    continue
+        """
+        Runs in its own thread. If the request fails, the symbol can be requested again after SNAPSHOT_RETRY_S,
+        otherwise it would stay blank until the websocket publishes it, even after removing and adding it again.
+        :param symbol:
+        :return:
+        """
 
-                if prices["bid"] is not None:
-                    price_str = "{0:.{prec}f}".format(prices["bid"], prec=precision)
-                    self._watchlist_frame.body_widgets["bid_var"][key].set(price_str)
-                if prices["ask"] is not None:
-                    price_str = "{0:.{prec}f}".format(prices["ask"], prec=precision)
-                    self._watchlist_frame.body_widgets["ask_var"][key].set(price_str)
-        except RuntimeError as e:
-            logger.error("Error while looping through watchlist dictionary: %s", e)
+        if self.binance.get_bid_ask(self.binance.contracts[symbol]) is None:
+            time.sleep(SNAPSHOT_RETRY_S)  # Not requested again at every refresh while Binance can't be reached
+            self._snapshots_requested.discard(symbol)
 
-        # trade watch
-        self.after(1500, self._update_ui)
+    def _render_prices(self, exchange: str, client: typing.Union[BinanceClient, BitmexClient], symbol: str):
+        bid, ask = client.prices.bid_ask(symbol)
+        precision = client.contracts[symbol].price_decimals
+
+        self._watchlist_frame.update_prices(exchange, symbol, bid, ask, precision)
 
     def _ask_before_close(self):
         result = askquestion("Confirmation", "Do you really want to exit the application?")
@@ -139,10 +191,52 @@ class Root(tk.Tk):
             self.bitmex.reconnect = False
             self.binance.ws.close()
             self.bitmex.ws.close()
+            if self.binance.ws_api is not None:
+                self.binance.ws_api.stop()
+
+            self.db.close()  # Waits for the last save to be written
 
             self.destroy()
 
-    def _save_workspace(self):
+    def _toggle_profiler(self):
+        if self._profiler.running:
+            self._profiler.stop()
+            path = self._profiler.save(f"../profiles/profile-{int(time.time())}.folded")
+            self.profiling_menu.entryconfigure(0, label="Start sampling profiler")
+            self.logging_frame.add_log(f"Profile of {self._profiler.samples_nb} samples saved to {path}")
+        else:
+            self._profiler.start()
+            self.profiling_menu.entryconfigure(0, label="Stop profiler and save")
+            self.logging_frame.add_log("Sampling profiler started")
+
+    def _log_cpu_usage(self, top: int = 10):
+
+        """
+        Most expensive connector callbacks and strategy methods since the start.
+        :param top:
+        :return:
+        """
+
+        usage = []
+        for client in [self.binance, self.bitmex]:
+            usage.extend((client.cpu.exchange, *u) for u in client.cpu.usage())
+        usage.sort(key=lambda u: u[3], reverse=True)
+
+        for exchange, component, function, cpu_seconds, calls in usage[:top]:
+            self.logging_frame.add_log(f"{exchange} {component} {function}: {cpu_seconds:.2f} s CPU, {calls} calls")
+
+    def _autosave(self):
+
+        """
+        Saving is cheap when nothing changed: only the rows that differ from the last save are written, and the
+        writing happens in the background thread of WorkspaceData.
+        :return:
+        """
+
+        self._save_workspace(log=False)
+        self.after(self._autosave_ms, self._autosave)
+
+    def _save_workspace(self, log: bool = True):
         # Watchlist
         watchlist_symbols = []
 
@@ -151,7 +245,7 @@ class Root(tk.Tk):
             exchange = self._watchlist_frame.body_widgets["exchange"][key].cget("text")
             watchlist_symbols.append((symbol, exchange))
 
-        self._watchlist_frame.db.save("watchlist", watchlist_symbols)
+        self.db.save("watchlist", watchlist_symbols)
 
         strategies = []
 
@@ -175,6 +269,7 @@ class Root(tk.Tk):
             strategies.append((strategy_type, contract, timeframe, balance_pct, take_profit, stop_loss,
                                json.dumps(extra_params),))
 
-        self._strategy_frame.db.save("strategies", strategies)
+        self.db.save("strategies", strategies)
 
-        self.logging_frame.add_log("Workspace saved")
+        if log:
+            self.logging_frame.add_log("Workspace saved")
@@ -20,7 +20,7 @@ class StrategyEditor(tk.Frame):
 
         self.root = root
 
-        self.db = WorkspaceData()
+        self.db: WorkspaceData = root.db
 
         self._valid_integer = self.register(check_integer_format)
         self._valid_float = self.register(check_float_format)
@@ -283,12 +283,14 @@ class StrategyEditor(tk.Frame):
             new_strategy.candles = self._exchanges[exchange].get_historical_candles(contract, timeframe)
 
             if len(new_strategy.candles) == 0:
+                new_strategy.stop()
                 self.root.logging_frame.add_log(f"No historical data retrieved for {contract.symbol}")
                 return
 
             if exchange == "Binance":
                 self._exchanges[exchange].subscribe_channel([contract], "aggTrade")
                 self._exchanges[exchange].subscribe_channel([contract], "bookTicker")
+                self._exchanges[exchange].subscribe_channel([contract], "depth@100ms")  # Slippage estimates
 
             self._exchanges[exchange].strategies[b_index] = new_strategy
 
@@ -299,7 +301,7 @@ class StrategyEditor(tk.Frame):
             self.body_widgets["activation"][b_index].config(bg="darkgreen", text="ON")
             self.root.logging_frame.add_log(f"{strategy_selected} strategy on {symbol} / {timeframe} activated")
         else:
-            del self._exchanges[exchange].strategies[b_index]
+            self._exchanges[exchange].strategies.pop(b_index).stop()
             for param in self._base_params:
                 code_name = param["code_name"]
                 if code_name != "activation" and "_var" not in code_name:
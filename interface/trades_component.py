@@ -1,13 +1,21 @@
 import datetime
+import math
 import tkinter as tk
+from tkinter import ttk
+import typing
 
 from interface.styling import *
-from interface.scrollable_frame import ScrollableFrame
 from models.models import Trade
 
 
 class TradeWatch(tk.Frame):
     def __init__(self, *args, **kwargs):
+
+        """
+        Trades are displayed in a ttk.Treeview, which only draws the rows that are currently visible.
+        Rows are identified by the trade time, and only the status and pnl columns change after insertion.
+        """
+
         super().__init__(*args, **kwargs)
 
         self._headers = [
@@ -21,131 +29,111 @@ class TradeWatch(tk.Frame):
             "pnl"
         ]
 
+        self._col_width = 11
+
+        style = ttk.Style(self)
+        style.configure("TradeWatch.Treeview", background=BG_COLOR, fieldbackground=BG_COLOR, foreground=FG_COLOR_2,
+                        font=GLOBAL_FONT, borderwidth=0)
+        style.configure("TradeWatch.Treeview.Heading", background=BG_COLOR, foreground=FG_COLOR, font=GLOBAL_FONT,
+                        relief=tk.FLAT)
+
         self._table_frame = tk.Frame(self, bg=BG_COLOR)
-        self._table_frame.pack(side=tk.TOP)
-        self._headers_frame = tk.Frame(self._table_frame, bg=BG_COLOR)
+        self._table_frame.pack(side=tk.TOP, anchor="nw", fill=tk.X)
 
-        self._col_width = 11
+        self._tree = ttk.Treeview(self._table_frame, columns=self._headers, show="headings", height=12,
+                                  style="TradeWatch.Treeview", selectmode=tk.BROWSE)
+        self._vsb = tk.Scrollbar(self._table_frame, orient=tk.VERTICAL, command=self._tree.yview)
+        self._tree.configure(yscrollcommand=self._on_scroll)
 
-        self.body_widgets = dict()
-
-        for idx, h in enumerate(self._headers):
-            header = tk.Label(self._headers_frame,
-                              text=h.capitalize(),
-                              bg=BG_COLOR,
-                              fg=FG_COLOR,
-                              font=GLOBAL_FONT,
-                              width=self._col_width
-                              )
-            header.grid(row=0, column=idx)
-
-        header = tk.Label(self._headers_frame,
-                          text="",
-                          bg=BG_COLOR,
-                          fg=FG_COLOR,
-                          font=GLOBAL_FONT,
-                          width=2
-                          )
-        header.grid(row=0, column=len(self._headers))
-
-        self._headers_frame.pack(side=tk.TOP, anchor="nw")
-        self._body_frame = ScrollableFrame(self, bg=BG_COLOR, height=250)
-        self._body_frame.pack(side=tk.TOP, anchor="nw", fill=tk.X)
+        char_width = 8  # Approximate pixel width of one character of GLOBAL_FONT, Labels used width=11 characters
 
         for h in self._headers:
-            self.body_widgets[h] = dict()
-            if h in ["status", "pnl"]:
-                self.body_widgets[h + "_var"] = dict()
+            self._tree.heading(h, text=h.capitalize())
+            self._tree.column(h, width=self._col_width * char_width, anchor=tk.CENTER, stretch=False)
 
-        self._body_index = 0
+        self._tree.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self._vsb.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self._trades: typing.Dict[str, Trade] = dict()  # Treeview item id -> Trade
+        self._order: typing.List[str] = []  # Item ids in display order
+        self._rendered: typing.Dict[str, typing.Tuple[str, str]] = dict()  # Item id -> (status, pnl) displayed
+        self._stale: typing.Set[str] = set()  # Rows whose trade changed since they were last drawn
+
+    def _item_id(self, trade: Trade) -> str:
+        return str(trade.time)
 
     def add_trade(self, trade: Trade):
-        b_index = self._body_index
+        t_index = self._item_id(trade)
 
-        t_index = trade.time
+        if t_index in self._trades:
+            return
 
         dt_str = datetime.datetime.fromtimestamp(trade.time / 1000).strftime("%b %d %H:%M")
 
-        self.body_widgets["time"][t_index] = tk.Label(self._body_frame.sub_frame,
-                                                      text=dt_str,
-                                                      bg=BG_COLOR,
-                                                      fg=FG_COLOR_2,
-                                                      font=GLOBAL_FONT,
-                                                      width=self._col_width
-                                                      )
-
-        self.body_widgets["time"][t_index].grid(row=b_index, column=0)
-
-        self.body_widgets["symbol"][t_index] = tk.Label(self._body_frame.sub_frame,
-                                                        text=trade.contract.symbol,
-                                                        bg=BG_COLOR,
-                                                        fg=FG_COLOR_2,
-                                                        font=GLOBAL_FONT,
-                                                        width=self._col_width
-                                                        )
-
-        self.body_widgets["symbol"][t_index].grid(row=b_index, column=1)
-
-        self.body_widgets["exchange"][t_index] = tk.Label(self._body_frame.sub_frame,
-                                                          text=trade.contract.exchange.capitalize(),
-                                                          bg=BG_COLOR,
-                                                          fg=FG_COLOR_2,
-                                                          font=GLOBAL_FONT,
-                                                          width=self._col_width
-                                                          )
-
-        self.body_widgets["exchange"][t_index].grid(row=b_index, column=2)
-
-        self.body_widgets["strategy"][t_index] = tk.Label(self._body_frame.sub_frame,
-                                                          text=trade.strategy,
-                                                          bg=BG_COLOR,
-                                                          fg=FG_COLOR_2,
-                                                          font=GLOBAL_FONT,
-                                                          width=self._col_width
-                                                          )
-
-        self.body_widgets["strategy"][t_index].grid(row=b_index, column=3)
-
-        self.body_widgets["side"][t_index] = tk.Label(self._body_frame.sub_frame,
-                                                      text=trade.side.capitalize(),
-                                                      bg=BG_COLOR,
-                                                      fg=FG_COLOR_2,
-                                                      font=GLOBAL_FONT,
-                                                      width=self._col_width
-                                                      )
-
-        self.body_widgets["side"][t_index].grid(row=b_index, column=4)
-
-        self.body_widgets["quantity"][t_index] = tk.Label(self._body_frame.sub_frame,
-                                                          text=trade.quantity,
-                                                          bg=BG_COLOR,
-                                                          fg=FG_COLOR_2,
-                                                          font=GLOBAL_FONT,
-                                                          width=self._col_width
-                                                          )
-
-        self.body_widgets["quantity"][t_index].grid(row=b_index, column=5)
-
-        self.body_widgets["status_var"][t_index] = tk.StringVar()
-        self.body_widgets["status"][t_index] = tk.Label(self._body_frame.sub_frame,
-                                                        textvariable=self.body_widgets["status_var"][t_index],
-                                                        bg=BG_COLOR,
-                                                        fg=FG_COLOR_2,
-                                                        font=GLOBAL_FONT,
-                                                        width=self._col_width
-                                                        )
-
-        self.body_widgets["status"][t_index].grid(row=b_index, column=6)
-
-        self.body_widgets["pnl_var"][t_index] = tk.StringVar()
-        self.body_widgets["pnl"][t_index] = tk.Label(self._body_frame.sub_frame,
-                                                     textvariable=self.body_widgets["pnl_var"][t_index],
-                                                     bg=BG_COLOR,
-                                                     fg=FG_COLOR_2,
-                                                     font=GLOBAL_FONT,
-                                                     width=self._col_width
-                                                     )
-
-        self.body_widgets["pnl"][t_index].grid(row=b_index, column=7)
-
-        self._body_index += 1
+        status_str, pnl_str = self._format_dynamic(trade)
+
+        self._tree.insert("", tk.END, iid=t_index, values=(dt_str,
+                                                          trade.contract.symbol,
+                                                          trade.contract.exchange.capitalize(),
+                                                          trade.strategy,
+                                                          trade.side.capitalize(),
+                                                          trade.quantity,
+                                                          status_str,
+                                                          pnl_str))
+
+        self._trades[t_index] = trade
+        self._order.append(t_index)
+        self._rendered[t_index] = (status_str, pnl_str)
+
+    def update_trades(self, dirty_trades: typing.Iterable[Trade]):
+
+        """
+        Mark the trades whose pnl or status changed, then redraw only the ones that are currently visible.
+        The rows scrolled out of view are redrawn when they become visible again (see _on_scroll()).
+        :param dirty_trades: Trades reported as changed by the connectors and strategies since the last call
+        :return:
+        """
+
+        for trade in dirty_trades:
+            t_index = self._item_id(trade)
+            if t_index not in self._trades:
+                self.add_trade(trade)
+            else:
+                self._stale.add(t_index)
+
+        self._render_visible()
+
+    def _format_dynamic(self, trade: Trade) -> typing.Tuple[str, str]:
+        if trade.contract.exchange.startswith("binance"):
+            precision = trade.contract.price_decimals
+        else:
+            precision = 8
+
+        return trade.status.capitalize(), "{0:.{prec}f}".format(trade.pnl, prec=precision)
+
+    def _visible_items(self) -> typing.List[str]:
+        first, last = self._tree.yview()  # Fractions of the full list of rows that are in view
+        rows_nb = len(self._order)
+
+        return self._order[int(first * rows_nb): math.ceil(last * rows_nb) + 1]
+
+    def _render_visible(self):
+        if len(self._stale) == 0:
+            return
+
+        for t_index in self._visible_items():
+            if t_index not in self._stale:
+                continue
+
+            self._stale.discard(t_index)
+
+            status_str, pnl_str = self._format_dynamic(self._trades[t_index])
+
+            if self._rendered[t_index] != (status_str, pnl_str):
+                self._tree.set(t_index, "status", status_str)
+                self._tree.set(t_index, "pnl", pnl_str)
+                self._rendered[t_index] = (status_str, pnl_str)
+
+    def _on_scroll(self, first: str, last: str):
+        self._vsb.set(first, last)
+        self._render_visible()
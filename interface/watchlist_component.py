@@ -11,12 +11,12 @@ from db.database import WorkspaceData
 
 class WatchList(tk.Frame):
     def __init__(self, binance_contracts: typing.Dict[str, Contract], bitmex_contracts: typing.Dict[str, Contract],
-                 *args, **kwargs):
+                 db: WorkspaceData, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.db = WorkspaceData()
-        self.binance_symbols = list(binance_contracts.keys())
-        self.bitmex_symbols = list(bitmex_contracts.keys())
+        self.db = db
+        self.binance_contracts = binance_contracts
+        self.bitmex_contracts = bitmex_contracts
 
         self._commands_frame = tk.Frame(self, bg=BG_COLOR)
         self._commands_frame.pack(side=tk.TOP)
@@ -32,7 +32,7 @@ class WatchList(tk.Frame):
                                        )
         self._binance_label.grid(row=0, column=0)
 
-        self._binance_entry = Autocomplete(self.binance_symbols,
+        self._binance_entry = Autocomplete(self.binance_contracts,
                                            self._commands_frame,
                                            fg=FG_COLOR,
                                            justify=tk.CENTER,
@@ -50,7 +50,7 @@ class WatchList(tk.Frame):
                                       )
         self._bitmex_label.grid(row=0, column=1)
 
-        self._bitmex_entry = Autocomplete(self.bitmex_symbols,
+        self._bitmex_entry = Autocomplete(self.bitmex_contracts,
                                           self._commands_frame,
                                           fg=FG_COLOR,
                                           justify=tk.CENTER,
@@ -90,6 +90,11 @@ class WatchList(tk.Frame):
                 self.body_widgets[h + "_var"] = dict()
 
         self._body_index = 0
+
+        self._rows: typing.Dict[typing.Tuple[str, str], int] = dict()  # (exchange, symbol) -> b_index
+        self._rendered: typing.Dict[typing.Tuple[str, str], typing.Tuple[str, str]] = dict()  # Last bid/ask drawn
+        self.pending_symbols: typing.Set[typing.Tuple[str, str]] = set()  # Rows not subscribed/displayed yet
+
         saved_symbols = self.db.get("watchlist")
 
         for s in saved_symbols:
@@ -97,24 +102,39 @@ class WatchList(tk.Frame):
 
     def _remove_symbol(self, b_index: int):
 
+        symbol = self.body_widgets["symbol"][b_index].cget("text")
+        exchange = self.body_widgets["exchange"][b_index].cget("text")
+
+        del self._rows[(exchange, symbol)]
+        self._rendered.pop((exchange, symbol), None)
+        self.pending_symbols.discard((exchange, symbol))
+
         for h in self._headers:
             self.body_widgets[h][b_index].grid_forget()
             del self.body_widgets[h][b_index]
 
+        for h in ["bid_var", "ask_var"]:
+            del self.body_widgets[h][b_index]
+
     def _add_binance_symbol(self, event):
         symbol = event.widget.get()
-        if symbol in self.binance_symbols:
+        if symbol in self.binance_contracts:
             self._add_symbol(symbol, "Binance")
             event.widget.delete(0, tk.END)
 
     def _add_bitmex_symbol(self, event):
         symbol = event.widget.get()
-        if symbol in self.bitmex_symbols:
+        if symbol in self.bitmex_contracts:
             self._add_symbol(symbol, "Bitmex")
             event.widget.delete(0, tk.END)
 
     def _add_symbol(self, symbol: str, exchange: str):
+        if (exchange, symbol) in self._rows:
+            return
+
         b_index = self._body_index
+        self._rows[(exchange, symbol)] = b_index
+        self.pending_symbols.add((exchange, symbol))
 
         self.body_widgets["symbol"][b_index] = tk.Label(self._body_frame.sub_frame,
                                                         text=symbol,
@@ -160,3 +180,39 @@ class WatchList(tk.Frame):
         self.body_widgets["remove"][b_index].grid(row=b_index, column=4)
 
         self._body_index += 1
+
+    def has_symbol(self, exchange: str, symbol: str) -> bool:
+        return (exchange, symbol) in self._rows
+
+    def update_prices(self, exchange: str, symbol: str, bid: typing.Optional[float], ask: typing.Optional[float],
+                      precision: int):
+
+        """
+        Redraw the bid/ask cells of a symbol, only if the formatted prices differ from what is already displayed.
+        :param exchange: Binance or Bitmex, as displayed in the exchange column
+        :param symbol:
+        :param bid:
+        :param ask:
+        :param precision: Number of decimals of the contract price
+        :return:
+        """
+
+        b_index = self._rows.get((exchange, symbol))
+        if b_index is None:
+            return
+
+        last_bid, last_ask = self._rendered.get((exchange, symbol), ("", ""))
+
+        if bid is not None:
+            bid_str = "{0:.{prec}f}".format(bid, prec=precision)
+            if bid_str != last_bid:
+                self.body_widgets["bid_var"][b_index].set(bid_str)
+                last_bid = bid_str
+
+        if ask is not None:
+            ask_str = "{0:.{prec}f}".format(ask, prec=precision)
+            if ask_str != last_ask:
+                self.body_widgets["ask_var"][b_index].set(ask_str)
+                last_ask = ask_str
+
+        self._rendered[(exchange, symbol)] = (last_bid, last_ask)
@@ -3,9 +3,16 @@ from config import *
 
 from connectors.bitmex import BitmexClient
 from connectors.binance import BinanceClient
+from db.journal import TradeJournal
+from connectors.recorder import MarketDataRecorder
+from utils.metrics import Metrics, MetricsServer
 
 from interface.root_component import Root
 
+RECORD_MARKET_DATA = False  # Saves the raw websocket messages to ../recordings, to replay them later
+METRICS_PORT = 9108  # Prometheus endpoint on http://127.0.0.1:9108/metrics, None to disable
+BINANCE_WS_ORDERS = False  # Sends the Binance orders on the websocket trading API, REST is used as fallback
+
 logger = logging.getLogger()
 
 logger.setLevel(logging.DEBUG)
@@ -25,17 +32,51 @@ logger.addHandler(stream_handler)
 logger.addHandler(file_handler)
 
 if __name__ == "__main__":
+    journal = TradeJournal()
+
+    if METRICS_PORT is not None:
+        metrics = Metrics()
+        metrics.add_gauge("queue_depth", "", lambda: journal.queue_size, "journal")
+        metrics_server = MetricsServer(metrics, METRICS_PORT)
+        metrics_server.start()
+    else:
+        metrics = None
+        metrics_server = None
+
+    if RECORD_MARKET_DATA:
+        binance_recorder = MarketDataRecorder("../recordings/binance_spot")
+        bitmex_recorder = MarketDataRecorder("../recordings/bitmex")
+    else:
+        binance_recorder = None
+        bitmex_recorder = None
+
     binance = BinanceClient(
         BINANCE_SPOT_KEY_TESTNET,
         BINANCE_SPOT_SECRET_TESTNET,
         testnet=True,
-        futures=False)
+        futures=False,
+        journal=journal,
+        recorder=binance_recorder,
+        metrics=metrics,
+        ws_orders=BINANCE_WS_ORDERS)
 
     bitmex = BitmexClient(
         BITMEX_KEY,
         BITMEX_SECRET,
-        testnet=True
+        testnet=True,
+        journal=journal,
+        recorder=bitmex_recorder,
+        metrics=metrics
     )
 
     root = Root(binance, bitmex)
     root.mainloop()
+
+    journal.close()  # Writes the trades and orders still waiting in the queue
+
+    for recorder in [binance_recorder, bitmex_recorder]:
+        if recorder is not None:
+            recorder.close()
+
+    if metrics_server is not None:
+        metrics_server.stop()
@@ -1,59 +1,124 @@
-import dateutil.parser
 import datetime
+import decimal
+import functools
+import math
+import typing
+
+import dateutil.parser
 
 BITMEX_MULTIPLIER = 0.00000001
 BITMEX_TF_MINUTES = {"1m": 1, "5m": 5, "1h": 60, "1d": 1440}
 
+QUANTIZE_TOLERANCE = 5e-16  # Relative, above the float error of value / step, below the last of 15 significant digits
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MILLISECOND = datetime.timedelta(milliseconds=1)
+
+# The models are built by thousands (contracts, historical candles): __slots__ instead of a __dict__ per instance,
+# and one constructor per exchange instead of a test of the exchange name for every object.
+
+
+def iso_to_ms(timestamp: str) -> int:
+
+    """
+    Bitmex timestamp, e.g. 2021-05-01T12:00:00.000Z, to milliseconds. datetime.fromisoformat() is much faster than
+    dateutil but only reads the formats written by datetime.isoformat() before Python 3.11.
+    :param timestamp:
+    :return:
+    """
+
+    try:
+        dt = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except ValueError:
+        dt = dateutil.parser.isoparse(timestamp)
+
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+
+    return (dt - EPOCH) // MILLISECOND
+
 
 class Balance:
-    def __init__(self, info, exchange):
-        if exchange == "binance_futures":
-            self.initial_margin = float(info["initialMargin"])
-            self.maintenance_margin = float(info["maintMargin"])
-            self.margin_balance = float(info["marginBalance"])
-            self.wallet_balance = float(info["walletBalance"])
-            self.unrealized_pnl = float(info["unrealizedProfit"])
-        elif exchange == "binance_spot":
-            self.free = float(info["free"])
-            self.locked = float(info["locked"])
-        elif exchange == "bitmex":
-            self.initial_margin = info["initMargin"] * BITMEX_MULTIPLIER
-            self.maintenance_margin = info["maintMargin"] * BITMEX_MULTIPLIER
-            self.margin_balance = info["marginBalance"] * BITMEX_MULTIPLIER
-            self.wallet_balance = info["walletBalance"] * BITMEX_MULTIPLIER
-            self.unrealized_pnl = info["unrealisedPnl"] * BITMEX_MULTIPLIER
+    __slots__ = ("initial_margin", "maintenance_margin", "margin_balance", "wallet_balance", "unrealized_pnl", "free",
+                 "locked")
+
+    def __init__(self, initial_margin: typing.Optional[float] = None,
+                 maintenance_margin: typing.Optional[float] = None, margin_balance: typing.Optional[float] = None,
+                 wallet_balance: typing.Optional[float] = None,
+                 unrealized_pnl: typing.Optional[float] = None, free: typing.Optional[float] = None,
+                 locked: typing.Optional[float] = None):
+
+        """
+        Margin account (Binance Futures, Bitmex) or spot asset (Binance Spot): the fields of the other kind are None.
+        """
+
+        self.initial_margin = initial_margin
+        self.maintenance_margin = maintenance_margin
+        self.margin_balance = margin_balance
+        self.wallet_balance = wallet_balance
+        self.unrealized_pnl = unrealized_pnl
+        self.free = free
+        self.locked = locked
+
+    @classmethod
+    def from_binance_futures(cls, info: typing.Dict) -> "Balance":
+        return cls(float(info["initialMargin"]), float(info["maintMargin"]), float(info["marginBalance"]),
+                   float(info["walletBalance"]), float(info["unrealizedProfit"]))
+
+    @classmethod
+    def from_binance_spot(cls, info: typing.Dict) -> "Balance":
+        return cls(free=float(info["free"]), locked=float(info["locked"]))
+
+    @classmethod
+    def from_bitmex(cls, info: typing.Dict) -> "Balance":
+        return cls(info["initMargin"] * BITMEX_MULTIPLIER, info["maintMargin"] * BITMEX_MULTIPLIER,
+                   info["marginBalance"] * BITMEX_MULTIPLIER, info["walletBalance"] * BITMEX_MULTIPLIER,
+                   info["unrealisedPnl"] * BITMEX_MULTIPLIER)
 
 
 class Candle:
-    def __init__(self, candle_info, timeframe, exchange):
-        if exchange in ["binance_futures", "binance_spot"]:
-            self.timestamp = candle_info[0]
-            self.open = float(candle_info[1])
-            self.high = float(candle_info[2])
-            self.low = float(candle_info[3])
-            self.close = float(candle_info[4])
-            self.volume = float(candle_info[5])
-
-        elif exchange == "bitmex":
-            self.timestamp = dateutil.parser.isoparse(candle_info["timestamp"])
-            self.timestamp = self.timestamp - datetime.timedelta(minutes=BITMEX_TF_MINUTES[timeframe])
-            self.timestamp = int(self.timestamp.timestamp() * 1000)
-            self.open = candle_info["open"]
-            self.high = candle_info["high"]
-            self.low = candle_info["low"]
-            self.close = candle_info["close"]
-            self.volume = candle_info["volume"]
-
-        elif exchange == "parse_trade":
-            self.timestamp = candle_info["ts"]
-            self.open = candle_info["open"]
-            self.high = candle_info["high"]
-            self.low = candle_info["low"]
-            self.close = candle_info["close"]
-            self.volume = candle_info["volume"]
-
-
-def tick_to_decimals(tick_size: float) -> int:
+    __slots__ = ("timestamp", "open", "high", "low", "close", "volume")
+
+    def __init__(self, timestamp: int, open_price: float, high: float, low: float, close: float, volume: float):
+
+        """
+        :param timestamp: Open time in ms
+        """
+
+        self.timestamp = timestamp
+        self.open = open_price
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def from_binance_kline(cls, kline: typing.List) -> "Candle":
+        return cls(kline[0], float(kline[1]), float(kline[2]), float(kline[3]), float(kline[4]), float(kline[5]))
+
+    @classmethod
+    def from_bitmex_bucket(cls, bucket: typing.Dict, timeframe: str) -> "Candle":
+
+        """
+        :param bucket:
+        :param timeframe: The timestamp of a Bitmex bucket is its close time
+        :return:
+        """
+
+        return cls(iso_to_ms(bucket["timestamp"]) - BITMEX_TF_MINUTES[timeframe] * 60_000, bucket["open"],
+                   bucket["high"], bucket["low"], bucket["close"], bucket["volume"])
+
+    @classmethod
+    def from_binance_klines(cls, klines: typing.List[typing.List]) -> typing.List["Candle"]:
+        return [cls(k[0], float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5])) for k in klines]
+
+    @classmethod
+    def from_bitmex_buckets(cls, buckets: typing.List[typing.Dict], timeframe: str) -> typing.List["Candle"]:
+        return [cls.from_bitmex_bucket(bucket, timeframe) for bucket in buckets]
+
+
+@functools.lru_cache(maxsize=None)
+def tick_to_decimals(tick_size: float) -> int:  # Cached: a few tick sizes are shared by all the contracts
     tick_size_str = "{0: 8f}".format(tick_size)
 
     while tick_size_str[-1] == "0":
@@ -66,66 +131,180 @@ def tick_to_decimals(tick_size: float) -> int:
         return 0
 
 
+class Quantizer:
+    __slots__ = ("step", "decimals", "_units", "_scale", "_integral", "_template")
+
+    def __init__(self, step: typing.Union[int, float]):
+
+        """
+        Rounds prices or quantities to a multiple of a tick or lot size, shared by the contracts with the same step.
+        The step is held as an integer number of units of 10^-decimals, so the result is the float closest to the
+        exact decimal multiple of the step, without the float errors of round(int(q / lot_size) * lot_size, 8)
+        (int(0.3 / 0.1) is 2). Values within QUANTIZE_TOLERANCE of a multiple are treated as that multiple, which
+        matches the Decimal rounding of repr(value) for values of up to 15 significant digits and 10^12 steps (see
+        tests/test_quantizer.py). Values with more digits, the result of a float computation, are moved to a multiple
+        closer than the tolerance: 40000.00000000999 is floored to 40000.00000001 with a 1e-8 step.
+        :param step: Tick size or lot size. If it is an int (Bitmex contract numbers), the results are ints too
+        """
+
+        exact = decimal.Decimal(repr(step)).normalize()
+
+        self.decimals = max(-exact.as_tuple().exponent, 0)
+        self._scale = 10 ** self.decimals
+        self._units = int(exact * self._scale)
+        self._integral = isinstance(step, int)
+        self._template = "%." + str(self.decimals) + "f"  # Fixed point, avoids the scientific notation of 1e-05
+        self.step = self._value(1)
+
+    def _value(self, steps_nb: int) -> typing.Union[int, float]:
+        if self._integral:
+            return steps_nb * self._units
+        return steps_nb * self._units / self._scale  # Division of two ints, correctly rounded
+
+    def floor(self, value: float) -> typing.Union[int, float]:
+
+        """
+        Largest multiple of the step below the value, e.g. for a quantity that mustn't exceed the balance.
+        """
+
+        steps = value * self._scale / self._units
+        return self._value(math.floor(steps + abs(steps) * QUANTIZE_TOLERANCE))
+
+    def round(self, value: float) -> typing.Union[int, float]:
+
+        """
+        Nearest multiple of the step, halfway values going to the even multiple as with round().
+        """
+
+        steps = value * self._scale / self._units
+        steps_nb = math.floor(steps)
+        excess = steps - steps_nb - 0.5
+        tolerance = abs(steps) * QUANTIZE_TOLERANCE
+
+        if excess > tolerance or (excess >= -tolerance and steps_nb % 2 == 1):
+            steps_nb += 1
+
+        return self._value(steps_nb)
+
+    def format(self, value: float) -> str:
+
+        """
+        :param value: Already a multiple of the step, e.g. returned by floor() or round()
+        :return: With the decimals of the step, as the exchanges expect it in the order parameters
+        """
+
+        return self._template % value
+
+
+@functools.lru_cache(maxsize=None, typed=True)
+def step_quantizer(step: typing.Union[int, float]) -> Quantizer:  # Cached as tick_to_decimals, int steps kept apart
+    return Quantizer(step)
+
+
 class Contract:
-    def __init__(self, contract_info, exchange):
-        if exchange == "binance_futures":
-            self.symbol = contract_info["symbol"]
-            self.base_asset = contract_info["baseAsset"]
-            self.quote_asset = contract_info["quoteAsset"]
-            self.price_decimals = contract_info["pricePrecision"]
-            self.quantity_decimals = contract_info["quantityPrecision"]
-            self.tick_size = 1 / pow(10, contract_info["pricePrecision"])
-            self.lot_size = 1 / pow(10, contract_info["quantityPrecision"])
-        elif exchange == "binance_spot":
-            self.symbol = contract_info['symbol']
-            self.base_asset = contract_info['baseAsset']
-            self.quote_asset = contract_info['quoteAsset']
-            for b_filter in contract_info['filters']:
-                if b_filter['filterType'] == 'PRICE_FILTER':
-                    self.tick_size = float(b_filter['tickSize'])
-                    self.price_decimals = tick_to_decimals(float(b_filter['tickSize']))
-                if b_filter['filterType'] == 'LOT_SIZE':
-                    self.lot_size = float(b_filter['stepSize'])
-                    self.quantity_decimals = tick_to_decimals(float(b_filter['stepSize']))
-
-        elif exchange == "bitmex":
-            self.symbol = contract_info["symbol"]
-            self.base_asset = contract_info["rootSymbol"]
-            self.quote_asset = contract_info["quoteCurrency"]
-            self.price_decimals = tick_to_decimals(contract_info["tickSize"])
-            self.quantity_decimals = tick_to_decimals(contract_info["lotSize"])
-            self.tick_size = contract_info["tickSize"]
-            self.lot_size = contract_info["lotSize"]
-            self.quanto = contract_info["isQuanto"]
-            self.inverse = contract_info["isInverse"]
-
-            self.multiplier = contract_info["multiplier"] * BITMEX_MULTIPLIER
-
-            if self.inverse:
-                self.multiplier *= -1
+    __slots__ = ("symbol", "base_asset", "quote_asset", "price_decimals", "quantity_decimals", "tick_size", "lot_size",
+                 "quanto", "inverse", "multiplier", "exchange", "price_quantizer", "quantity_quantizer")
+
+    def __init__(self, symbol: str, base_asset: str, quote_asset: str, price_decimals: int, quantity_decimals: int,
+                 tick_size: float, lot_size: float, exchange: str, quanto: bool = False, inverse: bool = False,
+                 multiplier: float = 1):
+
+        """
+        :param exchange: binance_futures, binance_spot, bitmex
+        :param quanto: Bitmex only, as inverse and multiplier
+        """
+
+        self.symbol = symbol
+        self.base_asset = base_asset
+        self.quote_asset = quote_asset
+        self.price_decimals = price_decimals
+        self.quantity_decimals = quantity_decimals
+        self.tick_size = tick_size
+        self.lot_size = lot_size
         self.exchange = exchange
+        self.quanto = quanto
+        self.inverse = inverse
+        self.multiplier = multiplier
 
+        # Built once when the contracts are loaded, instead of at every order
+        self.price_quantizer = step_quantizer(tick_size) if tick_size else None
+        self.quantity_quantizer = step_quantizer(lot_size) if lot_size else None
+
+    @classmethod
+    def from_binance_futures(cls, info: typing.Dict) -> "Contract":
+        return cls(info["symbol"], info["baseAsset"], info["quoteAsset"], info["pricePrecision"],
+                   info["quantityPrecision"], 1 / pow(10, info["pricePrecision"]),
+                   1 / pow(10, info["quantityPrecision"]), "binance_futures")
+
+    @classmethod
+    def from_binance_spot(cls, info: typing.Dict) -> "Contract":
+        tick_size = None
+        lot_size = None
+
+        for b_filter in info['filters']:
+            if b_filter['filterType'] == 'PRICE_FILTER':
+                tick_size = float(b_filter['tickSize'])
+            elif b_filter['filterType'] == 'LOT_SIZE':
+                lot_size = float(b_filter['stepSize'])
+
+        return cls(info['symbol'], info['baseAsset'], info['quoteAsset'],
+                   tick_to_decimals(tick_size) if tick_size is not None else None,
+                   tick_to_decimals(lot_size) if lot_size is not None else None, tick_size, lot_size, "binance_spot")
+
+    @classmethod
+    def from_bitmex(cls, info: typing.Dict) -> "Contract":
+        multiplier = info["multiplier"] * BITMEX_MULTIPLIER
+
+        if info["isInverse"]:
+            multiplier *= -1
+
+        return cls(info["symbol"], info["rootSymbol"], info["quoteCurrency"], tick_to_decimals(info["tickSize"]),
+                   tick_to_decimals(info["lotSize"]), info["tickSize"], info["lotSize"], "bitmex", info["isQuanto"],
+                   info["isInverse"], multiplier)
+
+    @classmethod
+    def from_exchange(cls, info: typing.Dict, exchange: str) -> "Contract":
+
+        """
+        For the callers that don't know the exchange in advance, e.g. the replay of a recording.
+        :param info:
+        :param exchange: binance_futures, binance_spot, bitmex
+        :return:
+        """
 
-class OrderStatus:
-    def __init__(self, order_info, exchange):
         if exchange == "binance_futures":
-            self.order_id = order_info['orderId']
-            self.status = order_info['status'].lower()
-            self.avg_price = float(order_info['avgPrice'])
-            self.executed_qty = float(order_info['executedQty'])
+            return cls.from_binance_futures(info)
         elif exchange == "binance_spot":
-            self.order_id = order_info['orderId']
-            self.status = order_info['status'].lower()
-            self.avg_price = float(order_info['avgPrice'])
-            self.executed_qty = float(order_info['executedQty'])
-        elif exchange == "bitmex":
-            self.order_id = order_info['orderID']
-            self.status = order_info['ordStatus'].lower()
-            self.avg_price = order_info['avgPx']
-            self.executed_qty = order_info['cumQty']
+            return cls.from_binance_spot(info)
+        return cls.from_bitmex(info)
+
+
+class OrderStatus:
+    __slots__ = ("order_id", "status", "avg_price", "executed_qty")
+
+    def __init__(self, order_id: typing.Union[int, str], status: str, avg_price: float, executed_qty: float):
+
+        """
+        :param status: Lower case, e.g. new, filled, canceled
+        """
+
+        self.order_id = order_id
+        self.status = status
+        self.avg_price = avg_price
+        self.executed_qty = executed_qty
+
+    @classmethod
+    def from_binance(cls, info: typing.Dict) -> "OrderStatus":  # Same fields on Futures and Spot
+        return cls(info['orderId'], info['status'].lower(), float(info['avgPrice']), float(info['executedQty']))
+
+    @classmethod
+    def from_bitmex(cls, info: typing.Dict) -> "OrderStatus":
+        return cls(info['orderID'], info['ordStatus'].lower(), info['avgPx'], info['cumQty'])
 
 
 class Trade:
+    __slots__ = ("time", "contract", "strategy", "side", "entry_price", "status", "pnl", "quantity", "entry_id")
+
     def __init__(self, trade_info):
         self.time: int = trade_info["time"]
         self.contract: Contract = trade_info["contract"]
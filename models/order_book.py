@@ -0,0 +1,224 @@
+import bisect
+import threading
+import typing
+
+MAX_BUFFERED_UPDATES = 1000
+MAX_DEPTH = 1000  # Levels kept per side, as many as the largest snapshot
+
+
+class OrderBook:
+    def __init__(self, symbol: str, futures: bool):
+
+        """
+        Local L2 order book of a Binance symbol, built from a REST snapshot and kept up to date with the diff updates
+        of the <symbol>@depth@100ms stream.
+        https://binance-docs.github.io/apidocs/futures/en/#how-to-manage-a-local-order-book-correctly
+        https://binance-docs.github.io/apidocs/spot/en/#how-to-manage-a-local-order-book-correctly
+        The prices of each side are kept sorted in a list with the best price first (the bids are stored negated),
+        and their quantities in a dictionary. A quantity change is a dictionary update; a level that appears or
+        disappears is found by bisection, O(log n), but also shifts the list behind it, O(n). Each side is therefore
+        capped to MAX_DEPTH levels, the furthest from the best price being dropped, which bounds that shift.
+        Updated by the websocket thread and the snapshot thread, read by the strategies and the interface: every
+        access goes through self.lock.
+        :param symbol:
+        :param futures: The update id sequencing differs between Futures and Spot
+        """
+
+        self.symbol = symbol
+        self.futures = futures
+        self.lock = threading.Lock()
+
+        self.last_update_id: typing.Optional[int] = None  # None until a snapshot is applied
+        self.snapshot_requested = False
+        self.resyncs = 0
+
+        self._bid_keys: typing.List[float] = []  # Negated bid prices, increasing: the best bid first
+        self._ask_keys: typing.List[float] = []  # Ask prices, increasing: the best ask first
+        self._bid_quantities: typing.Dict[float, float] = dict()
+        self._ask_quantities: typing.Dict[float, float] = dict()
+
+        self._buffer: typing.List[typing.Dict] = []  # Updates received while waiting for the snapshot
+        self._first_update = True  # The first update after the snapshot is checked differently
+
+    @property
+    def synced(self) -> bool:
+        return self.last_update_id is not None
+
+    def reset(self):
+
+        """
+        Forget the levels, the updates are buffered again until the next snapshot.
+        :return:
+        """
+
+        self.last_update_id = None
+        self._bid_keys.clear()
+        self._ask_keys.clear()
+        self._bid_quantities.clear()
+        self._ask_quantities.clear()
+        self._buffer.clear()
+
+    def set_snapshot(self, snapshot: typing.Dict) -> bool:
+
+        """
+        :param snapshot: Response of the /depth endpoint
+        :return: False if the buffered updates don't follow the snapshot, a newer snapshot is then needed
+        """
+
+        buffered = self._buffer
+        self._buffer = []
+        self.reset()
+
+        for price, quantity in snapshot['bids']:
+            self._set_level(self._bid_keys, self._bid_quantities, -float(price), float(quantity))
+        for price, quantity in snapshot['asks']:
+            self._set_level(self._ask_keys, self._ask_quantities, float(price), float(quantity))
+
+        self.last_update_id = snapshot['lastUpdateId']
+        self._first_update = True
+
+        for data in buffered:
+            if not self.update(data):
+                return False
+
+        return True
+
+    def update(self, data: typing.Dict) -> bool:
+
+        """
+        :param data: depthUpdate message
+        :return: False if an update is missing, the book is then reset and a new snapshot is needed
+        """
+
+        if self.last_update_id is None:
+            if len(self._buffer) < MAX_BUFFERED_UPDATES:
+                self._buffer.append(data)
+            else:  # The snapshot takes too long, the oldest updates will be older than the next snapshot anyway
+                self._buffer = self._buffer[MAX_BUFFERED_UPDATES // 2:]
+                self._buffer.append(data)
+            return True
+
+        first_id = data['U']
+        last_id = data['u']
+
+        if self.futures:
+            if last_id < self.last_update_id:  # Already contained in the snapshot
+                return True
+            if self._first_update:
+                in_sequence = first_id <= self.last_update_id <= last_id
+            else:
+                in_sequence = data['pu'] == self.last_update_id
+        else:
+            if last_id <= self.last_update_id:
+                return True
+            if self._first_update:
+                in_sequence = first_id <= self.last_update_id + 1 <= last_id
+            else:
+                in_sequence = first_id == self.last_update_id + 1
+
+        if not in_sequence:
+            self.reset()
+            self.resyncs += 1
+            return False
+
+        for price, quantity in data['b']:
+            self._set_level(self._bid_keys, self._bid_quantities, -float(price), float(quantity))
+        for price, quantity in data['a']:
+            self._set_level(self._ask_keys, self._ask_quantities, float(price), float(quantity))
+
+        self.last_update_id = last_id
+        self._first_update = False
+
+        return True
+
+    @staticmethod
+    def _set_level(keys: typing.List[float], quantities: typing.Dict[float, float], key: float, quantity: float):
+        if quantity == 0:
+            if quantities.pop(key, None) is not None:
+                del keys[bisect.bisect_left(keys, key)]
+        else:
+            if key not in quantities:
+                bisect.insort(keys, key)
+                if len(keys) > MAX_DEPTH:
+                    furthest = keys.pop()
+                    if furthest == key:  # Beyond the tracked depth
+                        return
+                    del quantities[furthest]
+            quantities[key] = quantity
+
+    @property
+    def best_bid(self) -> typing.Optional[float]:
+        return -self._bid_keys[0] if len(self._bid_keys) > 0 else None
+
+    @property
+    def best_ask(self) -> typing.Optional[float]:
+        return self._ask_keys[0] if len(self._ask_keys) > 0 else None
+
+    def bids(self, levels: int) -> typing.List[typing.Tuple[float, float]]:
+
+        """
+        :param levels:
+        :return: (price, quantity) of the best bids, the highest price first
+        """
+
+        return [(-key, self._bid_quantities[key]) for key in self._bid_keys[:levels]]
+
+    def asks(self, levels: int) -> typing.List[typing.Tuple[float, float]]:
+
+        """
+        :param levels:
+        :return: (price, quantity) of the best asks, the lowest price first
+        """
+
+        return [(key, self._ask_quantities[key]) for key in self._ask_keys[:levels]]
+
+    def weighted_mid(self, levels: int = 5) -> typing.Optional[float]:
+
+        """
+        Mid price that leans towards the side with less quantity, the one the price is more likely to move through:
+        the average prices of the best levels of each side, each weighted by the quantity of the other side.
+        :param levels: Number of levels of each side taken into account
+        :return: None if a side is empty
+        """
+
+        bids = self.bids(levels)
+        asks = self.asks(levels)
+
+        if len(bids) == 0 or len(asks) == 0:
+            return None
+
+        bid_quantity = sum(q for p, q in bids)
+        ask_quantity = sum(q for p, q in asks)
+        bid_average = sum(p * q for p, q in bids) / bid_quantity
+        ask_average = sum(p * q for p, q in asks) / ask_quantity
+
+        return (bid_average * ask_quantity + ask_average * bid_quantity) / (bid_quantity + ask_quantity)
+
+    def fill_price(self, side: str, quantity: float) -> typing.Optional[float]:
+
+        """
+        Average price of a market order of this quantity, if it were filled against the current book.
+        :param side: buy (filled against the asks) or sell (against the bids)
+        :param quantity:
+        :return: None if the book doesn't hold that much quantity
+        """
+
+        if quantity <= 0:
+            return None
+
+        if side.lower() == "buy":
+            keys, quantities, sign = self._ask_keys, self._ask_quantities, 1
+        else:
+            keys, quantities, sign = self._bid_keys, self._bid_quantities, -1
+
+        remaining = quantity
+        cost = 0.0
+
+        for key in keys:
+            filled = min(remaining, quantities[key])
+            cost += filled * key * sign
+            remaining -= filled
+            if remaining <= 0:
+                return cost / quantity
+
+        return None
@@ -0,0 +1,205 @@
+import math
+import struct
+import threading
+import time
+import typing
+
+NAN = float("nan")
+
+MAX_READ_ATTEMPTS = 100
+
+# Row of a symbol: sequence number, bid, ask, bid size, ask size, update id, exchange time in ms, reception time in ms.
+# 64 bytes, one cache line.
+
+ROW = struct.Struct("<Q4d3q")
+SEQ = struct.Struct("<Q")
+VALUES = struct.Struct("<4d3q")  # The row after its sequence number
+SEQ_BID_ASK = struct.Struct("<Q2d")
+BID_ASK = struct.Struct("<2d")
+
+
+class PriceTable:
+    def __init__(self, capacity: int = 64):
+
+        """
+        Top of book of every symbol of a connector, in one preallocated buffer of fixed size rows instead of one small
+        dictionary per symbol: the values are packed as machine numbers, so an update allocates nothing and a symbol
+        takes 64 bytes.
+        Read by the interface and the strategies without lock: every row starts with a sequence number, odd while the
+        row is being written. A reader copies the row between two reads of its sequence number and tries again if the
+        number was odd or has changed (seqlock). The writers take a lock, the websocket thread not being the only one
+        (REST snapshots of get_bid_ask()): two concurrent writes of a row would let a reader accept a torn row, and
+        two additions of the same symbol would give it two rows.
+        The missing prices and sizes are NaN, returned as None by the readers, e.g. before the first Bitmex bid.
+        Can be used as a read-only dictionary of {'bid': ..., 'ask': ...} snapshots, like the prices dictionary it
+        replaces.
+        :param capacity: Initial number of rows, doubled when full
+        """
+
+        self._offsets: typing.Dict[str, int] = dict()
+        self.symbols: typing.List[str] = []
+        self._capacity = 0
+        self._buf = bytearray()
+        self._write_lock = threading.Lock()  # Held by set() and update(), also while they add a symbol
+
+        self._grow(max(capacity, 1))
+
+    def _grow(self, rows_nb: int):
+
+        """
+        The buffer may move when it grows, the readers don't keep references to it between two reads.
+        :param rows_nb: Rows to add
+        :return:
+        """
+
+        empty_row = ROW.pack(0, NAN, NAN, NAN, NAN, 0, 0, 0)
+        self._buf.extend(empty_row * rows_nb)
+        self._capacity += rows_nb
+
+    def _add(self, symbol: str) -> int:  # With the write lock
+        row = len(self.symbols)
+        if row == self._capacity:
+            self._grow(self._capacity)
+
+        offset = row * ROW.size
+        self.symbols.append(symbol)
+        self._offsets[symbol] = offset  # Last: the row is ready when the readers can find it
+
+        return offset
+
+    def set(self, symbol: str, bid: float, ask: float, bid_size: float, ask_size: float, update_id: int,
+            exchange_ts: int, local_ts: int) -> bool:
+
+        """
+        Writer side: replaces the whole row of a symbol, e.g. with a Binance bookTicker message.
+        :param symbol:
+        :param bid:
+        :param ask:
+        :param bid_size:
+        :param ask_size:
+        :param update_id: Exchange update id of the book
+        :param exchange_ts: Exchange time of the update in ms
+        :param local_ts: Reception time in ms
+        :return: True if the bid or the ask changed, or if the symbol is new
+        """
+
+        with self._write_lock:
+            buf = self._buf
+            offset = self._offsets.get(symbol)
+            if offset is None:
+                offset = self._add(symbol)
+
+            seq, previous_bid, previous_ask = SEQ_BID_ASK.unpack_from(buf, offset)
+
+            SEQ.pack_into(buf, offset, seq + 1)  # Odd: the readers wait for the end of the update
+            VALUES.pack_into(buf, offset + 8, bid, ask, bid_size, ask_size, update_id, exchange_ts, local_ts)
+            SEQ.pack_into(buf, offset, seq + 2)
+
+            # Always True for a new symbol, NaN differs from anything
+            return bid != previous_bid or ask != previous_ask
+
+    def update(self, symbol: str, bid: typing.Optional[float], ask: typing.Optional[float],
+               bid_size: typing.Optional[float] = None, ask_size: typing.Optional[float] = None,
+               update_id: typing.Optional[int] = None, exchange_ts: typing.Optional[int] = None,
+               local_ts: typing.Optional[int] = None) -> bool:
+
+        """
+        Writer side, like set() but the values left to None are unchanged, e.g. for the partial Bitmex updates.
+        :return: True if the bid or the ask changed, or if the symbol is new
+        """
+
+        with self._write_lock:
+            buf = self._buf
+            offset = self._offsets.get(symbol)
+            new = offset is None
+            if new:
+                offset = self._add(symbol)
+
+            seq, previous_bid, previous_ask, previous_bid_size, previous_ask_size, previous_update_id, \
+                previous_exchange_ts, previous_local_ts = ROW.unpack_from(buf, offset)
+
+            changed = new or (bid is not None and bid != previous_bid) or (ask is not None and ask != previous_ask)
+
+            SEQ.pack_into(buf, offset, seq + 1)
+            VALUES.pack_into(buf, offset + 8,
+                             previous_bid if bid is None else bid,
+                             previous_ask if ask is None else ask,
+                             previous_bid_size if bid_size is None else bid_size,
+                             previous_ask_size if ask_size is None else ask_size,
+                             previous_update_id if update_id is None else update_id,
+                             previous_exchange_ts if exchange_ts is None else exchange_ts,
+                             previous_local_ts if local_ts is None else local_ts)
+            SEQ.pack_into(buf, offset, seq + 2)
+
+            return changed
+
+    def bid_ask(self, symbol: str) -> typing.Tuple[typing.Optional[float], typing.Optional[float]]:
+
+        """
+        Consistent bid and ask of a symbol.
+        :param symbol:
+        :return: (None, None) if the symbol has never been updated
+        """
+
+        offset = self._offsets.get(symbol)
+        if offset is None:
+            return None, None
+
+        for attempt in range(MAX_READ_ATTEMPTS):
+            seq, bid, ask = SEQ_BID_ASK.unpack_from(self._buf, offset)
+            if seq % 2 == 0 and SEQ.unpack_from(self._buf, offset)[0] == seq:
+                return _optional(bid), _optional(ask)
+            time.sleep(0)  # Lets the writer thread finish its update
+
+        raise RuntimeError(f"Price table: {symbol} row still updating after {MAX_READ_ATTEMPTS} reads")
+
+    def snapshot(self, symbol: str) -> typing.Optional[typing.Dict[str, typing.Union[float, int, None]]]:
+
+        """
+        Consistent copy of the whole row of a symbol.
+        :param symbol:
+        :return: None if the symbol has never been updated
+        """
+
+        offset = self._offsets.get(symbol)
+        if offset is None:
+            return None
+
+        for attempt in range(MAX_READ_ATTEMPTS):
+            row = ROW.unpack_from(self._buf, offset)
+            if row[0] % 2 == 0 and SEQ.unpack_from(self._buf, offset)[0] == row[0]:
+                return {"bid": _optional(row[1]), "ask": _optional(row[2]), "bid_size": _optional(row[3]),
+                        "ask_size": _optional(row[4]), "update_id": row[5], "exchange_ts": row[6],
+                        "local_ts": row[7]}
+            time.sleep(0)
+
+        raise RuntimeError(f"Price table: {symbol} row still updating after {MAX_READ_ATTEMPTS} reads")
+
+    @property
+    def memory_size(self) -> int:
+        return len(self._buf)
+
+    # Read-only dictionary interface, for the code written for the former prices dictionary
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._offsets
+
+    def __getitem__(self, symbol: str) -> typing.Dict[str, typing.Union[float, int, None]]:
+        snapshot = self.snapshot(symbol)
+        if snapshot is None:
+            raise KeyError(symbol)
+        return snapshot
+
+    def get(self, symbol: str, default=None) -> typing.Optional[typing.Dict[str, typing.Union[float, int, None]]]:
+        snapshot = self.snapshot(symbol)
+        return snapshot if snapshot is not None else default
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(list(self.symbols))
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+
+def _optional(value: float) -> typing.Optional[float]:
+    return None if math.isnan(value) else value
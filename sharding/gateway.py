@@ -0,0 +1,155 @@
+import logging
+import queue
+import threading
+import time
+import typing
+
+from connectors.binance import BinanceClient
+from connectors.bitmex import BitmexClient
+from db.journal import TradeJournal
+
+logger = logging.getLogger()
+
+# Methods of the exchange clients the workers can call through the gateway
+
+CLIENT_METHODS = {"get_contracts", "get_balances", "get_historical_candles", "place_order", "place_orders",
+                  "cancel_order", "get_order_status"}
+JOURNAL_METHODS = {"record_trade", "record_order"}
+
+
+class RestBinanceClient(BinanceClient):
+    def _start_ws(self):
+        return  # The market data process has the websocket connection
+
+
+class RestBitmexClient(BitmexClient):
+    def _start_ws(self):
+        return
+
+
+def create_rest_client(exchange: str, public_key: str, secret_key: str, base_url: typing.Optional[str] = None,
+                       journal: typing.Optional[TradeJournal] = None) -> typing.Union[BinanceClient, BitmexClient]:
+    if exchange == "bitmex":
+        return RestBitmexClient(public_key, secret_key, testnet=True, journal=journal, base_url=base_url)
+    return RestBinanceClient(public_key, secret_key, testnet=True, futures=exchange == "binance_futures",
+                             journal=journal, base_url=base_url)
+
+
+class _RateLimiter:
+    def __init__(self, rate: float):
+
+        """
+        Token bucket: bursts of up to one second of requests, then rate requests per second.
+        :param rate: Requests per second
+        """
+
+        self._rate = rate
+        self._tokens = rate
+        self._last = time.monotonic()
+
+    def wait(self):
+        now = time.monotonic()
+        self._tokens = min(self._rate, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+        if self._tokens < 1:
+            time.sleep((1 - self._tokens) / self._rate)
+            self._tokens = 1
+            self._last = time.monotonic()
+
+        self._tokens -= 1
+
+
+def run_gateway(exchange: str, public_key: str, secret_key: str, requests: "queue.Queue",
+                responses: typing.List["queue.Queue"], max_rate: float, journal_path: typing.Optional[str],
+                base_url: typing.Optional[str] = None):
+
+    """
+    Process owning the REST session and the API keys: the requests of every worker go through one queue, so the
+    rate limit of the account is respected whatever the number of workers. The trades and orders of the journal are
+    written from here as well, SQLite allowing one writer at a time.
+    :param exchange: binance_futures, binance_spot, bitmex
+    :param public_key:
+    :param secret_key:
+    :param requests: (worker id, method, args), None to stop
+    :param responses: Result of the calls of each worker, in its order
+    :param max_rate: REST requests per second
+    :param journal_path: None to not record the trades
+    :param base_url: Replaces the REST URL of the exchange
+    :return:
+    """
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s gateway :: %(message)s')
+
+    journal = TradeJournal(journal_path) if journal_path is not None else None
+    client = create_rest_client(exchange, public_key, secret_key, base_url, journal)
+    limiter = _RateLimiter(max_rate)
+    requests_nb = 0
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+
+        worker_id, method, args = request
+
+        if method in JOURNAL_METHODS:  # No response expected
+            if journal is not None:
+                getattr(journal, method)(*args)
+            continue
+
+        result = None
+
+        if method in CLIENT_METHODS:
+            limiter.wait()
+            try:
+                result = getattr(client, method)(*args)
+            except Exception as e:
+                logger.error("Error while calling %s for worker %s: %s", method, worker_id, e)
+            requests_nb += 1
+        else:
+            logger.error("Worker %s called an unknown method: %s", worker_id, method)
+
+        responses[worker_id].put(result)
+
+    if journal is not None:
+        journal.close()
+
+    logger.info("Order gateway stopped after %s requests", requests_nb)
+
+
+class GatewayConnection:
+    def __init__(self, worker_id: int, requests: "queue.Queue", responses: "queue.Queue"):
+
+        """
+        Worker side of the gateway. One call at a time, so that the responses arrive in the order of the calls:
+        the strategies of a worker and their order status timers share the connection.
+        """
+
+        self._worker_id = worker_id
+        self._requests = requests
+        self._responses = responses
+        self._lock = threading.Lock()
+
+    def call(self, method: str, *args) -> typing.Any:
+        with self._lock:
+            self._requests.put((self._worker_id, method, args))
+            return self._responses.get()
+
+    def send(self, method: str, *args):
+        self._requests.put((self._worker_id, method, args))
+
+
+class GatewayJournal:
+
+    # Stands for the TradeJournal in the workers, the records are written by the gateway process
+
+    def __init__(self, connection: GatewayConnection):
+        self._connection = connection
+        self.queue_size = 0
+
+    def record_trade(self, *args):
+        self._connection.send("record_trade", *args)
+
+    def record_order(self, *args):
+        self._connection.send("record_order", *args)
@@ -0,0 +1,106 @@
+import logging
+import time
+import typing
+
+from connectors.binance import BinanceClient
+from connectors.bitmex import BitmexClient
+from sharding.ring import SharedRing, TRADE, BOOK
+
+logger = logging.getLogger()
+
+
+class MarketDataPublisher:
+    def __init__(self, ring_names: typing.List[str], routes: typing.Dict[str, typing.Tuple[int, int]]):
+
+        """
+        Writes the trades and the top of book of each symbol in the ring of the worker that has its strategies.
+        :param ring_names: One ring per worker
+        :param routes: Symbol: (worker index, symbol id)
+        """
+
+        self._rings = [SharedRing(name) for name in ring_names]
+        self._routes = {symbol: (self._rings[worker], symbol_id) for symbol, (worker, symbol_id) in routes.items()}
+
+    def trade(self, symbol: str, price: float, quantity: float, timestamp: int):
+        route = self._routes.get(symbol)
+        if route is not None:
+            route[0].put(TRADE, route[1], price, quantity, timestamp)
+
+    def book(self, symbol: str, bid: float, ask: float, timestamp: int):
+        route = self._routes.get(symbol)
+        if route is not None and bid is not None and ask is not None:
+            route[0].put(BOOK, route[1], bid, ask, timestamp)
+
+    def close(self):
+        for ring in self._rings:
+            ring.close()
+
+
+class PublishingBinanceClient(BinanceClient):
+
+    # The strategies run in the worker processes: the trades and prices decoded by _on_message() are published
+    # instead of being dispatched to strategies
+
+    def __init__(self, publisher: MarketDataPublisher, *args, **kwargs):
+        self.publisher = publisher
+        super().__init__(*args, **kwargs)
+
+    def _update_pnl(self, symbol: str):
+        self.publisher.book(symbol, *self.prices.bid_ask(symbol), self.clock.time_ms())
+
+    def _dispatch_trade(self, symbol: str, price: float, quantity: float, timestamp: int):
+        self.publisher.trade(symbol, price, quantity, timestamp)
+
+
+class PublishingBitmexClient(BitmexClient):
+    def __init__(self, publisher: MarketDataPublisher, *args, **kwargs):
+        self.publisher = publisher
+        super().__init__(*args, **kwargs)
+
+    def _update_pnl(self, symbol: str):
+        self.publisher.book(symbol, *self.prices.bid_ask(symbol), self.clock.time_ms())
+
+    def _dispatch_trade(self, symbol: str, price: float, size: float, timestamp: int):
+        self.publisher.trade(symbol, price, size, timestamp)
+
+
+def run_market_data(exchange: str, public_key: str, secret_key: str, ring_names: typing.List[str],
+                    routes: typing.Dict[str, typing.Tuple[int, int]], stop, base_url: typing.Optional[str] = None,
+                    wss_url: typing.Optional[str] = None):
+
+    """
+    Process owning the websocket connection: decodes the messages and publishes them to the workers' rings.
+    :param exchange: binance_futures, binance_spot, bitmex
+    :param public_key:
+    :param secret_key:
+    :param ring_names:
+    :param routes: Symbol: (worker index, symbol id)
+    :param stop: multiprocessing Event
+    :param base_url: Replaces the REST URL of the exchange
+    :param wss_url: Replaces the websocket URL of the exchange
+    :return:
+    """
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s market data :: %(message)s')
+
+    publisher = MarketDataPublisher(ring_names, routes)
+
+    if exchange == "bitmex":  # Subscribes to the instrument and trade updates of every symbol when connected
+        client = PublishingBitmexClient(publisher, public_key, secret_key, testnet=True, base_url=base_url,
+                                        wss_url=wss_url)
+    else:
+        client = PublishingBinanceClient(publisher, public_key, secret_key, testnet=True,
+                                         futures=exchange == "binance_futures", base_url=base_url, wss_url=wss_url)
+
+        while not client.ws_connected and not stop.is_set():
+            time.sleep(0.1)
+
+        contracts = [client.contracts[symbol] for symbol in routes if symbol in client.contracts]
+        client.subscribe_channel(contracts, "aggTrade")
+        client.subscribe_channel(contracts, "bookTicker")
+
+    stop.wait()
+
+    client.reconnect = False
+    client.ws.close()
+    publisher.close()
@@ -0,0 +1,161 @@
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import time
+import typing
+
+from sharding.gateway import run_gateway
+from sharding.market_data import run_market_data
+from sharding.ring import SharedRing
+from sharding.worker import run_worker
+
+logger = logging.getLogger()
+
+# Names of the API keys in config.py, as in main.py
+
+CONFIG_KEYS = {
+    "binance_futures": ("BINANCE_FUTURES_KEY_TESTNET", "BINANCE_FUTURES_SECRET_TESTNET"),
+    "binance_spot": ("BINANCE_SPOT_KEY_TESTNET", "BINANCE_SPOT_SECRET_TESTNET"),
+    "bitmex": ("BITMEX_KEY", "BITMEX_SECRET"),
+}
+
+
+def partition(specs: typing.List[typing.Dict],
+              workers_nb: int) -> typing.Tuple[typing.List[typing.List[typing.Dict]], typing.Dict[str, int]]:
+
+    """
+    Spread the strategies over the workers, all the strategies of a symbol in the same worker since they get the same
+    trades: the symbols with the most strategies first, each to the worker with the fewest strategies so far.
+    :param specs:
+    :param workers_nb:
+    :return: Strategies of each worker, worker of each symbol
+    """
+
+    by_symbol = collections.defaultdict(list)
+    for spec in specs:
+        by_symbol[spec["symbol"]].append(spec)
+
+    shards: typing.List[typing.List[typing.Dict]] = [[] for _ in range(min(workers_nb, len(by_symbol)))]
+    workers = dict()
+
+    for symbol, symbol_specs in sorted(by_symbol.items(), key=lambda item: len(item[1]), reverse=True):
+        worker = min(range(len(shards)), key=lambda w: len(shards[w]))
+        shards[worker].extend(symbol_specs)
+        workers[symbol] = worker
+
+    return shards, workers
+
+
+def _load_keys(exchange: str) -> typing.Tuple[str, str]:
+    import config
+
+    key_name, secret_name = CONFIG_KEYS[exchange]
+    return getattr(config, key_name), getattr(config, secret_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the strategies without interface, spread by symbol over worker processes",
+        epilog='Strategies file: [{"strategy": "Technical", "symbol": "BTCUSDT", "timeframe": "1m", '
+               '"balance_pct": 1, "take_profit": 2, "stop_loss": 1, "params": {"ema_fast": 12, "ema_slow": 26, '
+               '"ema_signal": 9, "rsi_length": 14}}, ...]')
+    parser.add_argument("strategies", help="JSON file of the strategies")
+    parser.add_argument("--exchange", default="binance_futures", choices=list(CONFIG_KEYS))
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 1) - 2, 1),
+                        help="Strategy processes, the market data and order gateway processes are added")
+    parser.add_argument("--ring-size", type=int, default=65536, help="Records of the market data ring of a worker")
+    parser.add_argument("--max-requests", type=float, default=10, help="REST requests per second of the gateway")
+    parser.add_argument("--journal", default="../journal.db", help="Trade journal, 'none' to disable")
+    parser.add_argument("--mock", action="store_true", help="Trade on a local mock exchange instead of the testnet")
+    parser.add_argument("--duration", type=float, help="Seconds before stopping, runs until Ctrl+C otherwise")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s supervisor :: %(message)s')
+
+    with open(args.strategies) as f:
+        specs = json.load(f)
+
+    shards, workers = partition(specs, args.workers)
+    symbols = sorted(workers)
+    routes = {symbol: (workers[symbol], symbol_id) for symbol_id, symbol in enumerate(symbols)}
+
+    base_url = None
+    wss_url = None
+    mock = None
+
+    if args.mock:
+        from simulation.mock_exchange import MockExchange
+
+        mock = MockExchange(args.exchange, symbols, message_rate=50 * len(symbols))
+        mock.start()
+        base_url, wss_url = mock.base_url, mock.wss_url
+        public_key, secret_key = "mock", "mock"
+    else:
+        public_key, secret_key = _load_keys(args.exchange)
+
+    journal_path = None if args.journal.lower() == "none" else args.journal
+
+    # Spawned rather than forked: the same on every platform, and no thread of this process is copied half-way
+
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    requests = context.Queue()
+    responses = [context.Queue() for _ in shards]
+    rings = [SharedRing(capacity=args.ring_size) for _ in shards]
+
+    processes = [context.Process(target=run_gateway, name="gateway",
+                                 args=(args.exchange, public_key, secret_key, requests, responses, args.max_requests,
+                                       journal_path, base_url))]
+
+    for worker_id, shard in enumerate(shards):
+        processes.append(context.Process(target=run_worker, name=f"worker-{worker_id}",
+                                          args=(worker_id, args.exchange, shard, symbols, rings[worker_id].name,
+                                                requests, responses[worker_id], stop)))
+
+    processes.append(context.Process(target=run_market_data, name="market-data",
+                                     args=(args.exchange, public_key, secret_key, [r.name for r in rings], routes,
+                                           stop, base_url, wss_url)))
+
+    for process in processes:
+        process.start()
+
+    logger.info("%s strategies on %s symbols spread over %s workers: %s", len(specs), len(symbols), len(shards),
+                [len(shard) for shard in shards])
+
+    started = time.monotonic()
+
+    try:
+        while args.duration is None or time.monotonic() - started < args.duration:
+            time.sleep(1)
+
+            if any(not p.is_alive() for p in processes):
+                logger.error("Stopping, process ended: %s", [p.name for p in processes if not p.is_alive()])
+                break
+    except KeyboardInterrupt:
+        pass
+
+    stop.set()
+    for process in processes[1:]:
+        process.join(15)
+
+    requests.put(None)  # After the workers, which can still record their last orders
+    processes[0].join(15)
+
+    for process in processes:
+        if process.is_alive():  # e.g. a websocket thread waiting for its read timeout
+            logger.warning("%s process still running, terminating it", process.name)
+            process.terminate()
+
+    for ring in rings:
+        logger.info("Ring %s: %s records dropped", ring.name, ring.dropped)
+        ring.close()
+
+    if mock is not None:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import logging
+import time
+import typing
+
+from models.models import *
+from models.price_table import PriceTable
+from connectors.binance import BinanceClient
+from connectors.bitmex import BitmexClient
+from connectors.order_batcher import OrderRequest
+from sharding.gateway import GatewayConnection, GatewayJournal
+from sharding.ring import SharedRing, TRADE
+from strategies.strategies import TechnicalStrategy, BreakoutStrategy
+
+logger = logging.getLogger()
+
+HOUSEKEEPING_INTERVAL = 10  # Seconds
+
+
+class GatewayBroker:
+
+    # Mixin placed before BinanceClient/BitmexClient in the bases of a worker client, like SimulatedBroker: the
+    # requests are sent to the order gateway process, and the market data is read from a shared ring instead of a
+    # websocket connection, so the connector __init__, PNL and dispatch to the strategies run unchanged.
+
+    prices: PriceTable
+
+    def _init_gateway(self, contracts: typing.Dict[str, Contract], connection: GatewayConnection):
+        self._gateway_contracts = contracts
+        self._gateway = connection
+
+    def get_contracts(self) -> typing.Dict[str, Contract]:
+        return self._gateway_contracts
+
+    def get_balances(self) -> typing.Dict[str, Balance]:
+        return self._gateway.call("get_balances")
+
+    def get_historical_candles(self, contract: Contract, interval: str,
+                               start_time: typing.Optional[int] = None) -> typing.List[Candle]:
+        candles = self._gateway.call("get_historical_candles", contract, interval, start_time)
+        return candles if candles is not None else []
+
+    def get_bid_ask(self, contract: Contract) -> typing.Dict[str, float]:
+        return self.prices.get(contract.symbol)
+
+    def get_order_book_snapshot(self, *args, **kwargs) -> typing.Optional[typing.Dict]:
+        return None
+
+    def subscribe_channel(self, *args, **kwargs):
+        return
+
+    def _start_ws(self):
+        return
+
+    def place_order(self, contract: Contract, order_type: str, quantity: float, side: str, price=None,
+                    tif=None) -> typing.Optional[OrderStatus]:
+        return self._gateway.call("place_order", contract, order_type, quantity, side, price, tif)
+
+    def place_orders(self, orders: typing.List[OrderRequest]) -> typing.List[typing.Optional[OrderStatus]]:
+
+        # Sent without their callbacks, which stay in this process
+
+        results = self._gateway.call("place_orders", [OrderRequest(o.contract, o.order_type, o.quantity, o.side, None,
+                                                                    o.price, o.tif) for o in orders])
+        return results if results is not None else [None] * len(orders)
+
+    def cancel_order(self, contract: Contract, order_id) -> typing.Optional[OrderStatus]:
+        return self._gateway.call("cancel_order", contract, order_id)
+
+    def get_order_status(self, contract: Contract, order_id) -> typing.Optional[OrderStatus]:
+        return self._gateway.call("get_order_status", contract, order_id)
+
+
+class WorkerBinanceClient(GatewayBroker, BinanceClient):
+    def __init__(self, contracts: typing.Dict[str, Contract], connection: GatewayConnection, futures: bool):
+        self._init_gateway(contracts, connection)
+        super().__init__("", "", testnet=True, futures=futures, journal=GatewayJournal(connection))
+
+
+class WorkerBitmexClient(GatewayBroker, BitmexClient):
+    def __init__(self, contracts: typing.Dict[str, Contract], connection: GatewayConnection):
+        self._init_gateway(contracts, connection)
+        super().__init__("", "", testnet=True, journal=GatewayJournal(connection))
+
+
+def run_worker(worker_id: int, exchange: str, specs: typing.List[typing.Dict], symbols: typing.List[str],
+               ring_name: str, requests, responses, stop):
+
+    """
+    Process running the strategies of a subset of the symbols.
+    :param worker_id:
+    :param exchange: binance_futures, binance_spot, bitmex
+    :param specs: Strategies of the worker, see sharding/run.py
+    :param symbols: Symbol of each symbol id of the ring records
+    :param ring_name:
+    :param requests: Queue of the order gateway
+    :param responses: Queue of the gateway responses to this worker
+    :param stop: multiprocessing Event
+    :return:
+    """
+
+    logging.basicConfig(level=logging.INFO,
+                        format=f'%(asctime)s %(levelname)s worker {worker_id} :: %(message)s')
+
+    connection = GatewayConnection(worker_id, requests, responses)
+    contracts = connection.call("get_contracts")
+
+    if contracts is None:
+        logger.error("No contracts received from the order gateway, stopping")
+        return
+
+    if exchange == "bitmex":
+        client = WorkerBitmexClient(contracts, connection)
+        exchange_name = "Bitmex"
+    else:
+        client = WorkerBinanceClient(contracts, connection, exchange == "binance_futures")
+        exchange_name = "Binance"
+
+    for b_index, spec in enumerate(specs):
+        contract = contracts.get(spec["symbol"])
+        if contract is None:
+            logger.error("Unknown symbol %s, strategy ignored", spec["symbol"])
+            continue
+
+        if spec["strategy"] == "Technical":
+            strategy_class = TechnicalStrategy
+        else:
+            strategy_class = BreakoutStrategy
+
+        strategy = strategy_class(client, contract, exchange_name, spec["timeframe"], spec["balance_pct"],
+                                  spec["take_profit"], spec["stop_loss"], spec["params"])
+        strategy.candles = client.get_historical_candles(contract, spec["timeframe"])
+
+        if len(strategy.candles) == 0:
+            logger.error("No historical data retrieved for %s, strategy ignored", contract.symbol)
+            continue
+
+        client.strategies[b_index] = strategy
+
+    logger.info("%s strategies started on %s", len(client.strategies),
+                ", ".join(sorted({s.contract.symbol for s in client.strategies.values()})))
+
+    ring = SharedRing(ring_name)
+    next_housekeeping = time.monotonic() + HOUSEKEEPING_INTERVAL
+    records_nb = 0
+
+    while not stop.is_set():
+        records = ring.read()
+
+        if len(records) == 0:
+            time.sleep(0.0005)
+        else:
+            records_nb += len(records)
+
+        for kind, symbol_id, value_1, value_2, timestamp in records:
+            symbol = symbols[symbol_id]
+
+            if kind == TRADE:
+                client._dispatch_trade(symbol, value_1, value_2, timestamp)
+            else:
+                client.prices.update(symbol, value_1, value_2, local_ts=timestamp)
+                client._update_pnl(symbol)
+
+        # Without interface, nothing else empties the logs and the changes to display
+
+        if time.monotonic() >= next_housekeeping:
+            for strategy in client.strategies.values():
+                strategy.logs.clear()
+            client.logs.clear()
+            client.dirty_trades.clear()
+            client.dirty_prices.clear()
+
+            logger.info("%s records processed, %s waiting, %s dropped", records_nb, ring.lag, ring.dropped)
+            next_housekeeping = time.monotonic() + HOUSEKEEPING_INTERVAL
+
+    ring.close()
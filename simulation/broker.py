@@ -0,0 +1,94 @@
+import logging
+import typing
+
+from models.models import *
+from models.price_table import PriceTable
+
+logger = logging.getLogger()
+
+
+class SimulatedBroker:
+
+    # Mixin placed before BinanceClient/BitmexClient in the bases of a replay client: it replaces every method that
+    # would reach the exchange, so that the connector __init__ and _on_message() run unchanged without network.
+    # Market orders are filled immediately at the last trade price processed by the strategies of the symbol.
+
+    platform: str
+    strategies: typing.Dict
+    contracts: typing.Dict[str, Contract]
+    prices: PriceTable
+
+    def _init_broker(self, contracts: typing.Dict[str, Contract], balance: float, quote_asset: str):
+        self._replay_contracts = contracts
+        self._replay_balance = balance
+        self._replay_quote_asset = quote_asset
+
+        self.orders: typing.List[OrderStatus] = []
+        self._order_statuses: typing.Dict[typing.Union[int, str], OrderStatus] = dict()
+
+    def get_contracts(self) -> typing.Dict[str, Contract]:
+        return self._replay_contracts
+
+    def get_balances(self) -> typing.Dict[str, Balance]:
+        if self.platform == "bitmex":
+            margin = self._replay_balance / BITMEX_MULTIPLIER
+            balance = Balance.from_bitmex({"initMargin": 0, "maintMargin": 0, "marginBalance": margin,
+                                           "walletBalance": margin, "unrealisedPnl": 0})
+        elif self.platform == "binance_futures":
+            balance = Balance(0, 0, self._replay_balance, self._replay_balance, 0)
+        else:
+            balance = Balance(free=self._replay_balance, locked=0)
+
+        return {self._replay_quote_asset: balance}
+
+    def get_historical_candles(self, contract: Contract, interval: str,
+                               start_time: typing.Optional[int] = None) -> typing.List[Candle]:
+        return []  # The backfill of missing candles falls back to flat candles
+
+    def get_bid_ask(self, contract: Contract) -> typing.Dict[str, float]:
+        return self.prices.get(contract.symbol)
+
+    def get_order_book_snapshot(self, *args, **kwargs) -> typing.Optional[typing.Dict]:
+        return None  # Not recorded, the local order books stay empty
+
+    def subscribe_channel(self, *args, **kwargs):
+        return
+
+    def _start_ws(self):
+        return
+
+    def _last_price(self, contract: Contract) -> typing.Optional[float]:
+        for b_index, strategy in self.strategies.items():
+            if strategy.contract.symbol == contract.symbol and len(strategy.candles) > 0:
+                return strategy.candles[-1].close
+
+        return None
+
+    def place_order(self, contract: Contract, order_type: str, quantity: float, side: str, price=None,
+                    tif=None) -> typing.Optional[OrderStatus]:
+
+        fill_price = price if price is not None else self._last_price(contract)
+        if fill_price is None:
+            logger.warning("Simulated broker: no price to fill the %s order on %s", side, contract.symbol)
+            return None
+
+        order_id = len(self.orders) + 1  # Sequential ids keep the replays identical
+
+        if self.platform == "bitmex":
+            order_status = OrderStatus(str(order_id), "filled", fill_price, quantity)
+        else:
+            order_status = OrderStatus(order_id, "filled", float(fill_price), float(quantity))
+
+        self.orders.append(order_status)
+        self._order_statuses[order_status.order_id] = order_status
+
+        return order_status
+
+    def place_orders(self, orders: typing.List) -> typing.List[typing.Optional[OrderStatus]]:
+        return [self.place_order(o.contract, o.order_type, o.quantity, o.side, o.price, o.tif) for o in orders]
+
+    def cancel_order(self, *args) -> typing.Optional[OrderStatus]:
+        return self._order_statuses.get(args[-1])  # Already filled, nothing to cancel
+
+    def get_order_status(self, contract: Contract, order_id) -> typing.Optional[OrderStatus]:
+        return self._order_statuses.get(order_id)
@@ -0,0 +1,323 @@
+import argparse
+import contextlib
+import csv
+import logging
+import os
+import random
+import time
+import typing
+
+from simulation import messages
+from simulation.replay import ReplayBinanceClient, ReplayBitmexClient, default_contract, seed_candle
+from strategies.strategies import TechnicalStrategy, BreakoutStrategy
+
+logger = logging.getLogger()
+
+TECHNICAL_PARAMS = {"ema_fast": 12, "ema_slow": 26, "ema_signal": 9, "rsi_length": 14}
+START_MS = 1_700_000_000_000
+
+
+class LoadProfile:
+    def __init__(self, rate: float, shape: str = "poisson", burst_factor: float = 5, burst_length: float = 0.2,
+                 burst_period: float = 2):
+
+        """
+        Arrival times of the messages.
+        :param rate: Average messages per second outside of the bursts
+        :param shape: constant (evenly spaced), poisson (random arrivals), burst (poisson with periodic bursts)
+        :param burst_factor: Rate multiplier during a burst
+        :param burst_length: Seconds
+        :param burst_period: Seconds between the start of two bursts
+        """
+
+        self.rate = rate
+        self.shape = shape
+        self.burst_factor = burst_factor
+        self.burst_length = burst_length
+        self.burst_period = burst_period
+
+    def arrivals(self, duration: float, rng: random.Random) -> typing.List[float]:
+
+        """
+        :param duration: Seconds
+        :param rng:
+        :return: Arrival times in seconds from the start, increasing
+        """
+
+        times = []
+        t = 0.0
+
+        while True:
+            if self.shape == "constant":
+                t += 1 / self.rate
+            else:
+                rate = self.rate
+                if self.shape == "burst" and t % self.burst_period < self.burst_length:
+                    rate *= self.burst_factor
+                t += rng.expovariate(rate)
+
+            if t >= duration:
+                return times
+            times.append(t)
+
+
+class SyntheticMarket:
+    def __init__(self, exchange: str, symbols_nb: int, trade_ratio: float = 0.5, skew: float = 1.0, seed: int = 0):
+
+        """
+        Realistic message mix: the activity of the symbols follows a Zipf law (a few symbols get most of the
+        messages), the prices follow random walks.
+        :param exchange: binance_futures, binance_spot, bitmex
+        :param symbols_nb:
+        :param trade_ratio: Proportion of aggTrade/trade messages, the rest are bookTicker/instrument updates
+        :param skew: Exponent of the Zipf law, 0 for symbols equally active
+        :param seed:
+        """
+
+        self.exchange = exchange
+        self.trade_ratio = trade_ratio
+        self._rng = random.Random(seed)
+
+        if exchange == "bitmex":
+            self.symbols = [f"SYM{i}USD" for i in range(symbols_nb)]
+            self.tick = 0.5
+        else:
+            self.symbols = [f"SYM{i}USDT" for i in range(symbols_nb)]
+            self.tick = 0.01
+
+        self._weights = [1 / (rank + 1) ** skew for rank in range(symbols_nb)]
+        self.prices = {s: 1000.0 for s in self.symbols}
+        self._update_nb = 0
+
+    def messages(self, arrivals: typing.List[float], start_ms: int) -> typing.List[typing.Tuple[float, int, str]]:
+
+        """
+        :param arrivals: Seconds from the start
+        :param start_ms: Exchange time of the start
+        :return: (arrival time, exchange timestamp in ms, message)
+        """
+
+        symbols = self._rng.choices(self.symbols, weights=self._weights, k=len(arrivals))
+        result = []
+
+        for t, symbol in zip(arrivals, symbols):
+            timestamp = start_ms + int(t * 1000)
+            price = self.prices[symbol] * (1 + self._rng.gauss(0, 0.0005))
+            price = max(round(price / self.tick) * self.tick, self.tick)
+            self.prices[symbol] = price
+            self._update_nb += 1
+
+            if self._rng.random() < self.trade_ratio:
+                if self.exchange == "bitmex":
+                    msg = messages.bitmex_trade([(symbol, price, self._rng.randint(1, 100) * 100)], timestamp)
+                else:
+                    msg = messages.binance_agg_trade(symbol, price, self._rng.uniform(0.001, 2), timestamp,
+                                                     self._update_nb)
+            else:
+                if self.exchange == "bitmex":
+                    msg = messages.bitmex_instrument([(symbol, price - self.tick, price + self.tick)], timestamp)
+                else:
+                    msg = messages.binance_book_ticker(symbol, price - self.tick, price + self.tick, self._update_nb,
+                                                       futures=self.exchange == "binance_futures",
+                                                       timestamp=timestamp)
+
+            result.append((t, timestamp, msg))
+
+        return result
+
+
+def build_client(market: SyntheticMarket, strategies_nb: int,
+                 history: int = 200) -> typing.Union[ReplayBinanceClient, ReplayBitmexClient]:
+
+    """
+    Replay client with strategies_nb strategies spread over the symbols by order of activity, alternately Technical
+    and Breakout, each with history candles so that the indicators are computed over a realistic length.
+    """
+
+    contracts = {s: default_contract(s, market.exchange) for s in market.symbols}
+
+    if market.exchange == "bitmex":
+        client = ReplayBitmexClient(contracts)
+        exchange = "Bitmex"
+    else:
+        client = ReplayBinanceClient(contracts, futures=market.exchange == "binance_futures")
+        exchange = "Binance"
+
+    rng = random.Random(strategies_nb)
+
+    for b_index in range(strategies_nb):
+        contract = contracts[market.symbols[b_index % len(market.symbols)]]
+
+        if b_index % 2 == 0:
+            strategy = TechnicalStrategy(client, contract, exchange, "1m", 10, 1, 1, TECHNICAL_PARAMS)
+        else:
+            strategy = BreakoutStrategy(client, contract, exchange, "1m", 10, 1, 1, {"min_volume": 100})
+
+        price = market.prices[contract.symbol]
+        for i in range(history):
+            candle = seed_candle(price * (1 + rng.gauss(0, 0.002)), START_MS - (history - i) * 60_000, "1m")
+            candle.volume = rng.uniform(1, 50)
+            strategy.candles.append(candle)
+
+        client.strategies[b_index] = strategy
+
+    return client
+
+
+def run_step(client, stream: typing.List[typing.Tuple[float, int, str]], duration: float,
+             max_latency_ms: float) -> typing.Dict:
+
+    """
+    Deliver the messages to client._on_message() at their arrival times, from one thread like the websocket
+    thread of a connector: a message arriving while the previous one is processed waits, and its latency is the
+    time from its arrival to the end of its processing.
+    :return: Statistics of the step
+    """
+
+    latencies = []
+    start = time.perf_counter()
+
+    for t, timestamp, msg in stream:
+        while True:
+            wait = start + t - time.perf_counter()
+            if wait <= 0:
+                break
+            if wait > 0.002:
+                time.sleep(wait - 0.001)
+
+        client.clock.now_ms = timestamp
+        client._on_message(None, msg)
+        latencies.append(time.perf_counter() - start - t)
+
+    elapsed = max(time.perf_counter() - start, duration)
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        if len(latencies) == 0:
+            return 0
+        return latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)] * 1000
+
+    p99 = percentile(99)
+
+    return {
+        "offered_rate": len(stream) / duration,
+        "achieved_rate": len(stream) / elapsed,
+        "p50_ms": percentile(50),
+        "p99_ms": p99,
+        "max_ms": latencies[-1] * 1000 if len(latencies) > 0 else 0,
+        "sustainable": p99 <= max_latency_ms and elapsed <= duration * 1.05,
+    }
+
+
+def find_capacity(exchange: str, symbols_nb: int, strategies_nb: int, profile: LoadProfile, duration: float,
+                  max_latency_ms: float, max_rate: float, refine_steps: int,
+                  seed: int = 0) -> typing.List[typing.Dict]:
+
+    """
+    Double the rate from profile.rate until the latency degrades, then bisect between the last sustainable rate and
+    the first unsustainable one.
+    :return: One result per tested rate, in the order they were tested
+    """
+
+    results = []
+
+    def test(rate: float) -> bool:
+        market = SyntheticMarket(exchange, symbols_nb, seed=seed)
+        client = build_client(market, strategies_nb)
+        step_profile = LoadProfile(rate, profile.shape, profile.burst_factor, profile.burst_length,
+                                   profile.burst_period)
+        stream = market.messages(step_profile.arrivals(duration, random.Random(seed)), START_MS)
+
+        result = run_step(client, stream, duration, max_latency_ms)
+        result.update({"exchange": exchange, "symbols": symbols_nb, "strategies": strategies_nb, "rate": rate})
+        results.append(result)
+
+        logger.info("%s symbols, %s strategies, %.0f msg/s: p99 %.1f ms, %s", symbols_nb, strategies_nb, rate,
+                    result["p99_ms"], "ok" if result["sustainable"] else "degraded")
+        return result["sustainable"]
+
+    good, bad = 0.0, None
+    rate = profile.rate
+
+    while rate <= max_rate:
+        if test(rate):
+            good = rate
+            rate *= 2
+        else:
+            bad = rate
+            break
+
+    if bad is not None:
+        for _ in range(refine_steps):
+            middle = (good + bad) / 2
+            if test(middle):
+                good = middle
+            else:
+                bad = middle
+
+    for result in results:
+        result["capacity"] = good
+
+    return results
+
+
+def _parse_list(text: str) -> typing.List[int]:
+    return [int(x) for x in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the message rate the tick pipeline sustains")
+    parser.add_argument("--exchange", default="binance_futures", choices=["binance_futures", "binance_spot", "bitmex"])
+    parser.add_argument("--symbols", default="1,10,50", help="Comma separated numbers of symbols")
+    parser.add_argument("--strategies", default="1,10,50", help="Comma separated numbers of strategies")
+    parser.add_argument("--shape", default="poisson", choices=["constant", "poisson", "burst"])
+    parser.add_argument("--start-rate", type=float, default=500, help="Messages per second of the first step")
+    parser.add_argument("--max-rate", type=float, default=200000)
+    parser.add_argument("--burst-factor", type=float, default=5)
+    parser.add_argument("--duration", type=float, default=3, help="Seconds per step")
+    parser.add_argument("--max-latency-ms", type=float, default=50, help="p99 above which a rate isn't sustainable")
+    parser.add_argument("--refine", type=int, default=3, help="Bisection steps after the first degraded rate")
+    parser.add_argument("--csv", help="Write every step to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s :: %(message)s')
+    logging.getLogger().setLevel(logging.INFO)
+
+    profile = LoadProfile(args.start_rate, args.shape, args.burst_factor)
+    rows = []
+    capacities = dict()
+
+    for symbols_nb in _parse_list(args.symbols):
+        for strategies_nb in _parse_list(args.strategies):
+
+            # The strategies print their indicators and log every candle, which isn't the load being measured
+
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                logging.disable(logging.WARNING)
+                try:
+                    results = find_capacity(args.exchange, symbols_nb, strategies_nb, profile, args.duration,
+                                            args.max_latency_ms, args.max_rate, args.refine)
+                finally:
+                    logging.disable(logging.NOTSET)
+
+            rows.extend(results)
+            capacities[(symbols_nb, strategies_nb)] = results[0]["capacity"]
+            logger.info("%s symbols, %s strategies: %.0f msg/s", symbols_nb, strategies_nb, results[0]["capacity"])
+
+    # Capacity curve: one line per number of symbols, one column per number of strategies
+
+    strategies_list = _parse_list(args.strategies)
+    print(f"\nSustainable msg/s (p99 <= {args.max_latency_ms} ms, {args.shape} arrivals, {args.exchange})")
+    print("symbols \\ strategies" + "".join(f"{s:>12}" for s in strategies_list))
+    for symbols_nb in _parse_list(args.symbols):
+        print(f"{symbols_nb:<22}" + "".join(f"{capacities[(symbols_nb, s)]:>12.0f}" for s in strategies_list))
+
+    if args.csv is not None:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import datetime
+import json
+import typing
+
+# Builders of exchange payloads with the same structure as the real APIs, used by the benchmarks, the mock
+# exchange and the load generator. Websocket messages are returned as JSON strings, REST payloads as Python objects.
+
+
+def iso_timestamp(timestamp: int) -> str:
+
+    """
+    :param timestamp: In milliseconds
+    :return: Bitmex timestamp format, e.g. 2021-05-01T12:00:00.000Z
+    """
+
+    dt = datetime.datetime.fromtimestamp(timestamp / 1000, tz=datetime.timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{timestamp % 1000:03d}Z"
+
+
+def binance_book_ticker(symbol: str, bid: float, ask: float, update_id: int, futures: bool = True,
+                        timestamp: int = 0) -> str:
+    data = {"u": update_id, "s": symbol, "b": f"{bid:.2f}", "B": "1.000", "a": f"{ask:.2f}", "A": "1.000"}
+
+    if futures:
+        data = {"e": "bookTicker", "E": timestamp, "T": timestamp, **data}
+
+    return json.dumps(data)
+
+
+def binance_agg_trade(symbol: str, price: float, quantity: float, timestamp: int, trade_id: int) -> str:
+    return json.dumps({"e": "aggTrade", "E": timestamp, "s": symbol, "a": trade_id, "p": f"{price:.2f}",
+                       "q": f"{quantity:.3f}", "f": trade_id, "l": trade_id, "T": timestamp, "m": trade_id % 2 == 0})
+
+
+def binance_depth_update(symbol: str, first_id: int, last_id: int, previous_id: int,
+                         bids: typing.List[typing.Tuple[float, float]], asks: typing.List[typing.Tuple[float, float]],
+                         timestamp: int = 0) -> str:
+    return json.dumps({"e": "depthUpdate", "E": timestamp, "T": timestamp, "s": symbol, "U": first_id,
+                       "u": last_id, "pu": previous_id,
+                       "b": [[f"{p:.2f}", f"{q:.3f}"] for p, q in bids],
+                       "a": [[f"{p:.2f}", f"{q:.3f}"] for p, q in asks]})
+
+
+def bitmex_instrument(symbols_prices: typing.List[typing.Tuple[str, float, float]], timestamp: int) -> str:
+    return json.dumps({"table": "instrument", "action": "update",
+                       "data": [{"symbol": symbol, "bidPrice": bid, "askPrice": ask,
+                                 "timestamp": iso_timestamp(timestamp)} for symbol, bid, ask in symbols_prices]})
+
+
+def bitmex_trade(trades: typing.List[typing.Tuple[str, float, float]], timestamp: int) -> str:
+    return json.dumps({"table": "trade", "action": "insert",
+                       "data": [{"timestamp": iso_timestamp(timestamp), "symbol": symbol,
+                                 "side": "Buy" if i % 2 == 0 else "Sell", "size": size, "price": price,
+                                 "tickDirection": "PlusTick"} for i, (symbol, price, size) in enumerate(trades)]})
+
+
+def binance_futures_symbol(symbol: str, base_asset: str, quote_asset: str, price_precision: int = 2,
+                           quantity_precision: int = 3) -> typing.Dict:
+    return {"symbol": symbol, "status": "TRADING", "baseAsset": base_asset, "quoteAsset": quote_asset,
+            "pricePrecision": price_precision, "quantityPrecision": quantity_precision,
+            "filters": [{"filterType": "PRICE_FILTER", "tickSize": f"{10 ** -price_precision:.{price_precision}f}"},
+                        {"filterType": "LOT_SIZE",
+                         "stepSize": f"{10 ** -quantity_precision:.{quantity_precision}f}"}]}
+
+
+def binance_spot_symbol(symbol: str, base_asset: str, quote_asset: str, tick_size: str = "0.01000000",
+                        step_size: str = "0.00100000") -> typing.Dict:
+    return {"symbol": symbol, "status": "TRADING", "baseAsset": base_asset, "quoteAsset": quote_asset,
+            "filters": [{"filterType": "PRICE_FILTER", "minPrice": tick_size, "maxPrice": "1000000.00000000",
+                         "tickSize": tick_size},
+                        {"filterType": "LOT_SIZE", "minQty": step_size, "maxQty": "9000.00000000",
+                         "stepSize": step_size}]}
+
+
+def bitmex_instrument_info(symbol: str, root_symbol: str, quote_currency: str = "USD", tick_size: float = 0.5,
+                           lot_size: float = 100, inverse: bool = True) -> typing.Dict:
+    return {"symbol": symbol, "rootSymbol": root_symbol, "quoteCurrency": quote_currency, "state": "Open",
+            "tickSize": tick_size, "lotSize": lot_size, "isQuanto": False, "isInverse": inverse,
+            "multiplier": -100000000 if inverse else 100}
+
+
+def binance_kline(open_time: int, interval_ms: int, open_price: float, high: float, low: float, close: float,
+                  volume: float) -> typing.List:
+    return [open_time, f"{open_price:.2f}", f"{high:.2f}", f"{low:.2f}", f"{close:.2f}", f"{volume:.3f}",
+            open_time + interval_ms - 1, f"{volume * close:.2f}", 100, f"{volume / 2:.3f}",
+            f"{volume * close / 2:.2f}", "0"]
+
+
+def bitmex_bucket(symbol: str, close_time: int, open_price: float, high: float, low: float, close: float,
+                  volume: float) -> typing.Dict:
+    return {"timestamp": iso_timestamp(close_time), "symbol": symbol, "open": open_price, "high": high, "low": low,
+            "close": close, "trades": 100, "volume": volume, "vwap": close}
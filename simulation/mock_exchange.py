@@ -0,0 +1,814 @@
+import argparse
+import base64
+import hashlib
+import http.server
+import json
+import logging
+import queue
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+import typing
+from urllib.parse import urlparse, parse_qs
+
+import dateutil.parser
+
+from simulation import messages
+
+logger = logging.getLogger()
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+TF_SECONDS = {"1m": 60, "3m": 180, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "2h": 7200, "4h": 14400,
+              "1d": 86400}
+
+DEFAULT_SYMBOLS = {
+    "binance_futures": ["BTCUSDT", "ETHUSDT", "BNBUSDT"],
+    "binance_spot": ["BTCUSDT", "ETHUSDT", "BNBUSDT"],
+    "bitmex": ["XBTUSD", "ETHUSD"],
+}
+
+START_PRICES = {"BTC": 30000, "XBT": 30000, "ETH": 2000, "BNB": 300}
+
+BITMEX_PRIVATE_KEYS = {"order": ["orderID"], "execution": ["execID"], "position": ["account", "symbol", "currency"],
+                       "margin": ["account", "currency"]}
+
+
+class _WebsocketConnection:
+    def __init__(self, sock: socket.socket):
+
+        """
+        Server side of one websocket connection. The frames are sent by a dedicated thread, in order, each one
+        not before its due time, so that a latency can be added without slowing down the market thread.
+        :param sock: Socket on which the handshake is done
+        """
+
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Frames sent back to back aren't held
+        self.subscriptions: typing.Set[str] = set()
+        self.authenticated = False
+        self.open = True
+
+        self._queue: queue.Queue = queue.Queue()
+        self._sender = threading.Thread(target=self._send_loop, daemon=True)
+        self._sender.start()
+
+    def send(self, payload: str, due: float = 0, opcode: int = 0x1):
+        self._queue.put((due, opcode, payload.encode()))
+
+    def close(self):
+
+        """
+        Drop the connection without close frame, like a network failure.
+        :return:
+        """
+
+        self.open = False
+        self._queue.put(None)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _send_loop(self):
+        while self.open:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            due, opcode, payload = item
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            try:
+                self.sock.sendall(_encode_frame(payload, opcode))
+            except OSError:
+                self.open = False
+                return
+
+
+def _encode_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    header = bytes([0x80 | opcode])  # FIN bit, the server never fragments
+
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack(">H", length)
+    else:
+        header += bytes([127]) + struct.pack(">Q", length)
+
+    return header + payload  # Frames sent by a server are not masked
+
+
+def _read_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if len(chunk) == 0:
+            raise ConnectionError("Connection closed by the client")
+        data += chunk
+    return data
+
+
+def _read_frame(sock: socket.socket) -> typing.Tuple[int, bytes]:
+    b0, b1 = _read_exactly(sock, 2)
+    opcode = b0 & 0x0F
+    length = b1 & 0x7F
+
+    if length == 126:
+        length = struct.unpack(">H", _read_exactly(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", _read_exactly(sock, 8))[0]
+
+    mask = _read_exactly(sock, 4) if b1 & 0x80 else b"\x00\x00\x00\x00"
+    payload = _read_exactly(sock, length)
+
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+class _WebsocketHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        exchange: MockExchange = self.server.exchange
+
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = self.request.recv(4096)
+            if len(chunk) == 0:
+                return
+            request += chunk
+
+        headers = dict()
+        for line in request.decode(errors="replace").split("\r\n")[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if "sec-websocket-key" not in headers:
+            self.request.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return
+
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WS_GUID).encode()).digest())
+        self.request.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                             b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+        connection = _WebsocketConnection(self.request)
+        exchange._add_connection(connection)
+
+        try:
+            while connection.open:
+                opcode, payload = _read_frame(self.request)
+
+                if opcode == 0x1:
+                    exchange._on_ws_message(connection, payload.decode())
+                elif opcode == 0x8:  # Close
+                    connection.send("", opcode=0x8)
+                    break
+                elif opcode == 0x9:  # Ping
+                    connection.send(payload.decode(errors="replace"), opcode=0xA)
+
+        except (ConnectionError, OSError, ValueError):
+            pass
+
+        finally:
+            exchange._remove_connection(connection)
+            connection.close()
+
+
+class _WebsocketServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _RestHandler(http.server.BaseHTTPRequestHandler):
+    def _handle(self, method: str):
+        exchange: MockExchange = self.server.exchange
+
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        if length > 0:
+            params.update({k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()})
+
+        if exchange.latency > 0:
+            time.sleep(exchange.latency)
+
+        status, body = exchange._on_rest_request(method, url.path, params)
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def log_message(self, format, *args):
+        return
+
+
+class MockExchange:
+    def __init__(self, platform: str, symbols: typing.Optional[typing.List[str]] = None, message_rate: float = 100,
+                 trade_ratio: float = 0.5, latency: float = 0, drop_rate: float = 0,
+                 disconnect_interval: typing.Optional[float] = None, balance: typing.Optional[float] = None,
+                 seed: int = 0, host: str = "127.0.0.1", rest_port: int = 0, ws_port: int = 0):
+
+        """
+        Local imitation of the Binance Futures, Binance Spot or Bitmex REST and websocket APIs used by the connectors,
+        so that they can run and be load tested without network access:
+        BinanceClient(..., base_url=mock.base_url, wss_url=mock.wss_url)
+        and ws_api_url=mock.ws_api_url for the Binance websocket trading API.
+
+        The prices follow a random walk. Market orders are filled at once at the ask/bid, limit orders are filled
+        if they cross the spread when they are placed and stay open otherwise.
+        :param platform: binance_futures, binance_spot, bitmex
+        :param symbols: The first one gets the most messages
+        :param message_rate: Websocket messages generated per second, over all the symbols and channels
+        :param trade_ratio: Proportion of trades (aggTrade, trade) among the messages, the rest is bookTicker or
+        instrument updates
+        :param latency: Seconds added before sending every websocket message and REST response
+        :param drop_rate: Probability that a websocket message isn't sent
+        :param disconnect_interval: Seconds between two forced disconnections of all the websocket clients
+        :param balance: Balance of the quote asset, 10000 USDT or 1 XBT by default
+        :param seed: Of the random walk and of the drops
+        :param host:
+        :param rest_port: 0 to use a free port
+        :param ws_port: 0 to use a free port
+        """
+
+        self.platform = platform
+        self.symbols = symbols if symbols is not None else DEFAULT_SYMBOLS[platform]
+        self.message_rate = message_rate
+        self.trade_ratio = trade_ratio
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.disconnect_interval = disconnect_interval
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.prices: typing.Dict[str, float] = dict()
+        self._tick_sizes: typing.Dict[str, float] = dict()
+        for symbol in self.symbols:
+            base = next((b for b in START_PRICES if symbol.startswith(b)), None)
+            self.prices[symbol] = START_PRICES.get(base, 100)
+            self._tick_sizes[symbol] = 0.5 if platform == "bitmex" else 0.01
+
+        self.quote_asset = "XBT" if platform == "bitmex" else "USDT"
+        self.balance = balance if balance is not None else (1 if platform == "bitmex" else 10000)
+
+        self._orders: typing.Dict[typing.Union[int, str], typing.Dict] = dict()
+        self._private_updates: typing.List[typing.Tuple[str, str]] = []  # Bitmex (topic, message) to send
+        self._fills: typing.List[typing.Dict] = []
+        self._order_nb = 0
+        self._trade_nb = 0
+        self._execution_nb = 0
+        self._update_nb = 0
+
+        self._connections: typing.List[_WebsocketConnection] = []
+        self.stats = {"sent": 0, "dropped": 0, "disconnections": 0, "connections": 0, "rest_requests": 0,
+                      "ws_api_requests": 0}
+
+        self._rest_server = http.server.ThreadingHTTPServer((host, rest_port), _RestHandler)
+        self._rest_server.daemon_threads = True
+        self._rest_server.exchange = self
+
+        self._ws_server = _WebsocketServer((host, ws_port), _WebsocketHandler)
+        self._ws_server.exchange = self
+
+        ws_path = "/realtime" if platform == "bitmex" else "/ws"
+        self.base_url = f"http://{host}:{self._rest_server.server_address[1]}"
+        self.wss_url = f"ws://{host}:{self._ws_server.server_address[1]}{ws_path}"
+
+        # Websocket trading API of Binance, served on the same port as the market data
+        ws_api_path = "/ws-fapi/v1" if platform == "binance_futures" else "/ws-api/v3"
+        self.ws_api_url = f"ws://{host}:{self._ws_server.server_address[1]}{ws_api_path}"
+
+        self._running = False
+        self._threads: typing.List[threading.Thread] = []
+
+    def start(self):
+        self._running = True
+
+        for target in [self._rest_server.serve_forever, self._ws_server.serve_forever, self._market_loop]:
+            t = threading.Thread(target=target, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+        logger.info("Mock %s exchange: REST on %s, websocket on %s", self.platform, self.base_url, self.wss_url)
+
+    def stop(self):
+        self._running = False
+
+        for connection in self._connections_copy():
+            connection.close()
+
+        self._rest_server.shutdown()
+        self._ws_server.shutdown()
+        self._rest_server.server_close()
+        self._ws_server.server_close()
+
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def disconnect_all(self):
+        for connection in self._connections_copy():
+            connection.close()
+        self.stats["disconnections"] += 1
+
+    # Websocket
+
+    def _connections_copy(self) -> typing.List[_WebsocketConnection]:
+        with self._lock:
+            return list(self._connections)
+
+    def _add_connection(self, connection: _WebsocketConnection):
+        with self._lock:
+            self._connections.append(connection)
+        self.stats["connections"] += 1
+
+        if self.platform == "bitmex":
+            connection.send(json.dumps({"info": "Welcome to the mock BitMEX Realtime API.", "version": "mock",
+                                        "timestamp": messages.iso_timestamp(int(time.time() * 1000))}))
+
+    def _remove_connection(self, connection: _WebsocketConnection):
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+
+    def _on_ws_message(self, connection: _WebsocketConnection, msg: str):
+        try:
+            data = json.loads(msg)
+        except ValueError:
+            connection.send(json.dumps({"error": "Invalid JSON"}))
+            return
+
+        if self.platform == "bitmex":
+            if data.get("op") == "authKeyExpires":  # Any key is accepted
+                connection.authenticated = len(data.get("args", [])) == 3
+                connection.send(json.dumps({"success": connection.authenticated, "request": data}))
+            elif data.get("op") == "subscribe":
+                for topic in data.get("args", []):
+                    if topic in BITMEX_PRIVATE_KEYS and not connection.authenticated:
+                        connection.send(json.dumps({"status": 401, "error": "User requested an account-locked "
+                                                    "subscription but no authorization was provided.",
+                                                    "request": data}))
+                        continue
+                    connection.subscriptions.add(topic)
+                    connection.send(json.dumps({"success": True, "subscribe": topic, "request": data}))
+                    if topic in BITMEX_PRIVATE_KEYS:
+                        connection.send(json.dumps(self._bitmex_partial(topic)))
+            elif data.get("op") == "unsubscribe":
+                for topic in data.get("args", []):
+                    connection.subscriptions.discard(topic)
+                    connection.send(json.dumps({"success": True, "unsubscribe": topic, "request": data}))
+            elif data.get("op") == "ping" or msg == "ping":
+                connection.send("pong")
+
+        elif data.get("method") in ("order.place", "order.cancel", "order.status"):
+            self._on_ws_api_request(connection, data)
+
+        else:
+            if data.get("method") == "SUBSCRIBE":
+                connection.subscriptions.update(data.get("params", []))
+            elif data.get("method") == "UNSUBSCRIBE":
+                connection.subscriptions.difference_update(data.get("params", []))
+            connection.send(json.dumps({"result": None, "id": data.get("id")}))
+
+    def _on_ws_api_request(self, connection: _WebsocketConnection, data: typing.Dict):
+        self.stats["ws_api_requests"] += 1
+
+        routes = {
+            "order.place": self._binance_place_order,
+            "order.cancel": self._binance_cancel_order,
+            "order.status": self._binance_order_status,
+        }
+
+        try:
+            with self._lock:
+                result = routes[data["method"]](data["params"])
+            response = {"id": data.get("id"), "status": 200, "result": result}
+        except (KeyError, ValueError) as e:
+            response = {"id": data.get("id"), "status": 400,
+                        "error": {"code": -1100, "msg": f"Invalid parameter: {e}"}}
+
+        connection.send(json.dumps(response), time.time() + self.latency)
+
+    def _market_loop(self):
+        period = 0.01  # Messages are generated by batches, sleeping between each message isn't precise enough
+        owed = 0.0
+        last = time.time()
+        next_disconnect = last + self.disconnect_interval if self.disconnect_interval else None
+
+        while self._running:
+            time.sleep(period)
+            now = time.time()
+
+            owed += (now - last) * self.message_rate
+            last = now
+            batch_nb = int(owed)
+            owed -= batch_nb
+
+            connections = self._connections_copy()
+            now_ms = int(now * 1000)
+
+            for _ in range(batch_nb):
+                streams, payload = self._next_message(now_ms)
+
+                for connection in connections:
+                    if connection.subscriptions.isdisjoint(streams):
+                        continue
+                    if self.drop_rate > 0 and self._rng.random() < self.drop_rate:
+                        self.stats["dropped"] += 1
+                        continue
+                    connection.send(payload, now + self.latency)
+                    self.stats["sent"] += 1
+
+            if next_disconnect is not None and now >= next_disconnect:
+                self.disconnect_all()
+                next_disconnect = now + self.disconnect_interval
+
+    def _next_message(self, now_ms: int) -> typing.Tuple[typing.Tuple[str, ...], str]:
+
+        """
+        Move the price of a symbol and build the corresponding message.
+        :param now_ms: Exchange timestamp of the message
+        :return: Streams the message belongs to, message
+        """
+
+        # Half of the messages for the first symbol, the rest spread over the others
+
+        if len(self.symbols) == 1 or self._rng.random() < 0.5:
+            symbol = self.symbols[0]
+        else:
+            symbol = self.symbols[self._rng.randrange(1, len(self.symbols))]
+
+        tick = self._tick_sizes[symbol]
+
+        with self._lock:
+            price = self.prices[symbol] * (1 + self._rng.gauss(0, 0.0002))
+            price = max(round(price / tick) * tick, tick)
+            self.prices[symbol] = price
+
+        is_trade = self._rng.random() < self.trade_ratio
+        bid, ask = price - tick, price + tick
+
+        if self.platform == "bitmex":
+            if is_trade:
+                size = self._rng.randint(1, 100) * 100
+                return ("trade", "trade:" + symbol), messages.bitmex_trade([(symbol, price, size)], now_ms)
+            return ("instrument", "instrument:" + symbol), messages.bitmex_instrument([(symbol, bid, ask)], now_ms)
+
+        if is_trade:
+            self._trade_nb += 1
+            payload = messages.binance_agg_trade(symbol, price, self._rng.uniform(0.001, 2), now_ms, self._trade_nb)
+            return (symbol.lower() + "@aggTrade",), payload
+
+        self._update_nb += 1
+        payload = messages.binance_book_ticker(symbol, bid, ask, self._update_nb,
+                                               futures=self.platform == "binance_futures", timestamp=now_ms)
+        return (symbol.lower() + "@bookTicker",), payload
+
+    # REST
+
+    def _on_rest_request(self, method: str, path: str,
+                         params: typing.Dict[str, str]) -> typing.Tuple[int, typing.Any]:
+        self.stats["rest_requests"] += 1
+
+        if self.platform == "bitmex":
+            routes = {
+                ("GET", "/api/v1/instrument/active"): self._bitmex_instruments,
+                ("GET", "/api/v1/user/margin"): self._bitmex_margin,
+                ("GET", "/api/v1/trade/bucketed"): self._bitmex_buckets,
+                ("POST", "/api/v1/order"): self._bitmex_place_order,
+                ("POST", "/api/v1/order/bulk"): self._bitmex_place_orders,
+                ("DELETE", "/api/v1/order"): self._bitmex_cancel_order,
+                ("GET", "/api/v1/order"): self._bitmex_orders,
+            }
+        else:
+            prefix = "/fapi/v1" if self.platform == "binance_futures" else "/api/v3"
+            routes = {
+                ("GET", prefix + "/exchangeInfo"): self._binance_exchange_info,
+                ("GET", prefix + "/klines"): self._binance_klines,
+                ("GET", prefix + "/ticker/bookTicker"): self._binance_book_ticker,
+                ("GET", prefix + "/account"): self._binance_account,
+                ("POST", prefix + "/order"): self._binance_place_order,
+                ("POST", "/fapi/v1/batchOrders"): self._binance_place_orders,
+                ("GET", prefix + "/order"): self._binance_order_status,
+                ("DELETE", prefix + "/order"): self._binance_cancel_order,
+                ("GET", "/api/v3/myTrades"): self._binance_my_trades,
+            }
+
+        route = routes.get((method, path))
+        if route is None:
+            return self._error(404, f"Unknown endpoint {method} {path}")
+
+        try:
+            with self._lock:
+                return 200, route(params)
+        except (KeyError, ValueError) as e:
+            return self._error(400, f"Invalid parameter: {e}")
+        finally:
+            self._send_private_updates()
+
+    def _send_private_updates(self):
+
+        """
+        Send the updates of the Bitmex private topics queued by the orders, once the lock is released.
+        :return:
+        """
+
+        with self._lock:
+            updates, self._private_updates = self._private_updates, []
+
+        if len(updates) == 0:
+            return
+
+        due = time.time() + self.latency
+
+        for connection in self._connections_copy():
+            for topic, payload in updates:
+                if topic in connection.subscriptions:
+                    connection.send(payload, due)
+
+    def _error(self, status: int, message: str) -> typing.Tuple[int, typing.Dict]:
+        if self.platform == "bitmex":
+            return status, {"error": {"message": message, "name": "HTTPError"}}
+        return status, {"code": -1100, "msg": message}
+
+    def _history(self, symbol: str, timeframe: str, count: int) -> typing.List[typing.Tuple]:
+
+        """
+        Candles ending with the current one, walking backwards from the current price.
+        :return: (open time in ms, open, high, low, close, volume), oldest first
+        """
+
+        tf_ms = TF_SECONDS[timeframe] * 1000
+        now_ms = int(time.time() * 1000)
+        open_time = now_ms - now_ms % tf_ms
+
+        rng = random.Random(f"{symbol}{timeframe}{open_time}")  # Same history when requested twice in a candle
+        tick = self._tick_sizes[symbol]
+        close = self.prices[symbol]
+
+        candles = []
+        for i in range(count):
+            open_price = max(round(close * (1 + rng.gauss(0, 0.002)) / tick) * tick, tick)
+            high = max(open_price, close) + tick * rng.randint(0, 10)
+            low = max(min(open_price, close) - tick * rng.randint(0, 10), tick)
+            candles.append((open_time - i * tf_ms, open_price, high, low, close, rng.uniform(10, 1000)))
+            close = open_price
+
+        candles.reverse()
+        return candles
+
+    def _fill_price(self, symbol: str, side: str, order_type: str,
+                    price: typing.Optional[float]) -> typing.Optional[float]:
+        tick = self._tick_sizes[symbol]
+        bid, ask = self.prices[symbol] - tick, self.prices[symbol] + tick
+
+        if order_type.upper() == "MARKET":
+            return ask if side.upper() == "BUY" else bid
+        if side.upper() == "BUY" and price >= ask:
+            return ask
+        if side.upper() == "SELL" and price <= bid:
+            return bid
+        return None
+
+    # Binance
+
+    def _binance_exchange_info(self, params: typing.Dict) -> typing.Dict:
+        if self.platform == "binance_futures":
+            symbols = [messages.binance_futures_symbol(s, s[:-len(self.quote_asset)], self.quote_asset)
+                       for s in self.symbols]
+        else:
+            symbols = [messages.binance_spot_symbol(s, s[:-len(self.quote_asset)], self.quote_asset)
+                       for s in self.symbols]
+        return {"timezone": "UTC", "serverTime": int(time.time() * 1000), "symbols": symbols}
+
+    def _binance_klines(self, params: typing.Dict) -> typing.List:
+        timeframe = params["interval"]
+        limit = min(int(params.get("limit", 500)), 1500)
+        start_time = int(params.get("startTime", 0))
+
+        return [messages.binance_kline(open_time, TF_SECONDS[timeframe] * 1000, *prices)
+                for open_time, *prices in self._history(params["symbol"], timeframe, limit) if open_time >= start_time]
+
+    def _binance_book_ticker(self, params: typing.Dict) -> typing.Dict:
+        symbol = params["symbol"]
+        tick = self._tick_sizes[symbol]
+        return {"symbol": symbol, "bidPrice": f"{self.prices[symbol] - tick:.2f}", "bidQty": "1.000",
+                "askPrice": f"{self.prices[symbol] + tick:.2f}", "askQty": "1.000"}
+
+    def _binance_account(self, params: typing.Dict) -> typing.Dict:
+        if self.platform == "binance_futures":
+            return {"assets": [{"asset": self.quote_asset, "initialMargin": "0", "maintMargin": "0",
+                                "marginBalance": str(self.balance), "walletBalance": str(self.balance),
+                                "unrealizedProfit": "0"}]}
+        return {"balances": [{"asset": self.quote_asset, "free": str(self.balance), "locked": "0"}]}
+
+    def _binance_order(self, order: typing.Dict) -> typing.Dict:
+        response = {"orderId": order["id"], "symbol": order["symbol"], "status": order["status"],
+                    "clientOrderId": f"mock{order['id']}", "price": str(order["price"] or 0),
+                    "origQty": str(order["quantity"]), "executedQty": str(order["executed_qty"]),
+                    "timeInForce": order["tif"], "type": order["type"], "side": order["side"],
+                    "updateTime": order["time"]}
+
+        if self.platform == "binance_futures":  # Binance Spot doesn't return the average price
+            response["avgPrice"] = str(order["avg_price"])
+
+        return response
+
+    def _binance_place_order(self, params: typing.Dict) -> typing.Dict:
+        symbol = params["symbol"]
+        if symbol not in self.prices:
+            raise ValueError(f"unknown symbol {symbol}")
+
+        price = float(params["price"]) if "price" in params else None
+        quantity = float(params["quantity"])
+        fill_price = self._fill_price(symbol, params["side"], params["type"], price)
+
+        self._order_nb += 1
+        order = {"id": self._order_nb, "symbol": symbol, "side": params["side"], "type": params["type"],
+                 "quantity": quantity, "price": price, "tif": params.get("timeInForce", "GTC"),
+                 "time": int(time.time() * 1000), "status": "NEW", "avg_price": 0, "executed_qty": 0}
+
+        if fill_price is not None:
+            order.update({"status": "FILLED", "avg_price": fill_price, "executed_qty": quantity})
+            self._fills.append({"symbol": symbol, "id": len(self._fills) + 1, "orderId": order["id"],
+                                "price": str(fill_price), "qty": str(quantity), "commission": "0",
+                                "commissionAsset": self.quote_asset, "time": order["time"],
+                                "isBuyer": params["side"] == "BUY", "isMaker": False})
+
+        self._orders[order["id"]] = order
+        return self._binance_order(order)
+
+    def _binance_place_orders(self, params: typing.Dict) -> typing.List[typing.Dict]:
+        orders = json.loads(params["batchOrders"])
+        if len(orders) > 5:
+            raise ValueError("batchOrders: 5 orders at most")
+
+        results = []
+        for order in orders:  # Each order is accepted or rejected on its own
+            try:
+                results.append(self._binance_place_order(order))
+            except (KeyError, ValueError) as e:
+                results.append({"code": -1100, "msg": f"Invalid parameter: {e}"})
+        return results
+
+    def _binance_order_status(self, params: typing.Dict) -> typing.Dict:
+        return self._binance_order(self._orders[int(params["orderId"])])
+
+    def _binance_cancel_order(self, params: typing.Dict) -> typing.Dict:
+        order = self._orders[int(params["orderId"])]
+        if order["status"] == "NEW":
+            order["status"] = "CANCELED"
+        return self._binance_order(order)
+
+    def _binance_my_trades(self, params: typing.Dict) -> typing.List[typing.Dict]:
+        return [f for f in self._fills if f["symbol"] == params["symbol"]]
+
+    # Bitmex
+
+    def _bitmex_instruments(self, params: typing.Dict) -> typing.List[typing.Dict]:
+        return [messages.bitmex_instrument_info(s, s[:-3], s[-3:], self._tick_sizes[s]) for s in self.symbols]
+
+    def _bitmex_margin(self, params: typing.Dict) -> typing.List[typing.Dict]:
+        margin = int(self.balance * 100_000_000)  # In satoshis
+        return [{"currency": self.quote_asset, "initMargin": 0, "maintMargin": 0, "marginBalance": margin,
+                 "walletBalance": margin, "unrealisedPnl": 0}]
+
+    def _bitmex_buckets(self, params: typing.Dict) -> typing.List[typing.Dict]:
+        timeframe = params["binSize"]
+        count = min(int(params.get("count", 100)), 1000)
+        tf_ms = TF_SECONDS[timeframe] * 1000
+
+        start_time = 0
+        if "startTime" in params:
+            start_time = int(dateutil.parser.isoparse(params["startTime"]).timestamp() * 1000)
+
+        history = self._history(params["symbol"], timeframe, count)
+        buckets = [messages.bitmex_bucket(params["symbol"], open_time + tf_ms, *prices)  # Timestamped at the close
+                   for open_time, *prices in history if open_time + tf_ms >= start_time]
+
+        if params.get("reverse", "false").lower() == "true":
+            buckets.reverse()
+        return buckets
+
+    def _bitmex_partial(self, topic: str) -> typing.Dict:
+        with self._lock:
+            if topic == "order":
+                rows = [self._bitmex_order(o) for o in self._orders.values() if o["status"] == "New"]
+            elif topic == "margin":
+                rows = [dict(self._bitmex_margin(dict())[0], account=1)]
+            else:
+                rows = []
+
+        return {"table": topic, "action": "partial", "keys": BITMEX_PRIVATE_KEYS[topic], "data": rows}
+
+    def _queue_private_update(self, topic: str, action: str, rows: typing.List[typing.Dict]):
+        self._private_updates.append((topic, json.dumps({"table": topic, "action": action, "data": rows})))
+
+    def _bitmex_order(self, order: typing.Dict) -> typing.Dict:
+        return {"orderID": order["id"], "symbol": order["symbol"], "side": order["side"],
+                "orderQty": order["quantity"], "price": order["price"], "ordType": order["type"],
+                "timeInForce": order["tif"], "ordStatus": order["status"], "avgPx": order["avg_price"],
+                "cumQty": order["executed_qty"], "leavesQty": order["quantity"] - order["executed_qty"],
+                "timestamp": messages.iso_timestamp(order["time"])}
+
+    def _bitmex_place_order(self, params: typing.Dict) -> typing.Dict:
+        symbol = params["symbol"]
+        if symbol not in self.prices:
+            raise ValueError(f"unknown symbol {symbol}")
+
+        price = float(params["price"]) if "price" in params else None
+        quantity = float(params["orderQty"])
+        fill_price = self._fill_price(symbol, params["side"], params["ordType"], price)
+
+        self._order_nb += 1
+        order = {"id": f"mock-{self._order_nb:08d}", "symbol": symbol, "side": params["side"],
+                 "type": params["ordType"], "quantity": quantity, "price": price,
+                 "tif": params.get("timeInForce", "GoodTillCancel"), "time": int(time.time() * 1000), "status": "New",
+                 "avg_price": None, "executed_qty": 0}
+
+        if fill_price is not None:
+            order.update({"status": "Filled", "avg_price": fill_price, "executed_qty": quantity})
+
+        self._orders[order["id"]] = order
+
+        self._queue_private_update("order", "insert", [self._bitmex_order(order)])
+        if fill_price is not None:
+            self._execution_nb += 1
+            self._queue_private_update("execution", "insert", [{
+                "execID": f"mock-exec-{self._execution_nb:08d}", "orderID": order["id"], "symbol": symbol,
+                "side": order["side"], "execType": "Trade", "ordStatus": "Filled", "lastQty": quantity,
+                "lastPx": fill_price, "cumQty": quantity, "avgPx": fill_price, "leavesQty": 0,
+                "timestamp": messages.iso_timestamp(order["time"])}])
+
+        return self._bitmex_order(order)
+
+    def _bitmex_place_orders(self, params: typing.Dict) -> typing.List[typing.Dict]:
+        return [self._bitmex_place_order(order) for order in json.loads(params["orders"])]
+
+    def _bitmex_cancel_order(self, params: typing.Dict) -> typing.List[typing.Dict]:
+        order = self._orders[params["orderID"]]
+        if order["status"] == "New":
+            order["status"] = "Canceled"
+            self._queue_private_update("order", "update", [{"orderID": order["id"], "ordStatus": "Canceled",
+                                                            "leavesQty": 0}])
+        return [self._bitmex_order(order)]
+
+    def _bitmex_orders(self, params: typing.Dict) -> typing.List[typing.Dict]:
+        orders = [self._bitmex_order(o) for o in self._orders.values()
+                  if "symbol" not in params or o["symbol"] == params["symbol"]]
+
+        if params.get("reverse", "false").lower() == "true":
+            orders.reverse()
+        return orders[:int(params.get("count", 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock exchange for the connectors")
+    parser.add_argument("--platform", default="binance_futures", choices=["binance_futures", "binance_spot", "bitmex"])
+    parser.add_argument("--symbols", help="Comma separated, defaults to " + str(DEFAULT_SYMBOLS))
+    parser.add_argument("--rate", type=float, default=100, help="Websocket messages per second")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to every message and response")
+    parser.add_argument("--drop-rate", type=float, default=0, help="Probability to drop a websocket message")
+    parser.add_argument("--disconnect-interval", type=float, help="Seconds between two forced disconnections")
+    parser.add_argument("--rest-port", type=int, default=0)
+    parser.add_argument("--ws-port", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s :: %(message)s')
+
+    mock = MockExchange(args.platform, args.symbols.split(",") if args.symbols else None, args.rate,
+                        latency=args.latency, drop_rate=args.drop_rate, disconnect_interval=args.disconnect_interval,
+                        rest_port=args.rest_port, ws_port=args.ws_port)
+    mock.start()
+
+    print(f"base_url={mock.base_url} wss_url={mock.wss_url}")
+
+    try:
+        while True:
+            time.sleep(10)
+            logger.info("Mock exchange stats: %s", mock.stats)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
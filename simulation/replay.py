@@ -0,0 +1,245 @@
+import argparse
+import hashlib
+import json
+import logging
+import time
+import typing
+
+import dateutil.parser
+
+from models.models import *
+from connectors.binance import BinanceClient
+from connectors.bitmex import BitmexClient
+from connectors.backfill import CandleBackfill
+from connectors.order_batcher import OrderBatcher
+from connectors.recorder import read_frames
+from simulation.broker import SimulatedBroker
+from strategies.batch_evaluator import BatchEvaluator
+from strategies.strategies import TechnicalStrategy, BreakoutStrategy, TF_EQUIV
+from utils.clock import SimulatedClock
+
+logger = logging.getLogger()
+
+QUOTE_ASSETS = ["USDT", "BUSD", "USDC", "BTC", "ETH", "BNB", "USD"]
+
+
+class ReplayBinanceClient(SimulatedBroker, BinanceClient):
+    def __init__(self, contracts: typing.Dict[str, Contract], futures: bool, balance: float = 10000,
+                 quote_asset: str = "USDT"):
+        self._init_broker(contracts, balance, quote_asset)
+        super().__init__("", "", testnet=True, futures=futures)
+        self.clock = SimulatedClock()
+        self.backfill = CandleBackfill(self, asynchronous=False)
+        self.order_batcher = OrderBatcher(self, asynchronous=False)
+        self.batch_evaluator = BatchEvaluator(self, asynchronous=False)
+
+
+class ReplayBitmexClient(SimulatedBroker, BitmexClient):
+    def __init__(self, contracts: typing.Dict[str, Contract], balance: float = 1):
+        self._init_broker(contracts, balance, "XBT")
+        super().__init__("", "", testnet=True)
+        self.clock = SimulatedClock()
+        self.backfill = CandleBackfill(self, asynchronous=False)
+        self.order_batcher = OrderBatcher(self, asynchronous=False)
+        self.batch_evaluator = BatchEvaluator(self, asynchronous=False)
+
+
+def default_contract(symbol: str, platform: str) -> Contract:
+
+    """
+    Contract with generic precisions, for when the exchange information of the recording isn't available.
+    :param symbol:
+    :param platform: binance_futures, binance_spot, bitmex
+    :return:
+    """
+
+    quote_asset = next((q for q in QUOTE_ASSETS if symbol.endswith(q) and len(symbol) > len(q)), "USDT")
+    base_asset = symbol[:-len(quote_asset)]
+
+    if platform == "binance_futures":
+        info = {"symbol": symbol, "baseAsset": base_asset, "quoteAsset": quote_asset, "pricePrecision": 2,
+                "quantityPrecision": 3}
+    elif platform == "binance_spot":
+        info = {"symbol": symbol, "baseAsset": base_asset, "quoteAsset": quote_asset,
+                "filters": [{"filterType": "PRICE_FILTER", "tickSize": "0.01"},
+                            {"filterType": "LOT_SIZE", "stepSize": "0.001"}]}
+    else:
+        info = {"symbol": symbol, "rootSymbol": base_asset, "quoteCurrency": quote_asset, "tickSize": 0.5,
+                "lotSize": 100, "isQuanto": False, "isInverse": True, "multiplier": -100000000}
+
+    return Contract.from_exchange(info, platform)
+
+
+def load_contracts(path: str, platform: str) -> typing.Dict[str, Contract]:
+
+    """
+    :param path: JSON file saved from /fapi/v1/exchangeInfo, /api/v3/exchangeInfo or /api/v1/instrument/active
+    :param platform:
+    :return:
+    """
+
+    with open(path) as f:
+        exchange_info = json.load(f)
+
+    if platform == "bitmex":
+        return {c["symbol"]: Contract.from_bitmex(c) for c in exchange_info}
+    else:
+        return {c["symbol"]: Contract.from_exchange(c, platform) for c in exchange_info["symbols"]}
+
+
+def seed_candle(price: float, timestamp: int, timeframe: str) -> Candle:
+
+    """
+    Candle opened at the first recorded trade, when no history was loaded before the replay.
+    :param price:
+    :param timestamp: In milliseconds
+    :param timeframe:
+    :return:
+    """
+
+    tf_ms = TF_EQUIV[timeframe] * 1000
+
+    return Candle(timestamp - timestamp % tf_ms, price, price, price, price, 0)
+
+
+class ReplayEngine:
+    def __init__(self, client: typing.Union[ReplayBinanceClient, ReplayBitmexClient],
+                 frames: typing.Iterable[typing.Tuple[int, str]], speed: float = 0):
+
+        """
+        Feed recorded websocket frames to the real _on_message() of a replay client, so that they go through
+        parse_trades() and check_trade() of its strategies exactly as they would live.
+        :param client: Replay client with its strategies added to client.strategies
+        :param frames: (receive timestamp in nanoseconds, frame), as returned by read_frames()
+        :param speed: 0 to replay as fast as possible, otherwise a multiple of the recorded pace
+        """
+
+        self.client = client
+        self.frames = frames
+        self.speed = speed
+
+        self.messages_nb = 0
+        self._unseeded = any(len(s.candles) == 0 for s in self.client.strategies.values())
+
+    def run(self) -> typing.Dict:
+        start_wall = time.perf_counter()
+        first_recv_ms = None
+
+        for recv_ns, msg in self.frames:
+            recv_ms = recv_ns // 1_000_000
+            self.client.clock.now_ms = recv_ms
+
+            if first_recv_ms is None:
+                first_recv_ms = recv_ms
+
+            if self._unseeded:
+                self._seed_strategies(msg)
+
+            if self.speed > 0:
+                delay = (recv_ms - first_recv_ms) / 1000 / self.speed - (time.perf_counter() - start_wall)
+                if delay > 0:
+                    time.sleep(delay)
+
+            self.client._on_message(None, msg)
+            self.messages_nb += 1
+
+        elapsed = time.perf_counter() - start_wall
+
+        return {
+            "messages": self.messages_nb,
+            "seconds": elapsed,
+            "messages_per_second": self.messages_nb / elapsed if elapsed > 0 else 0,
+            "orders": len(self.client.orders),
+            "trades": sum(len(s.trades) + s.archived_trades_nb for s in self.client.strategies.values()),
+            "digest": self.digest()
+        }
+
+    def _seed_strategies(self, msg: str):
+        data = json.loads(msg)
+
+        if "e" in data and data["e"] == "aggTrade":
+            trades = [(data["s"], float(data["p"]), data["T"])]
+        elif data.get("table") == "trade":
+            trades = [(d["symbol"], float(d["price"]),
+                       int(dateutil.parser.isoparse(d["timestamp"]).timestamp() * 1000)) for d in data["data"]]
+        else:
+            trades = []
+
+        for symbol, price, timestamp in trades:
+            for strategy in self.client.strategies.values():
+                if strategy.contract.symbol == symbol and len(strategy.candles) == 0:
+                    strategy.candles.append(seed_candle(price, timestamp, strategy.timeframe))
+
+        self._unseeded = any(len(s.candles) == 0 for s in self.client.strategies.values())
+
+    def digest(self) -> str:
+
+        """
+        Hash of the candles and trades kept by the strategies and of every order produced by the replay, to check
+        that two runs are identical.
+        :return:
+        """
+
+        h = hashlib.sha256()
+
+        for b_index in sorted(self.client.strategies):
+            strategy = self.client.strategies[b_index]
+            for c in strategy.candles:
+                h.update(repr((c.timestamp, c.open, c.high, c.low, c.close, c.volume)).encode())
+            for t in strategy.trades:
+                h.update(repr((t.time, t.side, t.entry_price, t.quantity, t.status, t.pnl, t.entry_id)).encode())
+
+        for o in self.client.orders:
+            h.update(repr((o.order_id, o.status, o.avg_price, o.executed_qty)).encode())
+
+        return h.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded market data through the strategies")
+    parser.add_argument("recording", help="Directory written by MarketDataRecorder")
+    parser.add_argument("--exchange", choices=["binance_futures", "binance_spot", "bitmex"], required=True)
+    parser.add_argument("--symbol", required=True)
+    parser.add_argument("--timeframe", default="1m", choices=list(TF_EQUIV.keys()))
+    parser.add_argument("--strategy", default="Technical", choices=["Technical", "Breakout"])
+    parser.add_argument("--params", default='{"ema_fast": 12, "ema_slow": 26, "ema_signal": 9, "rsi_length": 14}',
+                        help="JSON of the strategy extra parameters")
+    parser.add_argument("--balance-pct", type=float, default=10)
+    parser.add_argument("--take-profit", type=float, default=1)
+    parser.add_argument("--stop-loss", type=float, default=1)
+    parser.add_argument("--exchange-info", help="JSON file of the exchange contracts, generic precisions otherwise")
+    parser.add_argument("--speed", type=float, default=0, help="0 for as fast as possible, else a multiple")
+    parser.add_argument("--start-ns", type=int)
+    parser.add_argument("--end-ns", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s :: %(message)s')
+
+    if args.exchange_info is not None:
+        contracts = load_contracts(args.exchange_info, args.exchange)
+    else:
+        contracts = {args.symbol: default_contract(args.symbol, args.exchange)}
+
+    contract = contracts[args.symbol]
+
+    if args.exchange == "bitmex":
+        client = ReplayBitmexClient(contracts)
+        exchange = "Bitmex"
+    else:
+        client = ReplayBinanceClient(contracts, futures=args.exchange == "binance_futures",
+                                     quote_asset=contract.quote_asset)
+        exchange = "Binance"
+
+    strategy_class = TechnicalStrategy if args.strategy == "Technical" else BreakoutStrategy
+    client.strategies[1] = strategy_class(client, contract, exchange, args.timeframe, args.balance_pct,
+                                          args.take_profit, args.stop_loss, json.loads(args.params))
+
+    engine = ReplayEngine(client, read_frames(args.recording, args.start_ns, args.end_ns), args.speed)
+    result = engine.run()
+
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import logging
+import threading
+import time
+import typing
+
+import numpy as np
+
+from strategies.strategies import TechnicalStrategy
+
+logger = logging.getLogger()
+
+DEFAULT_WINDOW_MS = 50
+MIN_BATCH = 8  # Below, the pandas pipeline of each strategy is faster than the loop over the candles
+
+
+def ewm_columns(values: np.ndarray, alpha: np.ndarray, starts: np.ndarray) -> np.ndarray:
+
+    """
+    pandas ewm(alpha=...).mean() (adjust=True) of every column at once, with the same operations in the same order,
+    so the results are identical to the pandas ones. The loop runs over the rows (the candles), each step being a
+    few numpy operations over all the columns (the strategies).
+    :param values: (candles, columns), the values of a column before its start are ignored
+    :param alpha: Smoothing factor of each column
+    :param starts: Row of the first value of each column, the columns being aligned on their last row
+    :return: Same shape as values, NaN before the start of each column
+    """
+
+    rows_nb, columns_nb = values.shape
+
+    factor = 1.0 - alpha
+    weighted = np.where(starts == 0, values[0], np.nan)
+    old_wt = np.ones(columns_nb)
+
+    output = np.empty_like(values)
+    output[0] = weighted
+
+    starting: typing.Dict[int, np.ndarray] = dict()
+    for start in np.unique(starts[starts > 0]):
+        starting[int(start)] = np.nonzero(starts == start)[0]
+
+    new = np.empty(columns_nb)
+    denominator = np.empty(columns_nb)
+    changed = np.empty(columns_nb, dtype=bool)
+
+    with np.errstate(invalid="ignore"):
+        for i in range(1, rows_nb):
+            current = values[i]
+
+            old_wt *= factor
+            np.multiply(old_wt, weighted, out=new)
+            new += current
+            np.add(old_wt, 1.0, out=denominator)
+            new /= denominator
+
+            np.not_equal(weighted, current, out=changed)  # pandas keeps the average of a constant series exact
+            np.copyto(weighted, new, where=changed)
+            old_wt += 1.0
+
+            columns = starting.get(i)
+            if columns is not None:
+                weighted[columns] = current[columns]
+                old_wt[columns] = 1.0
+
+            output[i] = weighted
+
+    return output
+
+
+def span_alpha(span: np.ndarray) -> np.ndarray:
+
+    """
+    Smoothing factor of pandas ewm(span=...), computed as pandas does.
+    :param span:
+    :return:
+    """
+
+    return 1.0 / (1.0 + (span - 1) / 2.0)
+
+
+def technical_indicators(closes: typing.List[typing.Sequence[float]], ema_fast: np.ndarray, ema_slow: np.ndarray,
+                         ema_signal: np.ndarray,
+                         rsi_length: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+    """
+    Last MACD line, MACD signal and RSI of several close series, as TechnicalStrategy computes them one by one.
+    :param closes: Closes of the closed candles of each strategy, of any length
+    :param ema_fast: Parameters of each strategy
+    :param ema_slow:
+    :param ema_signal:
+    :param rsi_length:
+    :return: One value per strategy for each indicator
+    """
+
+    series_nb = len(closes)
+    lengths = np.array([len(c) for c in closes])
+    rows_nb = int(lengths.max())
+    starts = rows_nb - lengths
+
+    matrix = np.full((rows_nb, series_nb), np.nan)
+    for column, series in enumerate(closes):
+        matrix[starts[column]:, column] = series
+
+    delta = np.full_like(matrix, np.nan)
+    delta[1:] = matrix[1:] - matrix[:-1]
+    up = np.where(delta < 0, 0.0, delta)
+    down = np.abs(np.where(delta > 0, 0.0, delta))
+
+    # The four series smoothed over the candles in the same loop: fast and slow EMA, average gain and loss
+
+    rsi_alpha = 1.0 / (1.0 + (rsi_length - 1))
+
+    smoothed = ewm_columns(np.concatenate([matrix, matrix, up, down], axis=1),
+                           np.concatenate([span_alpha(ema_fast), span_alpha(ema_slow), rsi_alpha, rsi_alpha]),
+                           np.concatenate([starts, starts, starts + 1, starts + 1]))
+
+    macd_line = smoothed[:, :series_nb] - smoothed[:, series_nb:2 * series_nb]
+    macd_signal = ewm_columns(macd_line, span_alpha(ema_signal), starts)[-1]
+
+    avg_gain = smoothed[-1, 2 * series_nb:3 * series_nb]
+    avg_loss = smoothed[-1, 3 * series_nb:]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        rsi = 100 - 100 / (1 + rs)
+
+    rsi[lengths - 1 < rsi_length] = np.nan  # min_periods of the average gain and loss, over the closes differences
+
+    return macd_line[-1], macd_signal, np.round(rsi, 2)
+
+
+class BatchEvaluator:
+    def __init__(self, client, window_ms: float = DEFAULT_WINDOW_MS, min_batch: int = MIN_BATCH,
+                 asynchronous: bool = True):
+
+        """
+        Evaluates the signals of the TechnicalStrategy of a client at the candle close by timeframe: the strategies
+        that see a new candle within window_ms of the first one, or until every strategy of the timeframe did,
+        are evaluated together by technical_indicators(), one numpy pass over their stacked closes instead of one
+        pandas pipeline each. Smaller batches go through the shared indicators of each strategy.
+        A batch is evaluated in the thread of the strategies when its last strategy is submitted, otherwise by a timer
+        at the end of the window, so a quiet symbol doesn't hold the others back.
+        :param client: BinanceClient or BitmexClient
+        :param window_ms: How long the first strategy of a batch waits for the others
+        :param min_batch: Smallest batch evaluated with numpy
+        :param asynchronous: If False, every strategy is evaluated when submitted, to keep the replays deterministic
+        """
+
+        self._client = client
+        self._window = window_ms / 1000
+        self._min_batch = min_batch
+        self._asynchronous = asynchronous
+
+        self._pending: typing.Dict[str, typing.List[TechnicalStrategy]] = dict()  # By timeframe
+        self._timers: typing.Dict[str, threading.Timer] = dict()
+        self._lock = threading.Lock()
+
+        self.batches_nb = 0
+        self.vectorized_nb = 0
+
+    def submit(self, strategy: TechnicalStrategy):
+
+        """
+        :param strategy: Whose candle just closed
+        :return:
+        """
+
+        timeframe = strategy.timeframe
+
+        if not self._asynchronous:
+            self._evaluate([strategy])
+            return
+
+        with self._lock:
+            pending = self._pending.get(timeframe)
+            if pending is None:
+                pending = []
+                self._pending[timeframe] = pending
+
+                timer = threading.Timer(self._window, self._on_window_end, args=(timeframe, pending))
+                timer.daemon = True
+                timer.start()
+                self._timers[timeframe] = timer
+
+            if strategy not in pending:
+                pending.append(strategy)
+
+            complete = len(pending) >= self._waiting_nb(timeframe)
+            if complete:
+                self._pending.pop(timeframe)
+                self._timers.pop(timeframe).cancel()
+
+        if complete:
+            self._evaluate(pending)
+
+    def _waiting_nb(self, timeframe: str) -> int:
+
+        """
+        Number of strategies of the timeframe that can take a signal, the batch doesn't need to wait for the others.
+        :param timeframe:
+        :return:
+        """
+
+        return sum(1 for s in list(self._client.strategies.values())
+                   if s.timeframe == timeframe and isinstance(s, TechnicalStrategy) and not s.ongoing_position
+                   and not s.backfill_pending)
+
+    def _on_window_end(self, timeframe: str, pending: typing.List[TechnicalStrategy]):
+        with self._lock:
+            if self._pending.get(timeframe) is not pending:  # Already evaluated
+                return
+            self._pending.pop(timeframe)
+            self._timers.pop(timeframe, None)
+
+        try:
+            self._evaluate(pending)
+        except Exception as e:
+            logger.error("Error while evaluating the %s signals: %s", timeframe, e)
+
+    def _evaluate(self, strategies: typing.List[TechnicalStrategy]):
+        start = time.perf_counter_ns()
+
+        # Deactivated meanwhile: stop() released their indicators, they mustn't place orders
+        active = {id(s) for s in list(self._client.strategies.values())}
+
+        strategies = [s for s in strategies if id(s) in active and not s.ongoing_position and not s.backfill_pending]
+        ready = [s for s in strategies if len(s.candles) >= 3]  # The RSI needs two closed candles
+
+        self.batches_nb += 1
+
+        if len(ready) < self._min_batch:
+            signals = [s._timed_check_signal() for s in ready]
+        else:
+            self.vectorized_nb += 1
+
+            params = np.array([(s._ema_fast, s._ema_slow, s._ema_signal, s._rsi_length) for s in ready],
+                              dtype=np.float64)
+            macd_line, macd_signal, rsi = technical_indicators([s._closed_closes() for s in ready], params[:, 0],
+                                                               params[:, 1], params[:, 2], params[:, 3])
+
+            signals = [s._signal(macd_line[i], macd_signal[i], rsi[i]) for i, s in enumerate(ready)]
+
+            if self._client.metrics is not None:
+                elapsed = time.perf_counter_ns() - start  # What each strategy of the batch waited for its signal
+                for s in ready:
+                    s._record_stage("signal", elapsed)
+
+        with self._client.order_batcher.burst():  # The orders of the batch are sent together
+            for s, signal_result in zip(ready, signals):
+                if signal_result in [-1, 1]:
+                    try:
+                        s._open_position(signal_result)
+                    except Exception as e:
+                        logger.error("Error while opening a position for %s: %s", s.label, e)
@@ -0,0 +1,168 @@
+import threading
+import typing
+
+import pandas as pd
+
+IndicatorKey = typing.Tuple[str, str, str, str, typing.Tuple]
+
+
+class _Entry:
+    __slots__ = ("refs", "closes", "value")
+
+    def __init__(self):
+        self.refs = 0
+        self.closes: typing.Optional[typing.Tuple[float, ...]] = None
+        self.value = None
+
+
+def _dependencies(key: IndicatorKey) -> typing.List[IndicatorKey]:
+    exchange, symbol, timeframe, indicator, params = key
+
+    if indicator == "macd":
+        fast, slow, signal = params
+        return [(exchange, symbol, timeframe, "ema", (fast,)), (exchange, symbol, timeframe, "ema", (slow,))]
+
+    return []
+
+
+class IndicatorRegistry:
+    def __init__(self):
+
+        """
+        Indicators shared by the strategies of a client, keyed by (exchange, symbol, timeframe, indicator, params):
+        the strategies on the same symbol and timeframe with the same parameters get the series computed by the
+        first of them to ask for it after a candle close, so the CPU spent at a candle close grows with the number
+        of distinct indicators rather than with the number of strategies. A MACD reuses the EMA entries, so two
+        MACD with a common span compute that EMA once.
+        A value is reused only if it was computed from the same closes, so a strategy whose candles differ, e.g.
+        started with another history, gets its own exact values.
+        Entries are counted by the strategies that acquired them and removed when the last one releases them.
+        Used from the websocket thread of the client, acquire() and release() from the interface as well.
+
+        Indicators, computed over the closes of the closed candles:
+        ema (span,), rsi (length,), macd (fast, slow, signal) as (macd line, signal line)
+        """
+
+        self._entries: typing.Dict[IndicatorKey, _Entry] = dict()
+        self._series: typing.Dict[typing.Tuple[str, str, str], typing.Tuple[typing.Tuple, pd.Series]] = dict()
+        self._lock = threading.Lock()
+
+        self.computed_nb = 0
+        self.reused_nb = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def acquire(self, exchange: str, symbol: str, timeframe: str, indicator: str,
+                params: typing.Tuple) -> IndicatorKey:
+
+        """
+        :param exchange: Platform of the client
+        :param symbol:
+        :param timeframe:
+        :param indicator: ema, rsi, macd
+        :param params: Tuple of the indicator parameters, in the order given in the class docstring
+        :return: Key to pass to get() and release()
+        """
+
+        key = (exchange, symbol, timeframe, indicator, tuple(params))
+
+        with self._lock:
+            self._acquire(key)
+
+        return key
+
+    def _acquire(self, key: IndicatorKey):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _Entry()
+            self._entries[key] = entry
+        entry.refs += 1
+
+        for dependency in _dependencies(key):
+            self._acquire(dependency)
+
+    def release(self, key: IndicatorKey):
+        with self._lock:
+            self._release(key)
+
+            if not any(k[:3] == key[:3] for k in self._entries):
+                self._series.pop(key[:3], None)
+
+    def _release(self, key: IndicatorKey):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+
+        entry.refs -= 1
+        if entry.refs <= 0:
+            del self._entries[key]
+
+        for dependency in _dependencies(key):
+            self._release(dependency)
+
+    def get(self, key: IndicatorKey, closes: typing.Tuple[float, ...]):
+
+        """
+        :param key: Returned by acquire()
+        :param closes: Closes of the closed candles of the strategy, the last one being the candle just closed
+        :return: Series aligned on the closes, a tuple of them for the macd
+        """
+
+        entry = self._entries.get(key)
+        if entry is None:  # Released meanwhile, computed without caching
+            entry = _Entry()
+
+        if entry.closes is not None and (entry.closes is closes or entry.closes == closes):
+            self.reused_nb += 1
+            return entry.value
+
+        entry.value = self._compute(key, closes)
+        entry.closes = closes
+        self.computed_nb += 1
+
+        return entry.value
+
+    def _closes_series(self, key: IndicatorKey, closes: typing.Tuple[float, ...]) -> pd.Series:
+        cached = self._series.get(key[:3])
+        if cached is not None and (cached[0] is closes or cached[0] == closes):
+            return cached[1]
+
+        series = pd.Series(closes)
+        self._series[key[:3]] = (closes, series)
+
+        return series
+
+    def _compute(self, key: IndicatorKey, closes: typing.Tuple[float, ...]):
+        exchange, symbol, timeframe, indicator, params = key
+
+        if indicator == "ema":
+            return self._closes_series(key, closes).ewm(span=params[0]).mean()
+
+        elif indicator == "rsi":
+            length = params[0]
+
+            delta = self._closes_series(key, closes).diff().dropna()
+
+            up, down = delta.copy(), delta.copy()
+            up[up < 0] = 0
+            down[down > 0] = 0
+
+            avg_gain = up.ewm(com=(length - 1), min_periods=length).mean()
+            avg_loss = down.abs().ewm(com=(length - 1), min_periods=length).mean()
+
+            rs = avg_gain / avg_loss
+
+            rsi = 100 - 100 / (1 + rs)
+
+            return rsi.round(2)
+
+        elif indicator == "macd":
+            fast_key, slow_key = _dependencies(key)
+
+            macd_line = self.get(fast_key, closes) - self.get(slow_key, closes)
+            macd_signal = macd_line.ewm(span=params[2]).mean()
+
+            return macd_line, macd_signal
+
+        raise ValueError(f"Unknown indicator {indicator}")
@@ -1,9 +1,10 @@
+import copy
 import logging
 import time
 from threading import Timer
-import pandas as pd
 
 from models.models import *
+from strategies.triggers import TriggerIndex
 import typing
 
 if typing.TYPE_CHECKING:
@@ -14,6 +15,9 @@ logger = logging.getLogger()
 
 TF_EQUIV = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "4h": 14400}
 
+CANDLES_KEPT = 100  # Minimum, the strategies whose indicators need a longer warm-up keep more
+CLOSED_TRADES_KEPT = 1000  # By strategy, the older ones are only in the journal
+
 
 class Strategy:
 
@@ -38,21 +42,81 @@ class Strategy:
         self.stop_loss = stop_loss
         self.ongoing_position = False
         self.strategy_name = strategy_name
+        self.label = f"{strategy_name} {contract.symbol} {timeframe}"  # Identifies the strategy in the CPU usage
         self.trades: typing.List[Trade] = []
 
+        # Open trades of self.trades, checked at every tick. Replaced rather than modified, being iterated by the
+        # websocket thread while the order callbacks add and close trades.
+
+        self.open_trades: typing.List[Trade] = []
+        self.triggers = TriggerIndex()  # Take profit and stop loss prices of the open trades with an entry price
+
         self.candles: typing.List[Candle] = []
         self.logs = []
 
+        # Retention, so that the memory and the cost of a tick don't grow with the uptime
+
+        self.candles_kept = CANDLES_KEPT
+        self.closed_trades_kept = CLOSED_TRADES_KEPT
+        self.archived_trades_nb = 0  # Closed trades removed from self.trades
+
+        self._last_trade_time: typing.Optional[int] = None  # Exchange time of the trade that is being processed
+
+        # Set by the CandleBackfill of the client, no signal is evaluated while candles are missing
+
+        self.backfill_pending = False
+        self.backfilled_candles: typing.Optional[typing.List[Candle]] = None
+
+        self._exits_pending: typing.Set[Trade] = set()  # Exit orders submitted to the order batcher, not yet placed
+
+    def stop(self):
+
+        """
+        Called when the strategy is deactivated, to release what it holds in the client.
+        :return:
+        """
+
+        return
+
+    def _record_stage(self, stage: str, value_ns: int):
+        self.client.metrics.record_stage(self.client.platform, stage, value_ns, self.strategy_name,
+                                         self.contract.symbol)
+
+    def _timed_check_signal(self) -> int:
+        if self.client.metrics is None:
+            return self._check_signal()
+
+        start = time.perf_counter_ns()
+        signal_result = self._check_signal()
+        self._record_stage("signal", time.perf_counter_ns() - start)
+
+        return signal_result
+
+    def _record_tick_to_order(self):
+
+        """
+        Time from the exchange trade that triggered an order to the response to that order.
+        :return:
+        """
+
+        if self.client.metrics is not None and self._last_trade_time is not None:
+            self._record_stage("tick_to_order", (self.client.clock.time_ms() - self._last_trade_time) * 1_000_000)
+
     def _add_log(self, msg: str):
         logger.info(f"{msg}")
         self.logs.append({"log": msg, "displayed": False})
 
     def parse_trades(self, price: float, size: float, timestamp: int) -> str:
-        timestamp_diff = int(time.time() * 1000) - timestamp
+        self._last_trade_time = timestamp
+        timestamp_diff = self.client.clock.time_ms() - timestamp
         if timestamp_diff >= 2000:
             logger.warning(
                 f"{self.exchange} {self.contract.symbol}: {timestamp_diff} milliseconds of difference between the "
                 f"current time and the trade time")
+
+        if self.backfilled_candles is not None:
+            self._splice_backfill()
+
         last_candle = self.candles[-1]
         # Same candle
         if timestamp < last_candle.timestamp + self.tf_equiv:
@@ -66,9 +130,8 @@ class Strategy:
 
             # Check take profit or stop loss
 
-            for trade in self.trades:
-                if trade.status == "open" and trade.entry_price is not None:
-                    self._check_tp_sl(trade)
+            for trade, kind in self.triggers.crossed(price):
+                self._exit_trade(trade, kind)
 
             return "same_candle"
 
@@ -77,135 +140,267 @@ class Strategy:
 
             missing_candles = int((timestamp - last_candle.timestamp) / self.tf_equiv) - 1
             logger.info(
-                f"{self.exchange} :: {missing_candles} missing candles for {self.contract.symbol} {self.timeframe} ({timestamp} {last_candle.timestamp})")
-
-            for missing_candles in range(missing_candles):
-                new_ts = last_candle.timestamp + self.tf_equiv
-                candle_info = {
-                    "ts": new_ts,
-                    "open": price,
-                    "close": price,
-                    "high": price,
-                    "low": price,
-                    "size": size
-                }
-                new_candle = Candle(candle_info, self.timeframe, "parse_trade")
-                self.candles.append(new_candle)
-                last_candle = new_candle
-                logger.info(f"{self.exchange} :: New missing candles for {self.contract.symbol} {self.timeframe}")
+                f"{self.exchange} :: {missing_candles} missing candles for {self.contract.symbol} {self.timeframe} "
+                f"({timestamp} {last_candle.timestamp}), requesting them")
 
-            new_ts = last_candle.timestamp + self.tf_equiv
-            candle_info = {
-                "ts": new_ts,
-                "open": price,
-                "close": price,
-                "high": price,
-                "low": price,
-                "size": size
-            }
-            new_candle = Candle(candle_info, self.timeframe, "parse_trade")
+            new_ts = last_candle.timestamp + (missing_candles + 1) * self.tf_equiv
+            new_candle = Candle(new_ts, price, price, price, price, size)
             self.candles.append(new_candle)
-            logger.info(f"{self.exchange} :: New candle for {self.contract.symbol} {self.timeframe}")
+            self._trim_candles()
+
+            # From the last candle received, which may have missed trades as well
+
+            self.client.backfill.request(self, last_candle.timestamp)
+            if self.backfilled_candles is not None:  # Already fetched if the backfill isn't asynchronous
+                self._splice_backfill()
 
             return "new_candle"
 
         # New candle
         elif timestamp >= last_candle.timestamp + self.tf_equiv:
             new_ts = last_candle.timestamp + self.tf_equiv
-            candle_info = {
-                "ts": new_ts,
-                "open": price,
-                "close": price,
-                "high": price,
-                "low": price,
-                "size": size
-            }
-            new_candle = Candle(candle_info, self.timeframe, "parse_trade")
+            new_candle = Candle(new_ts, price, price, price, price, size)
             self.candles.append(new_candle)
+            self._trim_candles()
             logger.info(f"{self.exchange} :: New candle for {self.contract.symbol} {self.timeframe}")
             return "new_candle"
 
+    def _splice_backfill(self):
+
+        """
+        Replace the candles built from the websocket trades by the candles fetched by the backfill, except the last
+        one fetched, still open at the time of the request: it is merged with the candle built since. The gaps the
+        fetch didn't cover (request failed) are filled with flat candles at the previous close.
+        :return:
+        """
+
+        fetched = self.backfilled_candles
+        self.backfilled_candles = None
+        self.backfill_pending = False
+
+        candles = self.candles
+
+        if len(fetched) > 0:
+            first_ts = fetched[0].timestamp
+            last_ts = fetched[-1].timestamp
+            live = {c.timestamp: c for c in candles if c.timestamp == last_ts}
+
+            candles = [c for c in self.candles if c.timestamp < first_ts]
+
+            for candle in fetched:
+                candle = copy.copy(candle)  # The fetched candles are shared by the strategies of the same symbol
+
+                if candle.timestamp in live:
+                    live_candle = live[candle.timestamp]
+                    candle.high = max(candle.high, live_candle.high)
+                    candle.low = min(candle.low, live_candle.low)
+                    candle.close = live_candle.close
+                    candle.volume = max(candle.volume, live_candle.volume)
+
+                candles.append(candle)
+
+            candles.extend(c for c in self.candles if c.timestamp > last_ts)
+
+        filled = candles[:1]
+
+        for candle in candles[1:]:
+            previous = filled[-1]
+            missing_ts = previous.timestamp + self.tf_equiv
+
+            while missing_ts < candle.timestamp:
+                filled.append(Candle(missing_ts, previous.close, previous.close, previous.close, previous.close, 0))
+                missing_ts += self.tf_equiv
+
+            filled.append(candle)
+
+        logger.info(f"{self.exchange} :: {len(filled) - len(self.candles)} candles added by the backfill for "
+                    f"{self.contract.symbol} {self.timeframe}")
+
+        self.candles[:] = filled
+        self._trim_candles()
+
+    def _trim_candles(self):
+
+        """
+        Keep the last candles_kept candles. Trimmed once twice as many are held, deleting the head of a list being
+        linear in its length.
+        :return:
+        """
+
+        if len(self.candles) > 2 * self.candles_kept:
+            del self.candles[:len(self.candles) - self.candles_kept]
+
+    def _add_trade(self, trade: Trade):
+        self.trades.append(trade)
+        self.open_trades = self.open_trades + [trade]
+
+        if trade.entry_price is not None:
+            self._add_triggers(trade)
+
+    def _add_triggers(self, trade: Trade):
+
+        """
+        Take profit and stop loss prices of a trade, once its entry price is known.
+        :param trade:
+        :return:
+        """
+
+        take_profit = None
+        stop_loss = None
+
+        if trade.side == "long":
+            if self.take_profit is not None:
+                take_profit = trade.entry_price * (1 + self.take_profit / 100)
+            if self.stop_loss is not None:
+                stop_loss = trade.entry_price * (1 - self.stop_loss / 100)
+
+        elif trade.side == "short":
+            if self.take_profit is not None:
+                take_profit = trade.entry_price * (1 - self.take_profit / 100)
+            if self.stop_loss is not None:
+                stop_loss = trade.entry_price * (1 + self.stop_loss / 100)
+
+        self.triggers.add(trade, take_profit, stop_loss)
+
+    def _archive_trade(self, trade: Trade):
+
+        """
+        Remove a trade that was just closed from the open trades, and the oldest closed trades from self.trades
+        once more than twice closed_trades_kept are held. They are recorded in the journal, if any.
+        :param trade:
+        :return:
+        """
+
+        self.open_trades = [t for t in self.open_trades if t is not trade]
+        self.triggers.remove(trade)
+
+        closed_nb = len(self.trades) - len(self.open_trades)
+        if closed_nb <= 2 * self.closed_trades_kept:
+            return
+
+        closed = [t for t in self.trades if t.status != "open"]
+        archived = set(closed[:len(closed) - self.closed_trades_kept])
+
+        self.trades = [t for t in self.trades if t not in archived]
+        self.archived_trades_nb += len(archived)
+
     def _check_order_status(self, order_id):
         order_status = self.client.get_order_status(self.contract, order_id)
         if order_status is not None:
             logger.info(f"{self.exchange} order status: {order_status.status}")
             if order_status.status == "filled":
-                for trade in self.trades:
+                for trade in self.open_trades:
                     if trade.entry_id == order_id:
                         trade.entry_price = order_status.avg_price
+                        self._add_triggers(trade)
+                        self.client.dirty_trades.add(trade)
+                        if self.client.journal is not None:
+                            self.client.journal.record_trade(trade, "filled")
                         break
                 return
         t = Timer(2.0, lambda: self._check_order_status(order_id))
         t.start()
 
     def _open_position(self, signal_result: int):
+        sizing_start = time.perf_counter_ns()
         trade_size = self.client.get_trade_size(self.contract, self.candles[-1].close, self.balance_ptc)
+        if self.client.metrics is not None:
+            self._record_stage("sizing", time.perf_counter_ns() - sizing_start)
+
         if trade_size is None:
             return
 
         order_side = "buy" if signal_result == 1 else "sell"
         position_side = "long" if signal_result == 1 else "short"
         self._add_log(f"{position_side.capitalize()} signal on {self.contract.symbol} {self.timeframe}")
-        order_status = self.client.place_order(self.contract, "MARKET", trade_size, order_side)
-        if order_status is not None:
-            self._add_log(f"{order_side.capitalize()} order placed on {self.exchange} | Status: {order_status.status} ")
-            self.ongoing_position = True
 
-            avg_fill_price = None
+        expected_price = self.client.estimate_fill_price(self.contract, order_side, trade_size)
+        if expected_price is not None:
+            slippage = (expected_price / self.candles[-1].close - 1) * (1 if order_side == "buy" else -1)
+            logger.info("%s expected fill price %s, %.1f bps from the last price", self.label, expected_price,
+                        slippage * 10000)
+
+        self.ongoing_position = True  # No other signal while the order is waiting to be placed
+        self.client.order_batcher.submit(
+            self.contract, "MARKET", trade_size, order_side,
+            lambda order_status: self._on_entry_order(order_status, order_side, position_side, trade_size))
+
+    def _on_entry_order(self, order_status: typing.Optional[OrderStatus], order_side: str, position_side: str,
+                        trade_size: float):
+        if order_status is None:  # Rejected, the signal can be taken again
+            self.ongoing_position = False
+            return
 
-            if order_status.status == "filled":
-                avg_fill_price = order_status.avg_price
-            else:
-                t = Timer(2.0, lambda: self._check_order_status(order_status.order_id))
-                t.start()
-            new_trade = Trade({
-                "time": int(time.time() * 1000),
-                "entry_price": avg_fill_price,
-                "contract": self.contract,
-                "strategy": self.strategy_name,
-                "side": position_side,
-                "status": "open",
-                "pnl": 0,
-                "quantity": trade_size,
-                "entry_id": order_status.order_id
-            })
-            self.trades.append(new_trade)
-
-    # Check take profit or stop loss position
-    def _check_tp_sl(self, trade: Trade):
-        tp_triggered = False
-        sl_triggered = False
-        price = self.candles[-1].close
+        self._record_tick_to_order()
+        self._add_log(f"{order_side.capitalize()} order placed on {self.exchange} | Status: {order_status.status} ")
 
-        if trade.side == "long":
-            if self.stop_loss is not None:
-                if price <= trade.entry_price * (1 - self.stop_loss / 100):
-                    sl_triggered = True
+        if self.client.journal is not None:
+            self.client.journal.record_order(self.contract, self.strategy_name, "entry", order_side, "MARKET",
+                                             trade_size, order_status)
 
-            if self.take_profit is not None:
-                if price >= trade.entry_price * (1 + self.take_profit / 100):
-                    tp_triggered = True
+        avg_fill_price = None
 
-        elif trade.side == "short":
-            if self.stop_loss is not None:
-                if price >= trade.entry_price * (1 + self.stop_loss / 100):
-                    sl_triggered = True
+        if order_status.status == "filled":
+            avg_fill_price = order_status.avg_price
+        else:
+            t = Timer(2.0, lambda: self._check_order_status(order_status.order_id))
+            t.start()
+        new_trade = Trade({
+            "time": self.client.clock.time_ms(),
+            "entry_price": avg_fill_price,
+            "contract": self.contract,
+            "strategy": self.strategy_name,
+            "side": position_side,
+            "status": "open",
+            "pnl": 0,
+            "quantity": trade_size,
+            "entry_id": order_status.order_id
+        })
+        self._add_trade(new_trade)
+        self.client.dirty_trades.add(new_trade)  # Displayed by the TradeWatch component at the next UI update
+
+        if self.client.journal is not None:
+            self.client.journal.record_trade(new_trade, "open")
+
+    def _exit_trade(self, trade: Trade, kind: str):
+
+        """
+        Close a trade whose take profit or stop loss was reached.
+        :param trade:
+        :param kind: take_profit, stop_loss
+        :return:
+        """
+
+        if trade in self._exits_pending:
+            return
 
-            if self.take_profit is not None:
-                if price <= trade.entry_price * (1 - self.take_profit / 100):
-                    tp_triggered = True
+        self._add_log(f"{'Stop loss' if kind == 'stop_loss' else 'Take profit'} for {self.contract.symbol} "
+                      f"{self.timeframe}")
+
+        order_side = "SELL" if trade.side == "long" else "BUY"
+
+        self._exits_pending.add(trade)
+        self.client.order_batcher.submit(self.contract, "MARKET", trade.quantity, order_side,
+                                         lambda order_status: self._on_exit_order(order_status, trade, order_side))
+
+    def _on_exit_order(self, order_status: typing.Optional[OrderStatus], trade: Trade, order_side: str):
+        self._exits_pending.discard(trade)
 
-        if tp_triggered or sl_triggered:
-            self._add_log(
-                f"{'Stop loss' if sl_triggered else 'Take profit'} for {self.contract.symbol} {self.timeframe}")
+        if order_status is None:  # Checked again from the next trade
+            self._add_triggers(trade)
 
-            order_side = "SELL" if trade.side == "long" else "BUY"
-            order_status = self.client.place_order(self.contract, "MARKET", trade.quantity, order_side)
+        else:
+            self._record_tick_to_order()
+            self._add_log(f"Exit order on {self.contract.symbol} {self.timeframe} placed successfully")
+            trade.status = "closed"
+            self._archive_trade(trade)
+            self.client.dirty_trades.add(trade)
+            self.ongoing_position = False
 
-            if order_status is not None:
-                self._add_log(f"Exit order on {self.contract.symbol} {self.timeframe} placed successfully")
-                trade.status = "closed"
-                self.ongoing_position = False
+            if self.client.journal is not None:
+                self.client.journal.record_order(self.contract, self.strategy_name, "exit", order_side, "MARKET",
+                                                 trade.quantity, order_status)
+                self.client.journal.record_trade(trade, "closed")
 
 
 class TechnicalStrategy(Strategy):
@@ -226,55 +421,65 @@ class TechnicalStrategy(Strategy):
         self._ema_signal = other_params["ema_signal"]
         self._rsi_length = other_params["rsi_length"]
 
-        print("Strategy activated for", contract.symbol)
+        # Older candles weigh less than the double precision in the EMA and RSI, dropping them changes no value
+        self.candles_kept = max(self.candles_kept, 20 * (self._ema_slow + self._ema_signal), 40 * self._rsi_length)
 
-    def _rsi(self):
-        close_list = []
-        for candle in self.candles:
-            close_list.append(candle.close)
+        # Shared with the other strategies of the client on the same symbol and timeframe
 
-        closes = pd.Series(close_list)
+        indicators = self.client.indicators
+        self._macd_key = indicators.acquire(client.platform, contract.symbol, timeframe, "macd",
+                                            (self._ema_fast, self._ema_slow, self._ema_signal))
+        self._rsi_key = indicators.acquire(client.platform, contract.symbol, timeframe, "rsi", (self._rsi_length,))
 
-        delta = closes.diff().dropna()
+        print("Strategy activated for", contract.symbol)
 
-        up, down = delta.copy(), delta.copy()
-        up[up < 0] = 0
-        down[down > 0] = 0
+    def stop(self):
+        self.client.indicators.release(self._macd_key)
+        self.client.indicators.release(self._rsi_key)
 
-        avg_gain = up.ewm(com=(self._rsi_length - 1), min_periods=self._rsi_length).mean()
-        avg_loss = down.abs().ewm(com=(self._rsi_length - 1), min_periods=self._rsi_length).mean()
+    def _closed_closes(self) -> typing.Tuple[float, ...]:
 
-        rs = avg_gain / avg_loss
+        """
+        The indicators are computed without the candle that just opened, their last value is the one of the candle
+        that just closed.
+        :return:
+        """
 
-        rsi = 100 - 100 / (1 + rs)
+        closes = [candle.close for candle in self.candles]
+        closes.pop()
 
-        rsi = rsi.round(2)
+        return tuple(closes)
 
-        return rsi.iloc[-2]
+    def _rsi(self, closes: typing.Tuple[float, ...]) -> float:
+        return self.client.indicators.get(self._rsi_key, closes).iloc[-1]
 
-    def _mcad(self) -> typing.Tuple[float, float]:
+    def _mcad(self, closes: typing.Tuple[float, ...]) -> typing.Tuple[float, float]:
+        macd_line, macd_signal = self.client.indicators.get(self._macd_key, closes)
 
-        close_list = []
-        for candle in self.candles:
-            close_list.append(candle.close)
+        return macd_line.iloc[-1], macd_signal.iloc[-1]
 
-        closes = pd.Series(close_list)
+    def _check_signal(self):
+        if len(self.candles) < 3:  # The RSI needs two closed candles, not the case at the start of a replay
+            return 0
 
-        ema_fast = closes.ewm(span=self._ema_fast).mean()
-        ema_slow = closes.ewm(span=self._ema_slow).mean()
+        closes = self._closed_closes()
 
-        macd_line = ema_fast - ema_slow
-        macd_signal = macd_line.ewm(span=self._ema_signal).mean()
+        macd_line, macd_signal = self._mcad(closes)
+        rsi = self._rsi(closes)
 
-        return macd_line.iloc[-2], macd_signal.iloc[-2]
+        return self._signal(macd_line, macd_signal, rsi)
 
-    def _check_signal(self):
-        macd_line, macd_signal = self._mcad()
-        rsi = self._rsi()
+    def _signal(self, macd_line: float, macd_signal: float, rsi: float) -> int:
 
-        print("RSI", rsi)
-        print("MACD line", macd_line)
-        print("MACD signal", macd_signal)
+        """
+        Decision on the indicators of the candle that just closed, also used by the BatchEvaluator.
+        :param macd_line:
+        :param macd_signal:
+        :param rsi:
+        :return: 1 long, -1 short, 0 nothing
+        """
+
+        logger.debug("%s RSI %s, MACD line %s, MACD signal %s", self.label, rsi, macd_line, macd_signal)
 
         if rsi < 30 and macd_line > macd_signal:
             return 1
@@ -285,10 +490,8 @@ class TechnicalStrategy(Strategy):
             return 0
 
     def check_trade(self, tick_type: str):
-        if tick_type == "new_candle" and not self.ongoing_position:
-            signal_result = self._check_signal()
-            if signal_result in [-1, 1]:
-                self._open_position(signal_result)
+        if tick_type == "new_candle" and not self.ongoing_position and not self.backfill_pending:
+            self.client.batch_evaluator.submit(self)  # Evaluated with the strategies of the same timeframe
 
 
 class BreakoutStrategy(Strategy):
@@ -308,10 +511,13 @@ class BreakoutStrategy(Strategy):
 
     def _check_signal(self) -> int:
 
-        if self.candles[-1].close > self.candles[-2].high and self.candles[-1] > self._min_volume:
+        if len(self.candles) < 2:  # Not the case at the start of a replay
+            return 0
+
+        if self.candles[-1].close > self.candles[-2].high and self.candles[-1].volume > self._min_volume:
             return 1
 
-        elif self.candles[-1].close < self.candles[-2].low and self.candles[-1] > self._min_volume:
+        elif self.candles[-1].close < self.candles[-2].low and self.candles[-1].volume > self._min_volume:
             return -1
 
         else:
@@ -325,7 +531,7 @@ class BreakoutStrategy(Strategy):
         #         # Downside breakout
 
     def check_trade(self, tick_type: str):
-        if not self.ongoing_position:
-            signal_result = self._check_signal()
+        if not self.ongoing_position and not self.backfill_pending:
+            signal_result = self._timed_check_signal()
             if signal_result in [-1, 1]:
                 self._open_position(signal_result)
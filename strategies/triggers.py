@@ -0,0 +1,113 @@
+import heapq
+import itertools
+import threading
+import typing
+
+from models.models import Trade
+
+
+class TriggerIndex:
+    def __init__(self):
+
+        """
+        Take profit and stop loss prices of the open trades of a strategy, computed once when the entry price is
+        known, in two heaps: the prices to fire when the market reaches or exceeds them (long take profit, short
+        stop loss) in a min-heap, the prices to fire when the market reaches or falls below them (long stop loss,
+        short take profit) in a max-heap. A tick only compares the price to the top of each heap, and pops the
+        triggers it crossed.
+        Removed trades are dropped from the heaps when they reach the top, or when they make most of the heaps.
+        Written by the order callbacks, read by the websocket thread.
+        """
+
+        self._above: typing.List[typing.Tuple[float, int, str, Trade]] = []  # (price, sequence, kind, trade)
+        self._below: typing.List[typing.Tuple[float, int, str, Trade]] = []  # (-price, sequence, kind, trade)
+        self._sequences: typing.Dict[Trade, int] = dict()  # Trades indexed, their entries of other sequences are stale
+
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sequences)
+
+    def add(self, trade: Trade, take_profit: typing.Optional[float], stop_loss: typing.Optional[float]):
+
+        """
+        Replaces the triggers of the trade if it was already indexed.
+        :param trade: Long or short, with its entry price
+        :param take_profit: Price, None if not used
+        :param stop_loss: Price, None if not used
+        :return:
+        """
+
+        with self._lock:
+            sequence = next(self._counter)
+            self._sequences[trade] = sequence
+
+            for kind, price in (("take_profit", take_profit), ("stop_loss", stop_loss)):
+                if price is None:
+                    continue
+
+                above = (trade.side == "long") == (kind == "take_profit")
+                if above:
+                    heapq.heappush(self._above, (price, sequence, kind, trade))
+                else:
+                    heapq.heappush(self._below, (-price, sequence, kind, trade))
+
+    def remove(self, trade: Trade):
+        with self._lock:
+            self._sequences.pop(trade, None)
+            self._compact()
+
+    def _compact(self):
+
+        """
+        Rebuild the heaps without the stale entries once they are the majority. New lists are assigned, the tops
+        being read without the lock.
+        :return:
+        """
+
+        if len(self._above) + len(self._below) <= 2 * (2 * len(self._sequences) + 16):
+            return
+
+        self._above = [e for e in self._above if self._sequences.get(e[3]) == e[1]]
+        self._below = [e for e in self._below if self._sequences.get(e[3]) == e[1]]
+        heapq.heapify(self._above)
+        heapq.heapify(self._below)
+
+    def crossed(self, price: float) -> typing.List[typing.Tuple[Trade, str]]:
+
+        """
+        Remove the trades with a trigger reached by the price, add() them again to check them at the next ticks.
+        :param price:
+        :return: (trade, "take_profit" or "stop_loss") in the order the trades were added, a trade whose both
+        triggers were reached being reported as a stop loss
+        """
+
+        if not self._reached(price):
+            return []
+
+        fired: typing.Dict[Trade, typing.Tuple[int, str]] = dict()
+
+        with self._lock:
+            for heap, sign in ((self._above, 1), (self._below, -1)):
+                while len(heap) > 0 and heap[0][0] <= price * sign:  # Prices of the max-heap are negated
+                    _, sequence, kind, trade = heapq.heappop(heap)
+
+                    if self._sequences.get(trade) != sequence:  # Removed or added again since
+                        continue
+
+                    if trade not in fired or kind == "stop_loss":
+                        fired[trade] = (sequence, kind)
+
+            for trade in fired:
+                del self._sequences[trade]
+
+            self._compact()
+
+        return [(trade, kind) for trade, (sequence, kind) in sorted(fired.items(), key=lambda item: item[1][0])]
+
+    def _reached(self, price: float) -> bool:
+        above = self._above
+        below = self._below
+
+        return (len(above) > 0 and price >= above[0][0]) or (len(below) > 0 and price <= -below[0][0])
@@ -0,0 +1,116 @@
+import decimal
+import random
+import unittest
+
+from models.models import Quantizer, step_quantizer
+
+# Quantizer.floor() and round() against the Decimal rounding of repr(value), over random values of up to 15
+# significant digits and MAX_STEPS_NB steps, the limits documented by Quantizer.
+# python -m unittest discover -s tests -t .
+
+SEED = 42
+SAMPLES_NB = 20000
+MAX_STEPS_NB = 10 ** 12
+
+STEPS = [0.1, 0.5, 0.01, 0.05, 0.001, 0.0001, 0.00001, 0.000001, 0.00000001, 0.25, 1.0, 2.5, 10.0]
+INT_STEPS = [1, 10, 100]
+
+
+def _reference(value: float, step: float, rounding: str) -> decimal.Decimal:
+    exact_step = decimal.Decimal(repr(step))
+    steps_nb = (decimal.Decimal(repr(value)) / exact_step).to_integral_value(rounding=rounding)
+    return steps_nb * exact_step
+
+
+def _values(rng: random.Random, step: float) -> list:
+
+    """
+    Random values, exact multiples of the step and values halfway between two multiples, written with at most 15
+    significant digits as the exchanges and the balances give them.
+    """
+
+    exact_step = decimal.Decimal(repr(step))
+    values = []
+
+    for _ in range(SAMPLES_NB):
+        steps_nb = rng.randrange(0, MAX_STEPS_NB) if rng.random() < 0.5 else rng.randrange(0, 10 ** rng.randint(1, 12))
+        kind = rng.random()
+
+        if kind < 0.3:
+            value = steps_nb * exact_step
+        elif kind < 0.5:
+            value = (steps_nb + decimal.Decimal("0.5")) * exact_step
+        else:
+            value = (steps_nb + decimal.Decimal(rng.random())) * exact_step
+
+        values.append(float(format(value, ".15g")))
+
+    return values
+
+
+class QuantizerTest(unittest.TestCase):
+    def test_floor(self):
+        rng = random.Random(SEED)
+
+        for step in STEPS:
+            quantizer = Quantizer(step)
+            for value in _values(rng, step):
+                expected = float(_reference(value, step, decimal.ROUND_FLOOR))
+                self.assertEqual(quantizer.floor(value), expected, f"floor({value!r}) with step {step!r}")
+
+    def test_round(self):
+        rng = random.Random(SEED)
+
+        for step in STEPS:
+            quantizer = Quantizer(step)
+            for value in _values(rng, step):
+                expected = float(_reference(value, step, decimal.ROUND_HALF_EVEN))
+                self.assertEqual(quantizer.round(value), expected, f"round({value!r}) with step {step!r}")
+
+    def test_int_steps(self):
+        rng = random.Random(SEED)
+
+        for step in INT_STEPS:
+            quantizer = Quantizer(step)
+            for _ in range(SAMPLES_NB):
+                value = rng.uniform(0, 10 ** 9)
+                self.assertEqual(quantizer.floor(value), int(_reference(value, step, decimal.ROUND_FLOOR)))
+                self.assertEqual(quantizer.round(value), int(_reference(value, step, decimal.ROUND_HALF_EVEN)))
+                self.assertIsInstance(quantizer.round(value), int)
+
+    def test_format(self):
+        rng = random.Random(SEED)
+
+        for step in STEPS:
+            quantizer = Quantizer(step)
+            for value in _values(rng, step)[:1000]:
+                exact = _reference(value, step, decimal.ROUND_HALF_EVEN)
+                expected = format(exact.quantize(decimal.Decimal(repr(step)).normalize()), "f")
+                self.assertEqual(quantizer.format(quantizer.round(value)), expected)
+
+    def test_known_float_errors(self):
+        self.assertEqual(Quantizer(0.1).floor(0.3), 0.3)  # int(0.3 / 0.1) is 2
+        self.assertEqual(Quantizer(0.01).round(1.005), 1.0)  # 1.005 is a halfway value, to the even multiple
+        self.assertEqual(Quantizer(0.00001).format(0.00003), "0.00003")
+
+    def test_more_digits(self):
+
+        """
+        The relative tolerance exceeds the distance to a multiple of the values of 16 or 17 significant digits closer
+        to it than the tolerance, they are taken as that multiple where the Decimal rounding isn't.
+        """
+
+        quantizer = Quantizer(0.00000001)
+
+        for value, expected in [(40000.00000000999, 40000.00000001), (4000.000000009999, 4000.00000001)]:
+            self.assertEqual(quantizer.floor(value), expected)
+            self.assertNotEqual(quantizer.floor(value), float(_reference(value, 0.00000001, decimal.ROUND_FLOOR)))
+
+    def test_shared_by_step(self):
+        self.assertIs(step_quantizer(0.01), step_quantizer(0.01))
+        self.assertIsInstance(step_quantizer(1).round(2.4), int)
+        self.assertIsInstance(step_quantizer(1.0).round(2.4), float)
+
+
+if __name__ == "__main__":
+    unittest.main()
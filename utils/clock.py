@@ -0,0 +1,17 @@
+import time
+
+
+# Source of the current time for the strategies. The connectors use the system time, the replay engine replaces it
+# with a SimulatedClock that follows the timestamps of the recorded messages.
+
+class Clock:
+    def time_ms(self) -> int:
+        return int(time.time() * 1000)
+
+
+class SimulatedClock(Clock):
+    def __init__(self, start_ms: int = 0):
+        self.now_ms = start_ms
+
+    def time_ms(self) -> int:
+        return self.now_ms
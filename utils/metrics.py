@@ -0,0 +1,286 @@
+import collections
+import http.server
+import logging
+import threading
+import typing
+
+logger = logging.getLogger()
+
+SUB_BUCKET_BITS = 4  # 16 buckets per power of two: every value is counted within 1/16 (6.25%) of its real value
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_VALUE_BITS = 42  # Values are capped at 2^42 ns, about 73 minutes
+
+# Bucket boundaries of the Prometheus histograms, in seconds. The fine buckets are added up into these when rendering.
+
+EXPORTED_BOUNDS = [0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+METRIC_HELP = {
+    "stage_latency_seconds": "Duration of each stage between an exchange trade and the order sent for it",
+    "messages_total": "Websocket messages received",
+    "ws_reconnects_total": "Websocket reconnections after the connection dropped",
+    "queue_depth": "Number of items waiting in a queue",
+    "ws_connected": "1 if the websocket connection is open",
+    "ws_api_connected": "1 if the connection to the websocket trading API is open",
+    "ws_api_fallbacks_total": "Orders sent through REST because the websocket trading API was unavailable",
+    "cpu_seconds_total": "CPU time of the connector callbacks and strategy methods, in the thread that ran them",
+    "calls_total": "Calls of the connector callbacks and strategy methods",
+}
+
+PREFIX = "trading_bot_"
+
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * SUB_BUCKETS:
+        return value if value > 0 else 0
+
+    shift = min(value.bit_length(), MAX_VALUE_BITS) - SUB_BUCKET_BITS - 1
+    return shift * SUB_BUCKETS + min(value >> shift, 2 * SUB_BUCKETS - 1)
+
+
+def _bucket_upper_bound(index: int) -> int:
+    if index < 2 * SUB_BUCKETS:
+        return index + 1
+
+    shift = index // SUB_BUCKETS - 1
+    return (index - shift * SUB_BUCKETS + 1) << shift
+
+
+class LatencyHistogram:
+    def __init__(self):
+
+        """
+        Log-linear histogram of durations in nanoseconds, in the manner of HdrHistogram: recording a value is an
+        integer computation and a list increment, whatever the number of values already recorded.
+        Recorded without lock: two threads recording in the same histogram at the same time can lose one count,
+        which doesn't matter for a distribution.
+        """
+
+        self.counts = [0] * ((MAX_VALUE_BITS - SUB_BUCKET_BITS + 1) * SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+
+    def record(self, value: int):
+
+        """
+        :param value: In nanoseconds, negative values (clock differences) are counted as 0
+        :return:
+        """
+
+        if value < 0:
+            value = 0
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percent: float) -> int:
+
+        """
+        :param percent: 0 to 100
+        :return: Upper bound in nanoseconds of the bucket containing the percentile, 0 if nothing was recorded
+        """
+
+        target = self.count * percent / 100
+        cumulated = 0
+        for index, count in enumerate(self.counts):
+            cumulated += count
+            if count > 0 and cumulated >= target:
+                return _bucket_upper_bound(index)
+        return 0
+
+    def cumulative_counts(self, bounds_ns: typing.List[int]) -> typing.List[int]:
+
+        """
+        :param bounds_ns: Increasing upper bounds
+        :return: For each bound, the number of values of the buckets that end at or below it
+        """
+
+        result = []
+        cumulated = 0
+        index = 0
+
+        for bound in bounds_ns:
+            while index < len(self.counts) and _bucket_upper_bound(index) <= bound:
+                cumulated += self.counts[index]
+                index += 1
+            result.append(cumulated)
+
+        return result
+
+
+def _labels_text(labels: typing.Sequence[typing.Tuple[str, str]]) -> str:
+    parts = []
+    for name, value in labels:
+        if value != "":
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            parts.append(f'{name}="{value}"')
+    return ",".join(parts)
+
+
+class Metrics:
+    def __init__(self):
+
+        """
+        Latency histograms, counters and gauges of the connectors and strategies, rendered in the Prometheus text
+        format by MetricsServer. Recording is meant to be called from the websocket threads: a dictionary lookup
+        and a few integer operations.
+        """
+
+        self._stages: typing.Dict[typing.Tuple[str, str, str, str], LatencyHistogram] = dict()
+        self._counters: typing.Dict[typing.Tuple[str, str, str], int] = dict()
+        self._gauges: typing.Dict[typing.Tuple[str, str, str], typing.Callable[[], float]] = dict()
+        self._collectors: typing.List[typing.Callable[[], typing.List[typing.Tuple]]] = []
+
+    def record_stage(self, exchange: str, stage: str, value_ns: int, strategy: str = "", symbol: str = ""):
+
+        """
+        :param exchange: Platform of the connector, binance_futures, binance_spot, bitmex
+        :param stage: receive, decode, candle_update, signal, sizing, order_queue, order_send, order_ack, tick_to_order
+        :param value_ns: Duration in nanoseconds
+        :param strategy: Name of the strategy, for the stages that run in a strategy
+        :param symbol:
+        :return:
+        """
+
+        key = (exchange, stage, strategy, symbol)
+        histogram = self._stages.get(key)
+        if histogram is None:
+            histogram = self._stages.setdefault(key, LatencyHistogram())
+        histogram.record(value_ns)
+
+    def stage(self, exchange: str, stage: str, strategy: str = "",
+              symbol: str = "") -> typing.Optional[LatencyHistogram]:
+        return self._stages.get((exchange, stage, strategy, symbol))
+
+    def increment(self, name: str, exchange: str, channel: str = "", value: int = 1):
+        key = (name, exchange, channel)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_gauge(self, name: str, exchange: str, read: typing.Callable[[], float], queue: str = ""):
+
+        """
+        :param name:
+        :param exchange: Empty for the gauges that don't belong to a connector
+        :param read: Called at each scrape to get the current value
+        :param queue: Name of the queue for the queue_depth gauges
+        :return:
+        """
+
+        self._gauges[(name, exchange, queue)] = read
+
+    def add_collector(self, collect: typing.Callable[[], typing.List[typing.Tuple]]):
+
+        """
+        :param collect: Called at each scrape, returns the samples of metrics kept elsewhere as
+        (name, counter or gauge, [(label, value), ...], value)
+        :return:
+        """
+
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+
+        # Copies, another thread can add a key while the lines are built
+
+        stages = list(self._stages.items())
+        counters = list(self._counters.items())
+        gauges = list(self._gauges.items())
+
+        if len(stages) > 0:
+            name = PREFIX + "stage_latency_seconds"
+            lines.append(f"# HELP {name} {METRIC_HELP['stage_latency_seconds']}")
+            lines.append(f"# TYPE {name} histogram")
+
+            bounds_ns = [int(b * 1_000_000_000) for b in EXPORTED_BOUNDS]
+
+            for (exchange, stage, strategy, symbol), histogram in sorted(stages, key=lambda item: item[0]):
+                labels = _labels_text([("exchange", exchange), ("stage", stage), ("strategy", strategy),
+                                       ("symbol", symbol)])
+                count = histogram.count
+
+                for bound, cumulated in zip(EXPORTED_BOUNDS, histogram.cumulative_counts(bounds_ns)):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulated}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.total / 1_000_000_000}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+
+        for metric_type, items in [("counter", counters), ("gauge", gauges)]:
+            previous_name = None
+
+            for (name, exchange, extra), value in sorted(items, key=lambda item: item[0]):
+                if metric_type == "gauge":
+                    try:
+                        value = value()
+                    except Exception as e:
+                        logger.error("Error while reading the %s gauge: %s", name, e)
+                        continue
+
+                if name != previous_name:
+                    lines.append(f"# HELP {PREFIX + name} {METRIC_HELP.get(name, name)}")
+                    lines.append(f"# TYPE {PREFIX + name} {metric_type}")
+                    previous_name = name
+
+                extra_label = "channel" if metric_type == "counter" else "queue"
+                labels = _labels_text([("exchange", exchange), (extra_label, extra)])
+                lines.append(f"{PREFIX + name}{{{labels}}} {value}")
+
+        samples = collections.defaultdict(list)
+        for collect in list(self._collectors):
+            try:
+                for name, metric_type, labels, value in collect():
+                    samples[(name, metric_type)].append((labels, value))
+            except Exception as e:
+                logger.error("Error while collecting metrics: %s", e)
+
+        for (name, metric_type), values in sorted(samples.items()):
+            lines.append(f"# HELP {PREFIX + name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX + name} {metric_type}")
+            for labels, value in values:
+                lines.append(f"{PREFIX + name}{{{_labels_text(labels)}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, metrics: Metrics, port: int = 9108, host: str = "127.0.0.1"):
+
+        """
+        HTTP endpoint serving the metrics in the Prometheus text format at /metrics, from a daemon thread.
+        Listens on the local interface only by default.
+        :param metrics:
+        :param port:
+        :param host:
+        """
+
+        metrics_ref = metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics_ref.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # Scrapes every few seconds would flood the log otherwise
+                return
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info("Metrics available on http://%s:%s/metrics", *self._server.server_address[:2])
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
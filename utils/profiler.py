@@ -0,0 +1,152 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import typing
+
+logger = logging.getLogger()
+
+
+class CpuAccounting:
+    def __init__(self, exchange: str):
+
+        """
+        Cumulative CPU time and number of calls of the connector callbacks and of the strategy methods they call.
+        The durations are measured with time.thread_time_ns(), the CPU time of the calling thread: the time spent
+        waiting for the network or for the GIL held by another thread isn't counted.
+        :param exchange: Platform of the connector
+        """
+
+        self.exchange = exchange
+        self._entries: typing.Dict[typing.Tuple[str, str], typing.List[int]] = dict()  # [CPU time in ns, calls]
+
+    def add(self, component: str, function: str, cpu_ns: int):
+
+        """
+        :param component: "connector" or the label of a strategy, e.g. "Technical BTCUSDT 1m"
+        :param function: e.g. "on_message aggTrade", "parse_trades", "check_trade"
+        :param cpu_ns:
+        :return:
+        """
+
+        entry = self._entries.get((component, function))
+        if entry is None:
+            entry = self._entries.setdefault((component, function), [0, 0])
+        entry[0] += cpu_ns
+        entry[1] += 1
+
+    def usage(self) -> typing.List[typing.Tuple[str, str, float, int]]:
+
+        """
+        :return: (component, function, CPU seconds, calls), the most expensive first
+        """
+
+        usage = [(component, function, cpu_ns / 1_000_000_000, calls)
+                 for (component, function), (cpu_ns, calls) in list(self._entries.items())]
+        usage.sort(key=lambda u: u[2], reverse=True)
+
+        return usage
+
+    def collect(self) -> typing.List[typing.Tuple[str, str, typing.List[typing.Tuple[str, str]], float]]:
+
+        """
+        Samples for Metrics.add_collector().
+        :return:
+        """
+
+        samples = []
+        for component, function, cpu_seconds, calls in self.usage():
+            labels = [("exchange", self.exchange), ("component", component), ("function", function)]
+            samples.append(("cpu_seconds_total", "counter", labels, cpu_seconds))
+            samples.append(("calls_total", "counter", labels, calls))
+
+        return samples
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005):
+
+        """
+        Statistical profiler: a thread reads the call stack of every other thread at each interval and counts the
+        stacks. The profiled code runs unmodified, the cost is the sampling thread taking the GIL briefly
+        (about 1% at the default interval), so it can be started and stopped while the bot is trading.
+        The stacks are saved in the collapsed format read by flamegraph.pl, speedscope and most flame graph tools.
+        :param interval: Seconds between two samples
+        """
+
+        self._interval = interval
+        self._stacks: typing.Counter[str] = collections.Counter()
+        self._running = False
+        self._thread: typing.Optional[threading.Thread] = None
+        self.samples_nb = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+
+        self._stacks.clear()
+        self.samples_nb = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        labels: typing.Dict = dict()  # Cache of the frame labels by code object
+
+        while self._running:
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels.setdefault(code, _frame_label(code))
+                    stack.append(label)
+                    frame = frame.f_back
+
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                stack.reverse()
+                self._stacks[";".join(stack)] += 1
+
+            self.samples_nb += 1
+            time.sleep(self._interval)
+
+    def save(self, path: str) -> str:
+
+        """
+        Write the collapsed stacks: one "thread;outer function;...;inner function count" line per distinct stack.
+        :param path: Directories are created if needed
+        :return: The path
+        """
+
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        with open(path, "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        return path
@@ -0,0 +1,80 @@
+import bisect
+import typing
+
+from models.models import Contract
+
+
+class SymbolIndex:
+    def __init__(self, contracts: typing.Dict[str, Contract], max_results: int = 50):
+
+        """
+        Search structure built once from the contracts of an exchange, for the Autocomplete widget.
+        Symbols are kept in a sorted list so that the symbols starting with a prefix are found with bisect, and the
+        substring matches of the previous query are reused when the user keeps typing.
+        :param contracts:
+        :param max_results: Maximum number of symbols returned by search()
+        """
+
+        self._symbols = sorted(contracts.keys())
+        self._assets = {symbol: (contract.base_asset.upper(), contract.quote_asset.upper())
+                        for symbol, contract in contracts.items()}
+        self._search_keys = {symbol: " ".join([symbol, *self._assets[symbol]]) for symbol in self._symbols}
+
+        self.max_results = max_results
+
+        self._last_query = ""
+        self._last_candidates = self._symbols  # Every symbol matches the empty query
+
+    def _prefix_range(self, prefix: str) -> typing.Tuple[int, int]:
+        start = bisect.bisect_left(self._symbols, prefix)
+        end = bisect.bisect_left(self._symbols, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+        return start, end
+
+    def search(self, query: str) -> typing.List[str]:
+
+        """
+        Symbols starting with the query come first (alphabetical order), then the symbols whose base or quote asset
+        starts with the query (e.g. "ETH" finds "BNBETH"), then any other symbol containing the query.
+        :param query: Text typed by the user, case insensitive
+        :return: At most self.max_results symbols
+        """
+
+        query = query.upper()
+
+        if query == "":
+            return []
+
+        start, end = self._prefix_range(query)
+        results = self._symbols[start:min(end, start + self.max_results)]
+
+        # A symbol containing the new query also contained the previous one, if the previous one is part of it
+
+        if self._last_query in query:
+            pool = self._last_candidates
+        else:
+            pool = self._symbols
+
+        candidates = [symbol for symbol in pool if query in self._search_keys[symbol]]
+
+        self._last_query = query
+        self._last_candidates = candidates
+
+        if len(results) >= self.max_results:
+            return results
+
+        asset_matches = []
+        other_matches = []
+
+        for symbol in candidates:
+            if symbol.startswith(query):
+                continue
+
+            base_asset, quote_asset = self._assets[symbol]
+
+            if base_asset.startswith(query) or quote_asset.startswith(query):
+                asset_matches.append(symbol)
+            elif len(asset_matches) + len(results) < self.max_results:
+                other_matches.append(symbol)
+
+        return (results + asset_matches + other_matches)[:self.max_results]
@@ -1,3 +1,6 @@
+import typing
+
+
 def check_integer_format(text: str):
     if text == "":
         return True
@@ -23,3 +26,19 @@ def check_float_format(text: str):
     else:
         return False
 
+
+def pop_all(items: typing.Set) -> typing.List:
+
+    """
+    Empty a set that other threads keep adding to. set.pop() is atomic, so nothing added concurrently is lost:
+    it is either returned now or left in the set for the next call.
+    :param items:
+    :return:
+    """
+
+    popped = []
+    while True:
+        try:
+            popped.append(items.pop())
+        except KeyError:
+            return popped